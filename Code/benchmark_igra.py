@@ -0,0 +1,462 @@
+"""Benchmarks of the IGRA readers and writers
+
+Synthetic IGRA v2 derived (drvd) and sounding data (data-por) files in the exact
+fixed-width formats are generated deterministically, so the benchmarks run offline.
+
+bench_parse compares the vectorized parser of process_igra.ascii_to_dataframe
+(engine='numpy') against the original line-by-line parser (engine='python') and
+checks that both return the same frames. bench_suite measures parse time, peak
+memory and extraction/write throughput at several file sizes.
+
+Usage:
+    python benchmark_igra.py                      # parser comparison, synthetic 20 year station file
+    python benchmark_igra.py --years 70           # bigger synthetic file
+    python benchmark_igra.py USM00072764-drvd.txt.zip
+    python benchmark_igra.py --suite --sizes 1 5 20 --json results.json
+"""
+
+__all__ = ['write_synthetic_derived', 'write_synthetic_por', 'bench_parse', 'bench_memory',
+           'bench_derived_write', 'bench_profiles_write', 'bench_suite']
+
+# levels of the synthetic soundings reach from the surface up to this pressure (Pa)
+_TOP_PRESS = 1000.
+
+# IGRA missing values: -9999 missing, -8888 removed by quality control, -99999 missing derived header value
+_MISSING, _REMOVED, _MISSING_HEADER = -9999, -8888, -99999
+
+
+def write_synthetic_derived(filename, years=20, soundings_per_day=2, levels=100,
+                            ident='USM00072764', start_year=1950, seed=0):
+    """ Write a synthetic IGRA derived file in the fixed-width format
+    Args:
+        filename (str): output file (.txt, .txt.gz or .txt.zip)
+        years (int): number of years
+        soundings_per_day (int): soundings per day (00Z, 12Z, ...)
+        levels (int): levels per sounding
+        ident (str): IGRA ID
+        start_year (int): first year
+        seed (int): random seed
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    times = _synthetic_times(years, soundings_per_day, start_year)
+    p = _synthetic_profiles(rng, times, levels)
+    n = len(times)
+
+    # derived parameters of the header, scaled integers as in the files
+    header = np.column_stack([
+        np.round(p['pw'] * 100),                             # PW mm*100
+        rng.integers(70000, 100000, n),                      # INVPRESS Pa
+        rng.integers(0, 3000, n),                            # INVHGT m
+        rng.integers(0, 150, n),                             # INVTEMPDIF K*10
+        rng.integers(70000, 100000, n),                      # MIXPRESS Pa
+        rng.integers(100, 3000, n),                          # MIXHGT m
+        rng.integers(50000, 100000, n),                      # FRZPRESS Pa
+        rng.integers(0, 5000, n),                            # FRZHGT m
+        rng.integers(70000, 100000, n),                      # LCLPRESS Pa
+        rng.integers(100, 3000, n),                          # LCLHGT m
+        rng.integers(40000, 90000, n),                       # LFCPRESS Pa
+        rng.integers(500, 6000, n),                          # LFCHGT m
+        rng.integers(15000, 50000, n),                       # LNBPRESS Pa
+        rng.integers(5000, 15000, n),                        # LNBHGT m
+        rng.integers(-10, 15, n),                            # LI C
+        rng.integers(-10, 15, n),                            # SI C
+        rng.integers(-20, 45, n),                            # KI C
+        rng.integers(20, 60, n),                             # TTI C
+        rng.integers(0, 4000, n),                            # CAPE J/kg
+        rng.integers(-500, 0, n)]).astype(np.int64)          # CIN J/kg
+    header[:, 1:][rng.random((n, header.shape[1] - 1)) < 0.2] = _MISSING_HEADER
+
+    lev = np.stack([
+        p['press'], p['gph'], p['gph'], p['temp'] * 10, _gradient(p['temp'], p['gph']) * 10,
+        p['ptemp'] * 10, _gradient(p['ptemp'], p['gph']) * 10, p['vtemp'] * 10, p['vptemp'] * 10,
+        p['vappress'] * 1000, p['satvp'] * 1000, p['rh'] * 10, p['rh'] * 10, _gradient(p['rh'], p['gph']) * 10,
+        p['u'] * 10, _gradient(p['u'], p['gph']) * 10, p['v'] * 10, _gradient(p['v'], p['gph']) * 10,
+        p['n']], axis=-1)
+    lev = np.round(lev).astype(np.int64)
+    # reported height and humidity are often missing, some values removed by quality control
+    lev[..., 1][rng.random((n, levels)) < 0.5] = _MISSING
+    lev[..., 11][p['temp'] < 233.15] = _MISSING
+    lev[..., 3:][rng.random((n, levels, lev.shape[-1] - 3)) < 0.02] = _REMOVED
+
+    headers = ['#%-11s %04d %02d %02d %02d %04d%5d %s' % (ident, t.year, t.month, t.day, t.hour, t.hour * 100 + 5,
+                                                        levels, ''.join('%6d' % v for v in row))
+               for t, row in zip(times, header.tolist())]
+    fmt = ' '.join(['%7d'] * 19)
+    _write_text(filename, headers, [fmt % tuple(row) for row in lev.reshape(-1, lev.shape[-1]).tolist()], levels)
+
+
+def write_synthetic_por(filename, years=20, soundings_per_day=2, levels=100,
+                        ident='USM00072764', start_year=1950, seed=0):
+    """ Write a synthetic IGRA sounding data (data-por) file in the fixed-width format
+    Args:
+        filename (str): output file (.txt, .txt.gz or .txt.zip)
+        years (int): number of years
+        soundings_per_day (int): soundings per day (00Z, 12Z, ...)
+        levels (int): levels per sounding (the first is the surface, every 5th a non-pressure wind level)
+        ident (str): IGRA ID
+        start_year (int): first year
+        seed (int): random seed
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    times = _synthetic_times(years, soundings_per_day, start_year)
+    p = _synthetic_profiles(rng, times, levels)
+    n = len(times)
+
+    # level types: surface, standard pressure levels at round values, other pressure levels, wind levels
+    lvltyp1 = np.where(p['press'] % 5000 == 0, 1, 2)
+    lvltyp1[:, 4::5] = 3
+    lvltyp2 = np.zeros((n, levels), dtype=np.int64)
+    lvltyp2[:, 0] = 1
+    etime = np.round(p['gph'] / 5.)                                         # seconds at 5 m/s ascent
+    etime = (etime // 60) * 100 + etime % 60                                # MMMSS
+    etime[:, 0] = 0
+
+    press = np.where(lvltyp1 == 3, _MISSING, p['press'])
+    temp = np.round((p['temp'] - 273.15) * 10)
+    rh = np.round(p['rh'] * 10)
+    dpdp = np.round((p['temp'] - _dewpoint(p['vappress'])) * 10)
+    wspd = np.round(np.hypot(p['u'], p['v']) * 10)
+    wdir = np.round(np.degrees(np.arctan2(-p['u'], -p['v'])) % 360)
+    for values in (temp, rh, dpdp):
+        values[lvltyp1 == 3] = _MISSING
+    rh[p['temp'] < 233.15] = _MISSING
+    removed = rng.random((n, levels)) < 0.02
+    temp[removed] = _REMOVED
+    dpdp[removed] = _REMOVED
+    flags = np.array([' ', 'A', 'B'])[rng.choice(3, (n, levels, 3), p=[0.9, 0.05, 0.05])]
+    flags[..., 0][lvltyp1 == 3] = ' '
+
+    lat, lon = 46.7825, -100.7572
+    headers = ['#%-11s %04d %02d %02d %02d %04d %4d %-8s %-8s %7d %8d'
+               % (ident, t.year, t.month, t.day, t.hour, t.hour * 100 + 5, levels, 'ncdc-gts', 'ncdc-gts',
+                  round(lat * 10000), round(lon * 10000)) for t in times]
+    columns = [lvltyp1, lvltyp2, etime, press, p['gph'], temp, rh, dpdp, wdir, wspd]
+    columns = np.stack([np.asarray(c, dtype=np.int64).ravel() for c in columns], axis=1).tolist()
+    flags = flags.reshape(-1, 3).tolist()
+    _write_text(filename, headers,
+                ['%1d%1d %5d %6d%s%5d%s%5d%s%5d %5d %5d %5d' % (a, b, c, d, f[0], e, f[1], g, f[2], h, i, j, k)
+                 for (a, b, c, d, e, g, h, i, j, k), f in zip(columns, flags)], levels)
+
+
+def _synthetic_times(years, soundings_per_day, start_year):
+    import pandas as pd
+
+    hours = 24 // soundings_per_day
+    return pd.date_range('%d-01-01' % start_year, '%d-12-31 23:00' % (start_year + years - 1), freq='%dh' % hours)
+
+
+def _synthetic_profiles(rng, times, levels):
+    """ Plausible soundings: surface to _TOP_PRESS, standard atmosphere with seasonal surface temperature,
+    tropopause near 11 km, moist boundary layer and westerly winds increasing with height
+    Returns:
+        dict : (sounding, level) arrays of press Pa, gph m, temp K, ptemp, vtemp, vptemp K, vappress, satvp hPa,
+               rh %, u, v m/s, n (refractivity), and pw mm per sounding
+    """
+    import numpy as np
+
+    n = len(times)
+    rd, g, lapse = 287.04, 9.80665, 0.0065
+    doy = np.asarray(times.dayofyear)
+    psfc = np.round(rng.normal(96500, 800, n) / 10) * 10
+    tsfc = 280 - 15 * np.cos(2 * np.pi * (doy - 15) / 365.25) + rng.normal(0, 3, n)
+
+    # pressure levels from the surface to the top, rounded to 10 Pa and at least 10 Pa apart
+    fraction = np.linspace(0, 1, levels)
+    press = np.round(psfc[:, None] * (_TOP_PRESS / psfc[:, None]) ** fraction[None, :], -1)
+    step = 10 * np.arange(levels)
+    press = np.minimum.accumulate(press + step, axis=1) - step
+
+    # height and temperature, troposphere with constant lapse rate, isothermal stratosphere
+    ztrop = rng.normal(11000, 800, n)
+    ttrop = tsfc - lapse * ztrop
+    ptrop = psfc * (ttrop / tsfc) ** (g / (rd * lapse))
+    trop = press >= ptrop[:, None]
+    gph = np.where(trop, tsfc[:, None] / lapse * (1 - (press / psfc[:, None]) ** (rd * lapse / g)),
+                   ztrop[:, None] + rd * ttrop[:, None] / g * np.log(ptrop[:, None] / press))
+    temp = np.where(trop, tsfc[:, None] - lapse * gph, ttrop[:, None]) + rng.normal(0, 0.5, (n, levels))
+    gph = np.round(gph)
+
+    rh = np.clip(85 * np.exp(-gph / 3000) + rng.normal(0, 8, (n, levels)), 1, 100)
+    satvp = 6.112 * np.exp(17.67 * (temp - 273.15) / (temp - 29.65))
+    vappress = rh / 100 * satvp
+    q = 0.622 * vappress / (press / 100 - 0.378 * vappress)
+    ptemp = temp * (100000 / press) ** 0.2857
+    vtemp = temp * (1 + 0.61 * q)
+    vptemp = vtemp * (100000 / press) ** 0.2857
+    u = 5 + gph / 500 + rng.normal(0, 3, (n, levels))
+    v = rng.normal(0, 5, (n, levels))
+    refr = 77.6 * press / 100 / temp + 3.73e5 * vappress / temp ** 2
+    pw = np.sum(0.5 * (q[:, 1:] + q[:, :-1]) * (press[:, :-1] - press[:, 1:]), axis=1) / g
+    return {'press': press, 'gph': gph, 'temp': temp, 'ptemp': ptemp, 'vtemp': vtemp, 'vptemp': vptemp,
+            'vappress': vappress, 'satvp': satvp, 'rh': rh, 'u': u, 'v': v, 'n': refr, 'pw': pw}
+
+
+def _gradient(values, gph):
+    """ Vertical gradient per km (0 at the surface) """
+    import numpy as np
+
+    grad = np.zeros_like(values)
+    dz = np.maximum(np.diff(gph, axis=1), 1)
+    grad[:, 1:] = np.diff(values, axis=1) / dz * 1000
+    return grad
+
+
+def _dewpoint(vappress):
+    """ Dew point (K) of the vapor pressure (hPa) """
+    import numpy as np
+
+    x = np.log(vappress / 6.112)
+    return 243.5 * x / (17.67 - x) + 273.15
+
+
+def _write_text(filename, headers, lines, levels):
+    """ Write header lines each followed by its levels lines, plain, gzip or zip """
+    import gzip
+    import os
+    import zipfile
+
+    text = '\n'.join(header + '\n' + '\n'.join(lines[i * levels:(i + 1) * levels])
+                     for i, header in enumerate(headers)) + '\n'
+    if filename.endswith('.zip'):
+        with zipfile.ZipFile(filename, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr(os.path.basename(filename)[:-4], text)
+    elif filename.endswith('.gz'):
+        with gzip.open(filename, 'wt') as f:
+            f.write(text)
+    else:
+        with open(filename, 'w') as f:
+            f.write(text)
+
+
+def bench_parse(filename, get_levels=True, repeat=1):
+    """ Time both parser engines on one file and check the results agree
+    Args:
+        filename (str): IGRA derived file
+        get_levels (bool): parse level records as well
+        repeat (int): number of timed runs (best is reported)
+    Returns:
+        dict : best time per engine in seconds, the time to decompress the file
+               and the speedup with and without decompression
+    """
+    import time
+    import pandas as pd
+    from process_igra import ascii_to_dataframe, _read_archive, _parse_derived, _derived_to_frames
+
+    timings = {}
+    results = {}
+    for engine in ['python', 'numpy']:
+        best = None
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            results[engine] = ascii_to_dataframe(filename, get_levels=get_levels, engine=engine)
+            dt = time.perf_counter() - t0
+            best = dt if best is None else min(best, dt)
+        timings[engine] = best
+
+    # pandas >= 3 keeps python datetimes as datetime64[us], so only compare index values
+    pd.testing.assert_frame_equal(results['numpy'][0], results['python'][0], check_index_type=False)
+    if get_levels:
+        pd.testing.assert_frame_equal(results['numpy'][1], results['python'][1], check_index_type=False)
+
+    # both engines decompress the whole member first, report the parsing speedup separately
+    read, parse = [], []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        data = _read_archive(filename)
+        t1 = time.perf_counter()
+        _derived_to_frames(*_parse_derived(data, get_levels=get_levels))
+        read.append(t1 - t0)
+        parse.append(time.perf_counter() - t1)
+    timings['read'] = min(read)
+    timings['speedup'] = timings['python'] / timings['numpy']
+    timings['parse_speedup'] = (timings['python'] - timings['read']) / min(parse)
+    return timings
+
+
+def bench_memory(func, *args, **kwargs):
+    """ Time and peak traced memory of one call
+    Args:
+        func (callable): function to measure
+        *args, **kwargs: arguments of func
+    Returns:
+        float : seconds
+        float : peak memory allocated during the call in MB (tracemalloc, numpy and pandas buffers included)
+    """
+    import time
+    import tracemalloc
+
+    tracemalloc.start()
+    try:
+        t0 = time.perf_counter()
+        result = func(*args, **kwargs)
+        dt = time.perf_counter() - t0
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    del result
+    return dt, peak / 1e6
+
+
+def bench_derived_write(filename, directory, repeat=1):
+    """ Throughput of save_derived on a local archive (no download)
+    Args:
+        filename (str): derived archive <id>-drvd.txt.zip
+        directory (str): output directory
+        repeat (int): number of timed runs (best is reported)
+    Returns:
+        dict : seconds, soundings and soundings per second
+    """
+    import contextlib
+    import io
+    import os
+    import time
+    from process_igra import ascii_to_dataframe, save_derived
+
+    ident = os.path.basename(filename).split('-')[0]
+    headers, _ = ascii_to_dataframe(filename)
+    start, end = headers.index[0].floor('D'), headers.index[-1].floor('D')
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            save_derived({'bench': ident}, directory, os.path.dirname(filename), start, end)
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return {'seconds': best, 'soundings': len(headers), 'soundings_per_s': len(headers) / best}
+
+
+def bench_profiles_write(filename, directory, output='csv', repeat=1):
+    """ Throughput of the per-station work of save_profiles on a local data-por archive
+    Args:
+        filename (str): data-por archive <id>-data.txt.zip
+        directory (str): output directory
+        output (str): 'csv' or 'store' (see save_profiles)
+        repeat (int): number of timed runs (best is reported)
+    Returns:
+        dict : seconds, soundings and soundings per second
+    """
+    import contextlib
+    import io
+    import os
+    import time
+    import pandas as pd
+    from process_igra import _save_station_profiles
+
+    ident = os.path.basename(filename).split('-')[0]
+    os.makedirs(os.path.join(directory, 'bench'), exist_ok=True)
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            times = _save_station_profiles('bench', ident, filename, directory, pd.Timestamp('1900-01-01'),
+                                           pd.Timestamp('2100-12-31'), output=output)
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return {'seconds': best, 'soundings': len(times), 'soundings_per_s': len(times) / best}
+
+
+def bench_suite(sizes=(1, 5, 20), levels=100, soundings_per_day=2, repeat=1, directory=None, compare=True):
+    """ Parse time, peak memory and write throughput at several file sizes, offline on synthetic files
+    Args:
+        sizes (tuple): years of the synthetic files
+        levels (int): levels per sounding
+        soundings_per_day (int): soundings per day
+        repeat (int): number of timed runs (best is reported)
+        directory (str): working directory (default: temporary directory)
+        compare (bool): compare with the line-by-line parser (slow for big files)
+    Returns:
+        list : one dict of results per benchmark and size
+    """
+    import os
+    import shutil
+    import tempfile
+    from process_igra import ascii_to_dataframe, iter_chunks, por_to_dataframe
+
+    tmp = tempfile.mkdtemp() if directory is None else directory
+    results = []
+    try:
+        for years in sizes:
+            drvd = os.path.join(tmp, 'USM00072764-drvd.txt.zip')
+            write_synthetic_derived(drvd, years=years, soundings_per_day=soundings_per_day, levels=levels)
+            size = {'years': years, 'levels': levels, 'soundings_per_day': soundings_per_day,
+                    'mb': os.path.getsize(drvd) / 1e6}
+
+            if compare:
+                t = bench_parse(drvd, get_levels=True, repeat=repeat)
+                results.append(dict(size, bench='parse_python', seconds=t['python']))
+            for get_levels in [False, True]:
+                dt, peak = bench_memory(ascii_to_dataframe, drvd, get_levels=get_levels)
+                results.append(dict(size, bench='parse_numpy' + ('_levels' if get_levels else ''),
+                                    seconds=dt, peak_mb=peak))
+            dt, peak = bench_memory(lambda: sum(len(h) for h, _ in iter_chunks(drvd, chunksize=1000)))
+            results.append(dict(size, bench='iter_chunks_levels', seconds=dt, peak_mb=peak))
+
+            out = os.path.join(tmp, 'out')
+            results.append(dict(size, bench='save_derived', **bench_derived_write(drvd, out, repeat=repeat)))
+
+            por = os.path.join(tmp, 'USM00072764-data.txt.zip')
+            write_synthetic_por(por, years=years, soundings_per_day=soundings_per_day, levels=levels)
+            dt, peak = bench_memory(por_to_dataframe, por, all_columns=True)
+            results.append(dict(size, bench='parse_por', seconds=dt, peak_mb=peak))
+            for output in ['csv', 'store']:
+                try:
+                    t = bench_profiles_write(por, out, output=output, repeat=repeat)
+                except ImportError as e:
+                    # the store output needs PyTables
+                    t = {'skipped': str(e)}
+                results.append(dict(size, bench='save_profiles_' + output, **t))
+            shutil.rmtree(out, ignore_errors=True)
+    finally:
+        if directory is None:
+            shutil.rmtree(tmp, ignore_errors=True)
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    import os
+    import tempfile
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('filename', nargs='?', help='IGRA derived file, synthetic if not given')
+    parser.add_argument('--years', type=int, default=20)
+    parser.add_argument('--levels', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--suite', action='store_true', help='run the benchmark suite')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 5, 20], help='years of the suite files')
+    parser.add_argument('--no-compare', action='store_true', help='skip the line-by-line parser in the suite')
+    parser.add_argument('--json', help='write the suite results to this file')
+    args = parser.parse_args()
+
+    if args.suite:
+        results = bench_suite(sizes=args.sizes, levels=args.levels, repeat=args.repeat, compare=not args.no_compare)
+        for r in results:
+            if 'skipped' in r:
+                print('%-22s %3d years  skipped (%s)' % (r['bench'], r['years'], r['skipped']))
+                continue
+            line = '%-22s %3d years %7.1f MB %8.3f s' % (r['bench'], r['years'], r['mb'], r['seconds'])
+            if 'peak_mb' in r:
+                line += '   peak %8.1f MB' % r['peak_mb']
+            if 'soundings_per_s' in r:
+                line += '   %9.0f soundings/s' % r['soundings_per_s']
+            print(line)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(results, f, indent=1)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = args.filename
+            if filename is None:
+                filename = os.path.join(tmp, 'USM00072764-drvd.txt.zip')
+                write_synthetic_derived(filename, years=args.years, levels=args.levels)
+            print('file: %s (%.1f MB)' % (filename, os.path.getsize(filename) / 1e6))
+            for get_levels in [False, True]:
+                t = bench_parse(filename, get_levels=get_levels, repeat=args.repeat)
+                print('get_levels=%-5s python %7.2f s   numpy %7.2f s   speedup %5.1fx   '
+                      '(decompress %5.2f s, parse only %5.1fx)'
+                      % (get_levels, t['python'], t['numpy'], t['speedup'], t['read'], t['parse_speedup']))
@@ -0,0 +1,268 @@
+__all__ = ['load', 'store', 'invalidate', 'evict', 'fingerprint', 'frames_to_arrays', 'arrays_to_frames']
+
+# Persistent cache of parsed IGRA archives
+#
+# Every entry is one uncompressed .npz file of named arrays plus a .json sidecar
+# holding the fingerprint of the source archive (path, size, mtime and sha1 of
+# the content). Entries are written with an atomic rename and carry their own
+# metadata, so several processes can share one cache directory. The sha1 of
+# an archive is kept in a .fingerprint file next to the entries and only
+# computed again when the size or mtime of the archive changed.
+
+# default size limit of a cache directory
+MAX_BYTES = 4 * 1024**3
+
+
+def load(filename, kind, cache_dir=None, keys=None, verify=False):
+    """ Load the cached arrays of an archive if the archive did not change
+    Args:
+        filename (str): source archive
+        kind (str): what was cached (parser and options), e.g. 'drvd'
+        cache_dir (str): cache directory (default: .igra_cache next to the archive)
+        keys (list): only load these arrays (default all)
+        verify (bool): always compare the content hash, not only size and mtime
+    Returns:
+        dict : name -> ndarray, None if there is no valid entry
+    """
+    import os
+    import time
+    import numpy as np
+
+    npz, meta = _entry(filename, kind, cache_dir)
+    info = _read_meta(meta)
+    if info is None or not os.path.isfile(npz):
+        return None
+
+    stat = os.stat(filename)
+    if verify or info['size'] != stat.st_size or info['mtime_ns'] != stat.st_mtime_ns:
+        # touched or downloaded again, still valid if the content is the same
+        if _content_hash(filename) != info['sha1']:
+            _remove(npz, meta)
+            return None
+        info['size'], info['mtime_ns'] = stat.st_size, stat.st_mtime_ns
+
+    info['used'] = time.time()
+    _write_meta(meta, info)
+    try:
+        with np.load(npz, allow_pickle=False) as arrays:
+            return {key: _restore(arrays[key]) for key in (keys or arrays.files) if key in arrays.files}
+    except (OSError, ValueError):
+        # evicted by another process in the meantime
+        return None
+
+
+def store(filename, kind, arrays, cache_dir=None, max_bytes=None):
+    """ Store parsed arrays of an archive in the cache
+    Args:
+        filename (str): source archive
+        kind (str): what was cached (parser and options), e.g. 'drvd'
+        arrays (dict): name -> ndarray
+        cache_dir (str): cache directory (default: .igra_cache next to the archive)
+        max_bytes (int): size limit of the cache directory, older entries are evicted (default MAX_BYTES)
+    """
+    import os
+    import time
+    import numpy as np
+
+    npz, meta = _entry(filename, kind, cache_dir)
+    os.makedirs(os.path.dirname(npz), exist_ok=True)
+    stat = os.stat(filename)
+    info = {'path': os.path.abspath(filename), 'kind': kind, 'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns, 'sha1': _content_hash(filename), 'used': time.time()}
+
+    tmp = '%s.%d.tmp' % (npz, os.getpid())
+    with open(tmp, 'wb') as f:
+        np.savez(f, **{key: _compact(value) for key, value in arrays.items()})
+    os.replace(tmp, npz)
+    info['bytes'] = os.path.getsize(npz)
+    _write_meta(meta, info)
+
+    evict(os.path.dirname(npz), max_bytes)
+
+
+def invalidate(filename=None, cache_dir=None):
+    """ Remove the cache entries of an archive (all kinds), or all entries if filename is None
+    Args:
+        filename (str): source archive
+        cache_dir (str): cache directory (default: .igra_cache next to the archive)
+    Returns:
+        int : number of removed entries
+    """
+    import os
+
+    if cache_dir is None:
+        if filename is None:
+            raise ValueError("Need a filename or a cache_dir")
+        cache_dir = _default_dir(filename)
+    removed = 0
+    for meta, info in _entries(cache_dir):
+        if filename is None or info.get('path') == os.path.abspath(filename):
+            _remove(meta[:-len('.json')] + '.npz', meta)
+            removed += 1
+    return removed
+
+
+def evict(cache_dir, max_bytes=None):
+    """ Remove the least recently used entries until the cache is below max_bytes
+    Args:
+        cache_dir (str): cache directory
+        max_bytes (int): size limit (default MAX_BYTES)
+    """
+    if max_bytes is None:
+        max_bytes = MAX_BYTES
+    entries = sorted(_entries(cache_dir), key=lambda entry: entry[1].get('used', 0))
+    total = sum(info.get('bytes', 0) for _, info in entries)
+    for meta, info in entries:
+        if total <= max_bytes:
+            break
+        _remove(meta[:-len('.json')] + '.npz', meta)
+        total -= info.get('bytes', 0)
+
+
+def fingerprint(filename, cache_dir=None):
+    """ sha1 of the content of an archive, hashed again only if its size or mtime changed
+    Args:
+        filename (str): source archive
+        cache_dir (str): cache directory (default: .igra_cache next to the archive)
+    Returns:
+        str : hex sha1 of the content
+    """
+    import os
+
+    npz, _ = _entry(filename, 'fingerprint', cache_dir)
+    path = npz[:-len('.npz')] + '.fingerprint'
+    stat = os.stat(filename)
+    info = _read_meta(path)
+    if info is None or info['size'] != stat.st_size or info['mtime_ns'] != stat.st_mtime_ns:
+        info = {'path': os.path.abspath(filename), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                'sha1': _content_hash(filename)}
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write_meta(path, info)
+    return info['sha1']
+
+
+def frames_to_arrays(**frames):
+    """ Flatten DataFrames into named arrays for the cache (columns by position, so duplicate names are kept)
+    Args:
+        **frames: name -> DataFrame
+    Returns:
+        dict : name -> ndarray
+    """
+    import numpy as np
+
+    arrays = {}
+    for name, df in frames.items():
+        arrays[name + '.index'] = df.index.to_numpy()
+        arrays[name + '.index_name'] = np.array([df.index.name or ''])
+        arrays[name + '.columns'] = np.array([str(c) for c in df.columns])
+        for i in range(df.shape[1]):
+            arrays['%s.%d' % (name, i)] = df.iloc[:, i].to_numpy()
+    return arrays
+
+
+def arrays_to_frames(arrays, name):
+    """ Rebuild a DataFrame flattened by frames_to_arrays """
+    import pandas as pd
+
+    columns = list(arrays[name + '.columns'])
+    df = pd.DataFrame(dict(enumerate(arrays['%s.%d' % (name, i)] for i in range(len(columns)))),
+                      index=pd.Index(arrays[name + '.index'], name=arrays[name + '.index_name'][0] or None))
+    df.columns = columns
+    return df
+
+
+def _default_dir(filename):
+    import os
+    return os.path.join(os.path.dirname(os.path.abspath(filename)), '.igra_cache')
+
+
+def _entry(filename, kind, cache_dir):
+    """ Paths of the .npz and .json files of a cache entry """
+    import hashlib
+    import os
+
+    if cache_dir is None:
+        cache_dir = _default_dir(filename)
+    key = hashlib.sha1((os.path.abspath(filename) + '|' + kind).encode()).hexdigest()[:20]
+    name = '%s-%s' % (os.path.basename(filename).split('.')[0], key)
+    return os.path.join(cache_dir, name + '.npz'), os.path.join(cache_dir, name + '.json')
+
+
+def _entries(cache_dir):
+    """ (json path, metadata) of all entries of a cache directory """
+    import glob
+    import os
+
+    out = []
+    for meta in glob.glob(os.path.join(cache_dir, '*.json')):
+        info = _read_meta(meta)
+        if info is not None:
+            out.append((meta, info))
+    return out
+
+
+def _read_meta(meta):
+    import json
+
+    try:
+        with open(meta) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(meta, info):
+    import json
+    import os
+
+    tmp = '%s.%d.tmp' % (meta, os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(info, f)
+    os.replace(tmp, meta)
+
+
+def _remove(*paths):
+    import os
+
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _content_hash(filename, blocksize=1 << 22):
+    """ sha1 of the file content """
+    import hashlib
+
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def _compact(values):
+    """ Smaller storage dtype: int64 -> int32 if the values fit, text objects -> fixed width unicode, other objects -> float """
+    import numpy as np
+
+    values = np.asarray(values)
+    if values.dtype == np.int64 and values.size and \
+            np.iinfo(np.int32).min <= values.min() and values.max() <= np.iinfo(np.int32).max:
+        return values.astype(np.int32)
+    if values.dtype == object:
+        if all(isinstance(value, str) for value in values.flat):
+            return values.astype(str)
+        return values.astype(float)
+    return values
+
+
+def _restore(values):
+    """ Undo _compact """
+    import numpy as np
+
+    if values.dtype == np.int32:
+        return values.astype(np.int64)
+    if values.dtype.kind == 'U':
+        return values.astype(object)
+    return values
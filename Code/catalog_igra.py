@@ -0,0 +1,176 @@
+__all__ = ['read_station_list', 'station_catalog', 'find_stations', 'station_names']
+
+# Station catalog with a spatial index
+#
+# The IGRA station list is parsed once into a typed DataFrame (cached with
+# cache_igra next to the list file) and indexed by a KD-tree of the stations'
+# unit vectors, so radius queries are chord-length queries on the sphere.
+
+STATION_LIST_URL = 'https://www1.ncdc.noaa.gov/pub/data/igra/igra2-station-list.txt'
+
+# mean earth radius (km)
+EARTH_RADIUS = 6371.0
+
+# fixed-width columns of igra2-station-list.txt (python slices)
+_LIST_FIELDS = [('id', 0, 11), ('lat', 12, 20), ('lon', 21, 30), ('alt', 31, 37), ('state', 38, 40),
+                ('name', 41, 71), ('start', 72, 76), ('end', 77, 81), ('total', 82, 88)]
+
+# characters of station names not allowed in directory names (any OS)
+_UNSAFE_NAME = r'[\\/:*?"<>|\x00-\x1f]+'
+
+_LIST_DTYPES = {'lat': 'float64', 'lon': 'float64', 'alt': 'float32', 'start': 'int16', 'end': 'int16',
+                'total': 'int32'}
+
+
+def read_station_list(filename):
+    """ Read the IGRA station list (NOAA fixed-width file or a station_list_*.txt CSV written by save_profiles)
+    Args:
+        filename (str): station list
+    Returns:
+        DataFrame : stations with id as index and lat, lon, alt, state, name, start, end, total
+    """
+    import pandas as pd
+
+    with open(filename) as f:
+        first = f.readline()
+    if first.startswith('id,'):
+        stations = pd.read_csv(filename, index_col='id')
+    else:
+        stations = pd.read_fwf(filename, colspecs=[(a, b) for _, a, b in _LIST_FIELDS],
+                               names=[name for name, _, _ in _LIST_FIELDS], dtype={'state': str}, index_col='id')
+    # missing elevations are -999.9 / -998.8 in the list
+    stations['alt'] = stations['alt'].where(stations['alt'] > -998)
+    stations['state'] = stations['state'].fillna('')
+    stations['name'] = stations['name'].str.strip()
+    return stations.astype({name: dtype for name, dtype in _LIST_DTYPES.items() if name in stations})
+
+
+def station_catalog(directory, url=None, update=False, cache_dir=None, verbose=1):
+    """ Station catalog with spatial index, the list is downloaded if missing and parsed once
+    Args:
+        directory (str): directory of igra2-station-list.txt
+        url (str): download url (default NOAA)
+        update (bool): download the list again if it changed on the server
+        cache_dir (str): directory of the parsed-data cache (default: .igra_cache in directory)
+        verbose (int): verboseness
+    Returns:
+        dict : 'stations' -> DataFrame (see read_station_list), 'xyz' -> unit vectors of the stations,
+               'tree' -> scipy cKDTree of xyz (None without scipy)
+    """
+    import os
+    import cache_igra
+    from download_igra import fetch
+
+    filename = os.path.join(directory, 'igra2-station-list.txt')
+    if update or not os.path.isfile(filename):
+        os.makedirs(directory, exist_ok=True)
+        fetch(url or STATION_LIST_URL, filename, verbose=verbose)
+
+    arrays = cache_igra.load(filename, 'catalog', cache_dir)
+    if arrays is not None:
+        stations = cache_igra.arrays_to_frames(arrays, 'stations')
+        stations = stations.astype({name: dtype for name, dtype in _LIST_DTYPES.items() if name in stations})
+    else:
+        stations = read_station_list(filename)
+        cache_igra.store(filename, 'catalog', cache_igra.frames_to_arrays(stations=stations), cache_dir)
+    return _index_catalog(stations)
+
+
+def find_stations(catalog, bbox=None, center=None, radius=None, start=None, end=None):
+    """ Stations within a bounding box and/or radius with records covering [start, end]
+    Args:
+        catalog (dict): station catalog (see station_catalog), or a station DataFrame
+        bbox (tuple): (lon_min, lat_min, lon_max, lat_max) in degrees, lon_min > lon_max crosses the dateline
+        center (tuple): (lat, lon) in degrees
+        radius (float): great circle distance to center in km
+        start (datetime-like or int): records start in or before this year
+        end (datetime-like or int): records end in or after this year
+    Returns:
+        DataFrame : selected stations (with distance in km if center is given), sorted by distance or id
+    """
+    import numpy as np
+
+    if not isinstance(catalog, dict):
+        catalog = _index_catalog(catalog)
+    stations = catalog['stations']
+    select = np.ones(len(stations), dtype=bool)
+
+    if start is not None:
+        select &= stations['start'].values <= _year(start)
+    if end is not None:
+        select &= stations['end'].values >= _year(end)
+    if bbox is not None:
+        lon_min, lat_min, lon_max, lat_max = bbox
+        lat, lon = stations['lat'].values, stations['lon'].values
+        select &= (lat >= lat_min) & (lat <= lat_max)
+        if lon_min <= lon_max:
+            select &= (lon >= lon_min) & (lon <= lon_max)
+        else:
+            select &= (lon >= lon_min) | (lon <= lon_max)
+
+    distance = None
+    if center is not None:
+        xyz = _unit_vectors(np.array([center[0]]), np.array([center[1]]))[0]
+        if radius is not None:
+            chord = 2 * np.sin(min(radius / EARTH_RADIUS, np.pi) / 2)
+            if catalog['tree'] is not None:
+                near = np.zeros(len(stations), dtype=bool)
+                near[catalog['tree'].query_ball_point(xyz, chord * (1 + 1e-12))] = True
+            else:
+                near = np.linalg.norm(catalog['xyz'] - xyz, axis=1) <= chord
+            select &= near
+        rows = np.flatnonzero(select)
+        distance = 2 * np.arcsin(np.clip(np.linalg.norm(catalog['xyz'][rows] - xyz, axis=1) / 2, 0, 1)) \
+            * EARTH_RADIUS
+        if radius is not None:
+            # the tree query is padded against rounding, cut at the exact distance
+            keep = distance <= radius
+            rows, distance = rows[keep], distance[keep]
+    elif radius is not None:
+        raise ValueError("radius needs a center")
+    else:
+        rows = np.flatnonzero(select)
+
+    found = stations.iloc[rows]
+    if distance is not None:
+        found = found.assign(distance=distance).sort_values('distance', kind='stable')
+    return found
+
+
+def station_names(stations):
+    """ stations dict (name -> IGRA ID) of save_profiles/save_derived for selected stations
+    Args:
+        stations (DataFrame): stations with id as index and a name column (see find_stations)
+    Returns:
+        dict : station name -> IGRA ID, names that occur twice get the ID appended; the names are directory
+               names of the outputs, path separators and characters not allowed in file names are replaced by '-'
+    """
+    names = stations['name'].str.strip().str.title().str.replace(_UNSAFE_NAME, '-', regex=True).str.strip(' .-')
+    # nothing left of the name: the IGRA ID
+    names = names.mask(names == '', stations.index.to_series())
+    duplicated = names.duplicated(keep=False)
+    return {(name + ' ' + id if dup else name): id for id, name, dup in zip(stations.index, names, duplicated)}
+
+
+def _index_catalog(stations):
+    """ Catalog dict with unit vectors and KD-tree of the stations """
+    xyz = _unit_vectors(stations['lat'].values, stations['lon'].values)
+    try:
+        from scipy.spatial import cKDTree
+        tree = cKDTree(xyz)
+    except ImportError:
+        tree = None
+    return {'stations': stations, 'xyz': xyz, 'tree': tree}
+
+
+def _unit_vectors(lat, lon):
+    import numpy as np
+
+    lat, lon = np.radians(lat), np.radians(lon)
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def _year(time):
+    import pandas as pd
+
+    return time if isinstance(time, int) else pd.Timestamp(time).year
@@ -0,0 +1,315 @@
+__all__ = ['climatology', 'new_climatology', 'update_climatology', 'merge_climatology', 'climatology_table']
+
+# Streaming climatology of IGRA derived soundings
+#
+# Monthly and diurnal composites of the derived header parameters and of the
+# level variables at standard pressure levels, computed from the chunks of
+# process_igra.iter_chunks without loading a whole archive. Every station,
+# month and nominal hour (nearest of the hours, 00Z/12Z by default) keeps
+# count, mean, sum of squared deviations (merged with the parallel formula
+# of Chan et al. 1979), min, max and a fixed-range histogram per variable, so
+# memory does not grow with the period and the states of worker processes
+# merge exactly:
+#
+#     state = climatology(['USM00072764', 'USM00072520'], directory='drvd', processes=4)
+#     table = climatology_table(state, quantiles=(0.1, 0.5, 0.9))
+
+# derived header parameters (columns of ascii_to_dataframe)
+_HEADER_VARIABLES = ['pw_mm', 'invpress', 'invhgt', 'invtempdif_dC', 'mixpress', 'mixhgt', 'frzpress', 'frzhgt',
+                     'lclpress', 'lclhgt', 'lfcpress', 'lfchgt', 'lnbp', 'lnbhgt', 'li', 'si', 'ki', 'tti', 'cape',
+                     'cin']
+
+# level variables (columns of the level table) and standard pressure levels (Pa)
+_LEVEL_VARIABLES = ['calcgph', 'temp', 'ptemp', 'vappress', 'calcrh', 'uwnd', 'vwnd']
+_LEVELS = [100000, 92500, 85000, 70000, 50000, 40000, 30000, 25000, 20000, 15000, 10000]
+
+# histogram range of every variable in the units of ascii_to_dataframe, values outside count in the end bins
+_RANGES = {'pw_mm': (0, 100), 'invtempdif_dC': (0, 40), 'li': (-40, 40), 'si': (-40, 40), 'ki': (-60, 60),
+           'tti': (0, 80), 'cape': (0, 8000), 'cin': (-1000, 1000),
+           'calcgph': (0, 35000), 'temp': (1500, 3500), 'ptemp': (2000, 8000), 'vappress': (0, 80000),
+           'calcrh': (0, 1000), 'uwnd': (-1500, 1500), 'vwnd': (-1500, 1500)}
+_PRESS_RANGE = (0, 110000)
+_HEIGHT_RANGE = (0, 20000)
+
+_MONTHS = 12
+
+
+def climatology(stations, directory='.', start=None, end=None, processes=1, chunksize=4096, **kwargs):
+    """ Monthly and diurnal climatology of the derived soundings of several stations, streamed from the archives
+    Args:
+        stations (dict, list or DataFrame): station name -> IGRA ID, IGRA IDs, or stations of catalog_igra.find_stations
+        directory (str): directory of the derived archives (<id>-drvd.txt.zip, see download_derived)
+        start (datetime-like): first sounding (default: all)
+        end (datetime-like): last sounding (default: all)
+        processes (int): number of worker processes (one station per task), 1 runs in this process
+        chunksize (int): soundings per chunk, bounds the memory of a station
+        **kwargs: options of new_climatology
+    Returns:
+        dict : climatology state of all stations (see new_climatology)
+    """
+    import glob
+    import os
+    from process_igra import _run_tasks
+    from store_igra import station_idents
+
+    _, idents = station_idents(stations)
+    tasks = []
+    for ident in idents:
+        archives = glob.glob(os.path.join(directory, ident + '*drvd*'))
+        if not archives:
+            raise IOError("No derived archive of %s in %s" % (ident, directory))
+        tasks.append((ident, archives[0], start, end, chunksize, kwargs))
+    return merge_climatology(*_run_tasks(_station_climatology, tasks, processes))
+
+
+def new_climatology(header_variables=None, level_variables=None, levels=None, hours=(0, 12), bins=200):
+    """ Empty climatology state
+    Args:
+        header_variables (list): derived header parameters (default all but numlev and reltime)
+        level_variables (list): level variables at the standard levels (default calcgph, temp, ptemp, vappress,
+                                calcrh, uwnd, vwnd), [] for none
+        levels (list): standard pressure levels (Pa), level rows with exactly this pressure are used
+                       (default mandatory levels 1000 to 100 hPa)
+        hours (tuple): nominal hours (UTC), every sounding counts for the nearest one
+        bins (int): histogram bins of every variable (quantile resolution)
+    Returns:
+        dict : 'variables', 'levels' -> variable and pressure level (NaN for header parameters) of every series,
+               'hours', 'edges' -> (series, bins + 1) histogram edges, 'stations' -> IGRA ID -> dict of
+               (series, month, hour) arrays 'count', 'mean', 'm2', 'min', 'max' and 'hist' (series, month, hour, bins)
+    """
+    import numpy as np
+
+    header_variables = list(_HEADER_VARIABLES if header_variables is None else header_variables)
+    level_variables = list(_LEVEL_VARIABLES if level_variables is None else level_variables)
+    levels = list(_LEVELS if levels is None else levels)
+    variables = header_variables + [name for name in level_variables for _ in levels]
+    pressure = [np.nan] * len(header_variables) + list(levels) * len(level_variables)
+    edges = np.array([np.linspace(*_variable_range(name), bins + 1) for name in variables]).reshape(-1, bins + 1)
+    return {'variables': variables, 'levels': np.array(pressure, dtype=float), 'hours': np.array(hours),
+            'edges': edges, 'stations': {}}
+
+
+def update_climatology(state, station, headers, levels=None):
+    """ Add a chunk of soundings of one station to a climatology state (in place)
+    Args:
+        state (dict): climatology state of new_climatology
+        station (str): IGRA ID
+        headers (DataFrame): headers of process_igra.ascii_to_dataframe (or a chunk of iter_chunks)
+        levels (DataFrame): levels of these soundings, needed for level variables
+    Returns:
+        dict : state
+    """
+    from timing_igra import stage
+
+    with stage('climatology', rows=len(headers)):
+        series, group, values = _observations(state, headers, levels)
+        _accumulate(_station_state(state, station), series, group, values, state['edges'])
+    return state
+
+
+def merge_climatology(*states):
+    """ Merge climatology states (e.g. of worker processes or periods), same variables, levels, hours and bins
+    Args:
+        *states (dict): climatology states
+    Returns:
+        dict : new merged state
+    """
+    import numpy as np
+
+    if not states:
+        raise ValueError("No climatology to merge")
+    first = states[0]
+    merged = dict(first, stations={})
+    for state in states:
+        if (state['variables'] != first['variables'] or not np.array_equal(state['levels'], first['levels'],
+                                                                            equal_nan=True)
+                or not np.array_equal(state['hours'], first['hours'])
+                or not np.array_equal(state['edges'], first['edges'])):
+            raise ValueError("Climatologies of different variables, levels, hours or bins")
+        for station, stats in state['stations'].items():
+            if station not in merged['stations']:
+                merged['stations'][station] = {key: value.copy() for key, value in stats.items()}
+            else:
+                _combine(merged['stations'][station], stats)
+    return merged
+
+
+def climatology_table(state, quantiles=(0.1, 0.5, 0.9)):
+    """ Table of a climatology state
+    Args:
+        state (dict): climatology state
+        quantiles (tuple): quantiles estimated from the histograms (interpolated within a bin, bounded by min/max)
+    Returns:
+        DataFrame : by station, variable, level (Pa, NaN for header parameters), month and hour: count, mean, std
+                    (sample), min, max and q<quantile> columns, groups without values are dropped
+    """
+    import numpy as np
+    import pandas as pd
+
+    tables = []
+    nseries = len(state['variables'])
+    months, hours = np.arange(1, _MONTHS + 1), state['hours']
+    for station, stats in state['stations'].items():
+        count = stats['count']
+        with np.errstate(invalid='ignore', divide='ignore'):
+            columns = {'count': count, 'mean': np.where(count > 0, stats['mean'], np.nan),
+                       'std': np.sqrt(stats['m2'] / (count - 1)), 'min': stats['min'], 'max': stats['max']}
+        for q in quantiles:
+            columns['q%g' % q] = _quantile(stats, state['edges'], q)
+        index = pd.MultiIndex.from_arrays(
+            [np.full(count.size, station),
+             np.repeat(state['variables'], _MONTHS * hours.size),
+             np.repeat(state['levels'], _MONTHS * hours.size),
+             np.tile(np.repeat(months, hours.size), nseries),
+             np.tile(hours, nseries * _MONTHS)],
+            names=['station', 'variable', 'level', 'month', 'hour'])
+        table = pd.DataFrame({name: values.ravel() for name, values in columns.items()}, index=index)
+        tables.append(table[table['count'] > 0])
+    if not tables:
+        return pd.DataFrame(columns=['count', 'mean', 'std', 'min', 'max'] + ['q%g' % q for q in quantiles])
+    return pd.concat(tables)
+
+
+def _station_climatology(ident, filename, start, end, chunksize, options):
+    """ Climatology state of one archive, chunk by chunk """
+    from process_igra import iter_chunks
+
+    state = new_climatology(**options)
+    get_levels = any(level == level for level in state['levels'])
+    for headers, levels in iter_chunks(filename, chunksize, get_levels=get_levels, start=start, end=end):
+        update_climatology(state, ident, headers, levels if get_levels else None)
+    _station_state(state, ident)
+    return state
+
+
+def _variable_range(name):
+    """ Histogram range of a variable """
+    if name in _RANGES:
+        return _RANGES[name]
+    if name.endswith('press') or name == 'lnbp':
+        return _PRESS_RANGE
+    return _HEIGHT_RANGE
+
+
+def _station_state(state, station):
+    """ Statistics of a station, empty if new """
+    import numpy as np
+
+    if station not in state['stations']:
+        shape = (len(state['variables']), _MONTHS, state['hours'].size)
+        state['stations'][station] = {
+            'count': np.zeros(shape, dtype=np.int64), 'mean': np.zeros(shape), 'm2': np.zeros(shape),
+            'min': np.full(shape, np.nan), 'max': np.full(shape, np.nan),
+            'hist': np.zeros(shape + (state['edges'].shape[1] - 1,), dtype=np.int64)}
+    return state['stations'][station]
+
+
+def _groups(times, hours):
+    """ Flat (month, hour) group of times, hour is the index of the nearest nominal hour (across midnight) """
+    import numpy as np
+
+    times = times.round('min')
+    hour = np.asarray(times.hour + times.minute / 60.)
+    distance = np.abs(hour[:, None] - hours[None, :])
+    nearest = np.argmin(np.minimum(distance, 24 - distance), axis=1)
+    return (np.asarray(times.month) - 1) * hours.size + nearest
+
+
+def _observations(state, headers, levels):
+    """ Flat series, group and value of the valid values of a chunk """
+    import numpy as np
+    import pandas as pd
+
+    hours = state['hours']
+    series, group, values = [], [], []
+    is_header = np.isnan(state['levels'])
+    header_group = _groups(pd.DatetimeIndex(headers.index), hours)
+    for k in np.flatnonzero(is_header):
+        column = headers[state['variables'][k]]
+        # duplicated names (numlev) are the same values
+        column = column.iloc[:, 0] if column.ndim > 1 else column
+        v = column.to_numpy(dtype=float)
+        valid = np.isfinite(v)
+        series.append(np.full(valid.sum(), k))
+        group.append(header_group[valid])
+        values.append(v[valid])
+
+    if levels is not None and len(levels) and not is_header.all():
+        press = levels['press'].to_numpy(dtype=float)
+        standard = np.unique(state['levels'][~is_header])
+        rows = np.flatnonzero(np.isin(press, standard))
+        level_group = _groups(pd.DatetimeIndex(levels.index[rows]), hours)
+        for k in np.flatnonzero(~is_header):
+            at = press[rows] == state['levels'][k]
+            v = levels[state['variables'][k]].to_numpy(dtype=float)[rows[at]]
+            valid = np.isfinite(v)
+            series.append(np.full(valid.sum(), k))
+            group.append(level_group[at][valid])
+            values.append(v[valid])
+
+    if not values:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0)
+    return np.concatenate(series).astype(int), np.concatenate(group).astype(int), np.concatenate(values)
+
+
+def _accumulate(stats, series, group, values, edges):
+    """ Add observations (series, flat month/hour group, value) to the statistics of a station """
+    import numpy as np
+
+    ngroups = stats['count'][0].size
+    key = series * ngroups + group
+    size = stats['count'].size
+    count = np.bincount(key, minlength=size)
+    total = np.bincount(key, weights=values, minlength=size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(count > 0, total / count, 0.)
+    m2 = np.bincount(key, weights=(values - mean[key]) ** 2, minlength=size)
+    low, high = np.full(size, np.nan), np.full(size, np.nan)
+    np.fmin.at(low, key, values)
+    np.fmax.at(high, key, values)
+
+    nbins = edges.shape[1] - 1
+    lo, hi = edges[series, 0], edges[series, -1]
+    b = np.clip(((values - lo) / (hi - lo) * nbins).astype(int), 0, nbins - 1)
+    hist = np.bincount(key * nbins + b, minlength=size * nbins)
+
+    shape = stats['count'].shape
+    _combine(stats, {'count': count.reshape(shape), 'mean': mean.reshape(shape), 'm2': m2.reshape(shape),
+                     'min': low.reshape(shape), 'max': high.reshape(shape),
+                     'hist': hist.reshape(stats['hist'].shape)})
+
+
+def _combine(stats, other):
+    """ Merge the statistics other into stats (in place), parallel mean and variance of Chan et al. """
+    import numpy as np
+
+    n1, n2 = stats['count'], other['count']
+    n = n1 + n2
+    with np.errstate(invalid='ignore', divide='ignore'):
+        delta = other['mean'] - stats['mean']
+        weight = np.where(n > 0, n2 / n, 0.)
+        stats['m2'] += other['m2'] + delta ** 2 * n1 * weight
+        stats['mean'] += delta * weight
+    stats['count'] = n
+    stats['min'] = np.fmin(stats['min'], other['min'])
+    stats['max'] = np.fmax(stats['max'], other['max'])
+    stats['hist'] += other['hist']
+
+
+def _quantile(stats, edges, q):
+    """ Quantile q of every group from the histograms, linear within the bin, bounded by the min and max """
+    import numpy as np
+
+    hist = stats['hist']
+    cumulative = np.cumsum(hist, axis=-1)
+    total = cumulative[..., -1]
+    target = q * total
+    b = np.minimum(np.sum(cumulative < target[..., None], axis=-1), hist.shape[-1] - 1)
+    below = np.where(b > 0, np.take_along_axis(cumulative, np.maximum(b - 1, 0)[..., None], axis=-1)[..., 0], 0)
+    inbin = np.take_along_axis(hist, b[..., None], axis=-1)[..., 0]
+    series = np.broadcast_to(np.arange(edges.shape[0])[:, None, None], b.shape)
+    left, right = edges[series, b], edges[series, b + 1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        value = left + (right - left) * np.where(inbin > 0, (target - below) / inbin, 0.)
+    value = np.clip(value, stats['min'], stats['max'])
+    return np.where(total > 0, value, np.nan)
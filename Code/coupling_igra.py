@@ -0,0 +1,143 @@
+__all__ = ['coupling_metrics', 'save_coupling']
+
+# Land-atmosphere coupling indices of morning soundings
+#
+# Convective triggering potential and low-level humidity index (Findell and
+# Eltahir 2003) for the 12Z soundings of several stations, computed from the
+# levels of the derived archives in one pass: the soundings of all stations
+# are padded into (sounding, level) arrays a block at a time (see
+# thermo_igra) and every index is a NumPy operation over the block. The
+# mixed layer and inversion fields of the derived headers are joined to the
+# indices, with the LCL deficit (LCL height above the mixed layer top).
+
+# CTP layer and HI_low levels: pressure above the surface (Pa)
+_CTP_LAYER = (10000., 30000.)
+_HI_LOW_LEVELS = (5000., 15000.)
+
+# points of the CTP integration between the layer bounds
+_CTP_POINTS = 21
+
+# header fields joined to the indices (names of ascii_to_dataframe)
+_COUPLING_HEADER = ['mixpress', 'mixhgt', 'invpress', 'invhgt', 'invtempdif_dC', 'lclpress', 'lclhgt']
+
+_COUPLING_COLUMNS = ['ctp', 'hi_low'] + _COUPLING_HEADER + ['lcl_deficit']
+
+
+def coupling_metrics(stations, directory='.', start=None, end=None, hour=12, fill=False, block=4096):
+    """ Coupling indices of the morning soundings of several stations
+    Args:
+        stations (dict, list or DataFrame): station name -> IGRA ID, IGRA IDs, or stations of catalog_igra.find_stations
+        directory (str): directory of the derived archives (<id>-drvd.txt.zip, see download_derived)
+        start (datetime-like): first sounding (default: all)
+        end (datetime-like): last sounding (default: all)
+        hour (int): nominal hour (UTC) of the soundings, 12Z is the morning sounding in the Americas
+        fill (bool): fill missing mixed layer and LCL fields of the headers with thermo_igra.fill_derived
+        block (int): soundings computed at once, bounds the temporary arrays
+    Returns:
+        DataFrame : by station and sounding time (idate): name (the IGRA ID for a list of IDs), ctp (J/kg),
+                    hi_low (K), the mixed layer, inversion and LCL fields of the headers and
+                    lcl_deficit = lclhgt - mixhgt (m), float32
+    """
+    import glob
+    import os
+    import numpy as np
+    import pandas as pd
+    from process_igra import ascii_to_dataframe
+    from store_igra import station_idents
+    from thermo_igra import _THERMO_SCALE, _column, _pad, _soundings, fill_derived
+
+    names, idents = station_idents(stations)
+    names = idents if names is None else names
+    # empty first entries: no station or no sounding gives an empty table with the same columns
+    columns = [{name: np.empty(0) for name in _THERMO_SCALE}]
+    starts, counts = [np.empty(0, dtype=int)], [np.empty(0, dtype=int)]
+    station_index, time_index = [np.empty(0, dtype=object)], [pd.DatetimeIndex([])]
+    header = [np.empty((0, len(_COUPLING_HEADER)))]
+    offset = 0
+    for ident in idents:
+        archives = glob.glob(os.path.join(directory, ident + '*drvd*'))
+        if not archives:
+            raise IOError("No derived archive of %s in %s" % (ident, directory))
+        headers, levels = ascii_to_dataframe(archives[0], get_levels=True, start=start, end=end)
+        # only the soundings of the hour are kept, before the thermodynamics of fill_derived
+        levels = levels[levels.index.hour == hour]
+        headers = headers[headers.index.hour == hour]
+        if fill:
+            headers = fill_derived(headers, levels)
+        first, count = _soundings(levels)
+        times = pd.DatetimeIndex(levels.index.values[first])
+        columns.append({name: _column(levels, name) / scale for name, scale in _THERMO_SCALE.items()})
+        starts.append(first + offset)
+        counts.append(count)
+        offset += len(levels)
+        station_index.append(np.full(times.size, ident, dtype=object))
+        time_index.append(times)
+        # duplicated sounding times: the first sounding wins
+        header.append(headers.loc[~headers.index.duplicated(), _COUPLING_HEADER].reindex(times).values)
+        del headers, levels
+
+    columns = {name: np.concatenate([c[name] for c in columns]) for name in _THERMO_SCALE}
+    start, count = np.concatenate(starts), np.concatenate(counts)
+    values = np.full((start.size, len(_COUPLING_COLUMNS)), np.nan, dtype=np.float32)
+    for i in range(0, start.size, block):
+        padded = _pad(columns, start[i:i + block], count[i:i + block], int(count[i:i + block].max()))
+        values[i:i + block, :2] = np.column_stack(_block_indices(padded))
+    values[:, 2:-1] = np.concatenate(header)
+    values[:, -1] = values[:, _COUPLING_COLUMNS.index('lclhgt')] - values[:, _COUPLING_COLUMNS.index('mixhgt')]
+
+    index = pd.MultiIndex.from_arrays([np.concatenate(station_index), time_index[0].append(time_index[1:])],
+                                      names=['station', 'idate'])
+    table = pd.DataFrame(values, columns=_COUPLING_COLUMNS, index=index)
+    sizes = [times.size for times in time_index[1:]]
+    table.insert(0, 'name', pd.Categorical(np.repeat(np.asarray(names, dtype=object), sizes)))
+    return table
+
+
+def save_coupling(stations, directory, filename, start=None, end=None, **kwargs):
+    """ Write the coupling indices of the morning soundings of several stations to one CSV table
+    Args:
+        stations (dict, list or DataFrame): stations (see coupling_metrics)
+        directory (str): directory of the derived archives
+        filename (str): output CSV file (.csv, .csv.gz)
+        start (datetime-like): first sounding (default: all)
+        end (datetime-like): last sounding (default: all)
+        **kwargs: options of coupling_metrics
+    Returns:
+        DataFrame : the written table
+    """
+    table = coupling_metrics(stations, directory, start, end, **kwargs)
+    table.to_csv(filename, na_rep='NaN', float_format='%.6g')
+    return table
+
+
+def _block_indices(padded):
+    """ CTP (J/kg) and HI_low (K) of a block of padded soundings (units of thermo_igra._THERMO_SCALE) """
+    import numpy as np
+    from thermo_igra import (KAPPA, RD, _at_pressure, _compact, _dewpoint, _mixing_ratio, _moist_adiabat,
+                             _saturation, _thetae)
+
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        p, t, e = _compact(np.isfinite(padded['temp']), padded['press'], padded['temp'], padded['vappress'])
+        lnp = np.log(p)
+        psfc = p[:, 0]
+
+        # CTP: area between the moist adiabat through the temperature at 100 hPa above the surface
+        # and the temperature profile, up to 300 hPa above the surface
+        fraction = np.linspace(0, 1, _CTP_POINTS)
+        bottom, top = psfc - _CTP_LAYER[0], psfc - _CTP_LAYER[1]
+        grid = bottom[:, None] * (top / bottom)[:, None] ** fraction
+        tenv = np.column_stack([_at_pressure(level, p, lnp, t) for level in grid.T])
+        t0 = tenv[:, 0]
+        thetae = _thetae(t0, bottom, _mixing_ratio(_saturation(t0), bottom), t0)
+        parcel = _moist_adiabat(thetae, grid, t0[:, None] * (grid / bottom[:, None]) ** KAPPA)
+        d = parcel - tenv
+        ctp = RD * np.sum(0.5 * (d[:, 1:] + d[:, :-1]) * np.log(grid[:, :-1] / grid[:, 1:]), axis=1)
+
+        # HI_low: dew point depressions 50 and 150 hPa above the surface, levels with humidity only
+        pe, te, td = _compact(np.isfinite(e), p, t, _dewpoint(e))
+        lnpe = np.log(pe)
+        hi_low = 0
+        for above in _HI_LOW_LEVELS:
+            level = psfc - above
+            hi_low = hi_low + _at_pressure(level, pe, lnpe, te) - _at_pressure(level, pe, lnpe, td)
+    return ctp, hi_low
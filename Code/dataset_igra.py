@@ -0,0 +1,153 @@
+__all__ = ['open_igra_dataset']
+
+# Lazy multi-station xarray Dataset over the ragged stores of ragged_igra
+#
+# Header variables have the dimensions station x time, level variables
+# station x time x level (padded with NaN). Every chunk (one station, a run
+# of times) is a dask task that reads one column of the memory-mapped store,
+# so nothing is parsed or loaded before a computation needs it.
+
+
+def open_igra_dataset(stations, start=None, end=None, directory='.', store_dir=None, levels=True,
+                      time_chunk=4096, max_levels=None):
+    """ Open the derived soundings of several stations as one lazily loaded, chunked xarray Dataset
+    Args:
+        stations (dict, list or DataFrame): station name -> IGRA ID, IGRA IDs, or stations of catalog_igra.find_stations
+        start (datetime-like): first sounding (default: all)
+        end (datetime-like): last sounding (default: all)
+        directory (str): directory of the derived archives (<id>-drvd.txt.zip)
+        store_dir (str): directory of the ragged stores (default: directory/.igra_ragged), stores are
+                         built from the archives if missing or older than the archive
+        levels (bool): add the level variables (dimension level, padded with NaN)
+        time_chunk (int): number of times per chunk
+        max_levels (int): size of the level dimension (default: most levels of a selected sounding)
+    Returns:
+        Dataset : header variables (station, time) and level variables (station, time, level) as float32
+                  dask arrays, units as returned by process_igra.ascii_to_dataframe
+    """
+    import numpy as np
+    import xarray as xr
+    from store_igra import station_idents
+
+    names, idents = station_idents(stations)
+    if store_dir is None:
+        import os
+        store_dir = os.path.join(directory, '.igra_ragged')
+
+    paths, windows = [], []
+    for ident in idents:
+        path, store = _station_store(directory, store_dir, ident)
+        paths.append(path)
+        windows.append((store, _window(store, start, end)))
+
+    # nominal sounding times of all stations, a store without soundings has no header columns
+    idates = [np.asarray(store['hdr']['idate'][window]) if 'idate' in store['hdr'] else
+              np.array([], dtype='datetime64[ns]') for store, window in windows]
+    times = np.unique(np.concatenate(idates)) if idates else np.array([], dtype='datetime64[ns]')
+
+    # header row of every (station, time) in the store, -1 if the station has no sounding at that time
+    rows = np.full((len(idents), times.size), -1, dtype=np.int64)
+    nlevel = 0
+    for i, ((store, window), idate) in enumerate(zip(windows, idates)):
+        # duplicated times: the first sounding wins
+        idate, first = np.unique(idate, return_index=True)
+        rows[i, np.searchsorted(times, idate)] = window.start + first
+        if levels and idate.size:
+            nlevel = max(nlevel, int(np.max(store['hdr']['count'][window])))
+    if max_levels is not None:
+        nlevel = max_levels
+
+    from process_igra import _DRVD_HEADER_COLUMNS, _DRVD_HEADER_UNITS, _DRVD_LEVEL_COLUMNS
+    variables = {}
+    for name in dict.fromkeys(_DRVD_HEADER_COLUMNS):
+        if name == 'reltime':
+            continue
+        variables[_DRVD_HEADER_UNITS.get(name, name)] = (
+            ('station', 'time'), _lazy(paths, rows, time_chunk, 'hdr', name))
+    if levels:
+        for name in _DRVD_LEVEL_COLUMNS:
+            variables[name] = (('station', 'time', 'level'), _lazy(paths, rows, time_chunk, 'lvl', name, nlevel))
+
+    coords = {'station': list(idents), 'time': times}
+    if names is not None:
+        coords['name'] = ('station', list(names))
+    if levels:
+        coords['level'] = np.arange(nlevel)
+    return xr.Dataset(variables, coords=coords, attrs={'source': 'IGRA v2 derived', 'stores': list(paths)})
+
+
+def _station_store(directory, store_dir, ident):
+    """ Path and opened ragged store of a station, built from the archive if missing or outdated """
+    import glob
+    import os
+    from ragged_igra import build_ragged, open_ragged
+
+    path = os.path.join(store_dir, ident)
+    archives = glob.glob(os.path.join(directory, ident + '*drvd*'))
+    meta = os.path.join(path, 'meta.json')
+    if os.path.isfile(meta) and (not archives or os.path.getmtime(meta) >= os.path.getmtime(archives[0])):
+        return path, open_ragged(path)
+    if not archives:
+        raise IOError("No derived archive of %s in %s" % (ident, directory))
+    os.makedirs(store_dir, exist_ok=True)
+    return path, build_ragged(archives[0], path)
+
+
+def _window(store, start, end):
+    from ragged_igra import find_soundings
+
+    if 'idate' not in store['hdr']:
+        return slice(0, 0)
+    return find_soundings(store, start, end)
+
+
+def _lazy(paths, rows, time_chunk, group, name, nlevel=None):
+    """ dask array (station, time[, level]) of one column, one task per station and time chunk """
+    import dask
+    import dask.array as da
+    import numpy as np
+
+    load = dask.delayed(_load_block, pure=True)
+    blocks = []
+    for path, station_rows in zip(paths, rows):
+        row = []
+        for t0 in range(0, rows.shape[1], time_chunk):
+            chunk_rows = station_rows[t0:t0 + time_chunk]
+            shape = (1, chunk_rows.size) if nlevel is None else (1, chunk_rows.size, nlevel)
+            row.append(da.from_delayed(load(path, group, name, chunk_rows, nlevel), shape=shape,
+                                       dtype=np.float32))
+        blocks.append(da.concatenate(row, axis=1) if row else
+                      da.zeros((1, 0) if nlevel is None else (1, 0, nlevel), dtype=np.float32))
+    if not blocks:
+        return da.zeros((0,) + rows.shape[1:] + (() if nlevel is None else (nlevel,)), dtype=np.float32)
+    return da.concatenate(blocks, axis=0)
+
+
+def _load_block(path, group, name, rows, nlevel=None):
+    """ One chunk of a column: header rows (or padded levels of the header rows), -1 rows are NaN """
+    import numpy as np
+    from process_igra import _mask_missing, _DRVD_HEADER_MISSING, _DRVD_HEADER_SCALE, _DRVD_LEVEL_MISSING
+    from ragged_igra import open_ragged
+
+    store = open_ragged(path)
+    valid = rows >= 0
+    if nlevel is None:
+        out = np.full((1, rows.size), np.nan, dtype=np.float32)
+        if valid.any():
+            values = _mask_missing(np.asarray(store['hdr'][name][rows[valid]]), _DRVD_HEADER_MISSING, dtype='float32')
+            if name in _DRVD_HEADER_SCALE:
+                values /= np.float32(_DRVD_HEADER_SCALE[name])
+            out[0, valid] = values
+        return out
+
+    out = np.full((1, rows.size, nlevel), np.nan, dtype=np.float32)
+    if valid.any():
+        offset = np.asarray(store['hdr']['offset'][rows[valid]])
+        count = np.minimum(np.asarray(store['hdr']['count'][rows[valid]]), nlevel)
+        # positions of the levels in the store and in the padded block
+        take = np.repeat(offset, count) + np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+        where = np.repeat(np.flatnonzero(valid), count)
+        level = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+        out[0, where, level] = _mask_missing(np.asarray(store['lvl'][name][take]), _DRVD_LEVEL_MISSING,
+                                             dtype='float32')
+    return out
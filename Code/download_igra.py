@@ -0,0 +1,216 @@
+__all__ = ['fetch', 'fetch_many', 'download_stations', 'station_url']
+
+# Download manager for IGRA archives
+#
+# Files are downloaded to <file>.part and renamed when complete, so a broken
+# download never leaves a truncated zip under the final name. The ETag and
+# Last-Modified of every download are kept in a <file>.http sidecar and sent
+# back as If-None-Match / If-Modified-Since, so unchanged archives are skipped.
+# A left over .part file is resumed with a Range request.
+
+DERIVED_SERVER = 'https://www1.ncdc.noaa.gov/pub/data/igra/derived/derived-por/'
+DATA_SERVER = 'https://www1.ncdc.noaa.gov/pub/data/igra/data/data-por/'
+
+
+def station_url(ident, kind='drvd', server=None):
+    """ URL and file name of a station archive
+    Args:
+        ident (str): IGRA ID
+        kind (str): 'drvd' derived parameters or 'data' sounding data
+        server (str): download url (default NOAA derived-por or data-por)
+    Returns:
+        str : url
+        str : file name
+    """
+    if kind not in ('drvd', 'data'):
+        raise ValueError("kind must be 'drvd' or 'data'")
+    if server is None:
+        server = DERIVED_SERVER if kind == 'drvd' else DATA_SERVER
+    name = '%s-%s.txt.zip' % (ident, kind)
+    return "%s/%s" % (server.rstrip('/'), name), name
+
+
+def fetch(url, filename, force=False, retries=3, backoff=1., timeout=60, blocksize=1 << 20, verbose=1):
+    """ Download url to filename if the remote file changed
+    Args:
+        url (str): source
+        filename (str): destination
+        force (bool): download without the conditional headers
+        retries (int): attempts after the first failure
+        backoff (float): seconds before the first retry, doubled for every further retry
+        timeout (float): socket timeout in seconds
+        blocksize (int): bytes per read
+        verbose (int): verboseness
+    Returns:
+        str : 'downloaded' or 'not-modified'
+    Raises:
+        Exception : error of the last attempt if all attempts failed
+    """
+    import http.client
+    import os
+    import time
+    import urllib.error
+    from timing_igra import stage
+
+    for attempt in range(retries + 1):
+        try:
+            with stage('download', attempt=attempt) as timed:
+                status = _fetch_once(url, filename, force, timeout, blocksize)
+                timed.add(bytes=os.path.getsize(filename) if status == 'downloaded' else 0)
+            _message(status, url, '->', filename, verbose=verbose)
+            return status
+        except urllib.error.HTTPError as e:
+            # client errors (missing station) do not get better by retrying
+            if 400 <= e.code < 500 and e.code not in (408, 429):
+                raise
+            error = e
+        except (urllib.error.URLError, http.client.HTTPException, OSError, ValueError) as e:
+            error = e
+        if attempt < retries:
+            _message('retry', url, '(%s)' % error, verbose=verbose)
+            time.sleep(backoff * 2 ** attempt)
+    raise error
+
+
+def fetch_many(jobs, max_workers=4, **kwargs):
+    """ Download several files with a bounded thread pool
+    Args:
+        jobs (list): (url, filename) pairs
+        max_workers (int): number of concurrent downloads
+        **kwargs: passed to fetch
+    Returns:
+        dict : filename -> 'downloaded', 'not-modified' or the exception of a failed download
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(fetch, url, filename, **kwargs): filename for url, filename in jobs}
+        for future, filename in futures.items():
+            try:
+                results[filename] = future.result()
+            except Exception as e:
+                results[filename] = e
+    return results
+
+
+def download_stations(idents, directory, kind='drvd', server=None, update=True, max_workers=4, **kwargs):
+    """ Download the archives of several stations
+    Args:
+        idents (list): IGRA IDs
+        directory (str): output directory
+        kind (str): 'drvd' derived parameters or 'data' sounding data
+        server (str): download url
+        update (bool): check existing archives for a newer version, otherwise only missing archives are downloaded
+        max_workers (int): number of concurrent downloads
+        **kwargs: passed to fetch
+    Returns:
+        dict : filename -> 'downloaded', 'not-modified', 'exists' or the exception of a failed download
+    """
+    import os
+
+    os.makedirs(directory, exist_ok=True)
+    jobs, results = [], {}
+    for ident in idents:
+        url, name = station_url(ident, kind=kind, server=server)
+        filename = os.path.join(directory, name)
+        if not update and os.path.isfile(filename):
+            results[filename] = 'exists'
+        else:
+            jobs.append((url, filename))
+    results.update(fetch_many(jobs, max_workers=max_workers, **kwargs))
+    return results
+
+
+def _fetch_once(url, filename, force, timeout, blocksize):
+    """ One download attempt, resumes filename.part if it exists """
+    import os
+    import urllib.error
+    import urllib.request
+
+    part = filename + '.part'
+    info = _read_info(filename) if os.path.isfile(filename) and not force else {}
+    offset = os.path.getsize(part) if os.path.isfile(part) else 0
+    partinfo = _read_info(part) if offset else {}
+
+    request = urllib.request.Request(url)
+    if info.get('etag'):
+        request.add_header('If-None-Match', info['etag'])
+    if info.get('last_modified'):
+        request.add_header('If-Modified-Since', info['last_modified'])
+    if offset:
+        request.add_header('Range', 'bytes=%d-' % offset)
+        # only append if the remote file is still the one the part belongs to
+        validator = partinfo.get('etag') or partinfo.get('last_modified')
+        if validator:
+            request.add_header('If-Range', validator)
+
+    try:
+        response = urllib.request.urlopen(request, timeout=timeout)
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return 'not-modified'
+        if e.code == 416 and offset:
+            # part does not match the remote file anymore
+            _remove(part, part + '.http')
+        raise
+
+    with response:
+        resumed = offset and response.status == 206
+        info = {'url': url, 'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified')}
+        length = response.headers.get('Content-Length')
+        expected = (offset if resumed else 0) + int(length) if length is not None else None
+        _write_info(part, info)
+        with open(part, 'ab' if resumed else 'wb') as f:
+            for block in iter(lambda: response.read(blocksize), b''):
+                f.write(block)
+
+    size = os.path.getsize(part)
+    if expected is not None and size != expected:
+        raise ValueError("Incomplete download %s: %d of %d bytes" % (url, size, expected))
+    if filename.endswith('.zip'):
+        import zipfile
+        if not zipfile.is_zipfile(part):
+            _remove(part, part + '.http')
+            raise ValueError("Not a zip file: %s" % url)
+
+    os.replace(part, filename)
+    _write_info(filename, info)
+    _remove(part + '.http')
+    return 'downloaded'
+
+
+def _read_info(filename):
+    import json
+
+    try:
+        with open(filename + '.http') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_info(filename, info):
+    import json
+    import os
+
+    tmp = '%s.http.%d.tmp' % (filename, os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(info, f)
+    os.replace(tmp, filename + '.http')
+
+
+def _remove(*paths):
+    import os
+
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _message(*args, verbose=1):
+    if verbose > 0:
+        print(*args)
@@ -1,50 +1,72 @@
-__all__ = ['download_derived',  'save_profiles', 'save_derived', 'ascii_to_dataframe']
+__all__ = ['download_derived',  'save_profiles', 'save_derived', 'ascii_to_dataframe', 'iter_soundings', 'iter_chunks',
+           'por_to_dataframe']
 
-def download_derived(ident, directory, server=None, verbose=1):
+def download_derived(ident, directory, server=None, verbose=1, force=False):
     """ Download IGRAv2 Station from NOAA
     Args:
         ident (str): IGRA ID
         directory (str): output directory
         server (str): download url
         verbose (int): verboseness
+        force (bool): download even if the remote file did not change
+    Returns:
+        str : 'downloaded' or 'not-modified'
     """
-    import urllib
     import os
-    from igra.support import message
+    from download_igra import fetch, station_url
 
     os.makedirs(directory, exist_ok=True)
-    if server is None:
-        server = 'https://www1.ncdc.noaa.gov/pub/data/igra/derived/derived-por/'
-    url = "%s/%s-drvd.txt.zip" % (server, ident)
-    message(url, ' to ', directory + '/%s-drvd.txt.zip' % ident, verbose=verbose)
-
-    urllib.request.urlretrieve(url, directory + '/%s-drvd.txt.zip' % ident)
-
-    if os.path.isfile(directory + '/%s-drvd.txt.zip' % ident):
-        message("Downloaded: ", directory + '/%s-drvd.txt.zip' % ident, verbose=verbose)
-    else:
-        message("File not found: ", directory + '/%s-drvd.txt.zip' % ident, verbose=verbose)
+    url, name = station_url(ident, kind='drvd', server=server)
+    return fetch(url, os.path.join(directory, name), force=force, verbose=verbose)
 
-def save_profiles(stations, data_path,start_time, end_time, server='https://www1.ncdc.noaa.gov/pub/data/igra/data/data-por/', force_download = False):
-    import igra # https://github.com/MBlaschek/igra/blob/master/igra  # installed via: pip install igra
+def save_profiles(stations, data_path,start_time, end_time, server='https://www1.ncdc.noaa.gov/pub/data/igra/data/data-por/', force_download = False, cache_dir=None, max_workers=4, processes=1, split_years=None, output='csv', incremental=False, verbose=1, resume=False, writers=0):
+    """ Download IGRA data-por archives and write one CSV per sounding into data_path/<station name>
+    Args:
+        stations (dict): station name -> IGRA ID, or a station DataFrame of catalog_igra.find_stations
+        data_path (str): data directory
+        start_time (Timestamp): first day
+        end_time (Timestamp): last day
+        server (str): download url
+        force_download (bool): download archives again if they changed on the server
+        cache_dir (str): directory of the parsed-data cache (see cache_igra)
+        max_workers (int): number of concurrent downloads
+        processes (int): number of worker processes, 1 runs in this process, None uses all cores
+        split_years (int): split every station into tasks of this many years (default one task per station)
+        output (str): 'csv' one file per sounding, 'store' one HDF5 store per station (or station-year)
+                      data_path/<station name>/<id>_<start>to<end>.h5, see store_igra
+        incremental (bool): only process soundings newer than the last sounding of the previous run
+                            (recorded per station and output) and append them to the existing outputs
+        verbose (int): 1 prints every sounding, 0 only the stations (see timing_igra for timings)
+        resume (bool): skip the soundings and outputs a previous run (resumed or not, e.g. crashed) completed from
+                       the same archive, as recorded in data_path/<station name>/.igra_manifest by every run;
+                       failed tasks do not stop the other tasks and are retried by the next resumed run; logs
+                       are only written if there is work
+        writers (int): CSV output: number of background threads formatting and writing the files while the
+                       archive is parsed block by block (bounded queue), 0 writes every file in turn after parsing
+    """
+    import functools
+    import cache_igra
+    from download_igra import download_stations
     import pandas as pd
     import glob
     import os
-    import datetime
-    import sys
 
-    os.chdir(data_path)
+    if output not in ('csv', 'store'):
+        raise ValueError("output must be 'csv' or 'store'")
+    if not isinstance(stations, dict):
+        from catalog_igra import station_names
+        stations = station_names(stations)
 
     current_time = pd.to_datetime("now").strftime('%Y%m%d_%H%M%S')
-    tolerance = pd.to_timedelta('5 min')
 
     # try to find station_list in data directory
     # if not found download
-    sl = glob.glob('station_list*.txt')
+    sl = sorted(glob.glob(os.path.join(data_path, 'station_list*.txt')))
     if not(sl):
+        import igra # https://github.com/MBlaschek/igra/blob/master/igra  # installed via: pip install igra
         station_list = igra.download.stationlist(data_path)
         #station_list
-        station_list.to_csv('station_list_' + current_time + '.txt')
+        station_list.to_csv(os.path.join(data_path, 'station_list_' + current_time + '.txt'))
     else:
         station_list = pd.read_csv(sl[-1],index_col='id')
 
@@ -54,110 +76,472 @@ def save_profiles(stations, data_path,start_time, end_time, server='https://www1
                                                                              'end': 'record_end'})
     processed_stations['start']=start_time.strftime('%Y%m%d')
     processed_stations['end']=end_time.strftime('%Y%m%d')
-    logfile = 'ExtractedProfiles' + current_time + '.csv'
-    processed_stations.to_csv(logfile)
+    logfile = os.path.join(data_path, 'ExtractedProfiles' + current_time + '.csv')
+    if not resume:
+        processed_stations.to_csv(logfile)
 
-    data_path = [data_path]
-    
-    # now loop over files and extract profiles 
-    for name, id in stations.items():
-        f  = [id + '*.zip']
-        d = os.sep.join(data_path + f)
+    # download missing archives concurrently, with force_download only archives changed on the server
+    downloaded = download_stations(stations.values(), data_path, kind='data', server=server,
+                                   update=force_download, max_workers=max_workers)
 
-        if not os.path.exists(name):
-            os.mkdir(name)
+    tasks, log_names = [], {}
+    for name, id in stations.items():
+        os.makedirs(os.path.join(data_path, name), exist_ok=True)
 
-        #print(name, id)
-        if (not(glob.glob(d)) or force_download) :
+        status = downloaded[os.path.join(data_path, id + '-data.txt.zip')]
+        if isinstance(status, Exception):
+            raise status
+        if status == 'downloaded':
             print(id)
-            igra.download.station(id,data_path[0],server = server)
-            log_name = os.sep.join(data_path + [name] + ['DownloadedIGRA_' + current_time + '.csv'])
+            log_name = os.path.join(data_path, name, 'DownloadedIGRA_' + current_time + '.csv')
 
             #processed_stations.loc[id].to_frame.to_csv(log_name)
             with open(log_name,'a') as f:
                  f.write(f"{' '.join([name,id])}\n")
 
-        log_name = os.sep.join(data_path + [name] + ['ExtractedProfiles_' + pd.to_datetime("now").strftime('%Y%m%d_%H%M%S') + '.csv'])
-        processed_stations.loc[id].to_csv(log_name)
+        log_names[id] = os.path.join(data_path, name, 'ExtractedProfiles_' + current_time + '.csv')
+        if not resume:
+            processed_stations.loc[id].to_csv(log_names[id])
+
+        filename = glob.glob(os.path.join(data_path, id + '*.zip'))[0]
+        state = _read_state(data_path, name) if incremental else {}
+        # every run records its work in the manifest, a resumed run skips it; records of an older
+        # archive, and of the outputs a run that is not resumed writes again, are dropped
+        checksum = cache_igra.fingerprint(filename, cache_dir)
+        windows = _year_windows(start_time, end_time, split_years)
+        _prune_manifest(data_path, name, checksum,
+                        () if resume else [_profiles_output(id, start, end, output) for start, end in windows])
+        for start, end in windows:
+            key = _profiles_output(id, start, end, output)
+            since = state.get(key)
+            # outputs deleted or moved since the last run are written again
+            if since is not None:
+                last = key if output == 'store' else id + '_' + since.strftime('%Y%m%d_%H') + 'Z.csv'
+                if not os.path.isfile(os.path.join(data_path, name, last)):
+                    since = None
+            tasks.append((name, id, filename, data_path, start, end, cache_dir, output, since, verbose, checksum,
+                          writers, resume))
+
+    # merge the logs of the tasks in station and time order
+    func = functools.partial(_catch_errors, _save_station_profiles) if resume else _save_station_profiles
+    profiles = dict.fromkeys(stations.values(), 0)
+    failed = []
+    for task, times in zip(tasks, _run_tasks(func, tasks, processes)):
+        name, id, _, _, start, end = task[:6]
+        if isinstance(times, Exception):
+            failed.append('%s %s to %s: %r' % (name, start.strftime('%Y%m%d'), end.strftime('%Y%m%d'), times))
+            continue
+        if resume and len(times) and not os.path.isfile(log_names[id]):
+            processed_stations.loc[id].to_csv(log_names[id])
+        if not resume or len(times):
+            with open(log_names[id],'a') as f:
+                for time in times:
+                     f.write(f"{'_'.join([name,time.strftime('%Y%m%d_%H')])}\n")
+        profiles[id] += len(times)
+        if incremental and len(times):
+            _update_state(data_path, name, _profiles_output(id, start, end, output), max(times))
+
+    processed_stations['profiles'] = pd.Series(profiles)
+    if not resume or failed or any(profiles.values()):
+        processed_stations.to_csv(logfile)
+    if failed:
+        raise RuntimeError("%d of %d tasks failed, run again with resume=True to retry them:\n%s"
+                           % (len(failed), len(tasks), '\n'.join(failed)))
+
+
+def _save_station_profiles(name, id, filename, data_path, start_time, end_time, cache_dir=None, output='csv', since=None, verbose=1,
+                           checksum=None, writers=0, resume=False):
+    """ Write the soundings of one station between start_time and end_time (whole day) to CSV files or a store,
+    only soundings after since (appended to the store), with the checksum of the archive the soundings and
+    outputs are recorded in the manifest as they are written (resume: only those not in it yet are written),
+    CSV files by writers background threads
+    Returns:
+        list : times of the written soundings
+    """
+    import contextlib
+    import pandas as pd
+    import os
+    from store_igra import station_tables, write_store, append_store, export_profiles, export_stream
 
-        # now loop over days 
-        #print(glob.glob(d)[0])
-        df, headers = igra.read.ascii_to_dataframe(glob.glob(d)[0],all_columns=True)
+    tolerance = pd.to_timedelta('5 min')
+    key = _profiles_output(id, start_time, end_time, output)
+    done = set()
+    if resume and checksum is not None:
+        done = _read_manifest(data_path, name, key, checksum)
+        if _MANIFEST_COMPLETE in done:
+            return []
+
+    # only the soundings of the window (after since) are parsed, non-pressure levels
+    # (ltyp1 == 3) are dropped while parsing
+    first = start_time if since is None else max(start_time, since + pd.to_timedelta(1, 'ns'))
+    last = end_time + pd.to_timedelta('23 h')
+    out_dir = os.path.join(data_path, name)
+
+    with (_open_manifest(data_path, name) if checksum is not None else contextlib.nullcontext()) as manifest:
+        written = None if manifest is None else (lambda time_str: _record(manifest, key, checksum, time_str))
+        if writers and output == 'csv':
+            # the archive is parsed block by block while the writer threads write the soundings of earlier blocks
+            soundings = []
+
+            def tables():
+                for df, headers in _iter_por(filename, cache_dir, first, last, exclude_ltyp1=3):
+                    pending = _pending(headers.index, done)
+                    soundings.extend(pending)
+                    yield station_tables(df, headers, pending, tolerance)
+
+            export_stream(tables(), out_dir, name, id, writers=writers, verbose=verbose, written=written)
+        else:
+            df, headers = _read_por(filename, cache_dir, start=first, end=last, exclude_ltyp1=3)
+
+            # get list of all soundings 
+            soundings = _pending(headers.index, done)
+
+            # drop the levels once and locate every sounding by binary search on the sorted times,
+            # so each sounding is a slice instead of a mask over all levels
+            tables = station_tables(df, headers, soundings, tolerance)
+
+            if output == 'store':
+                out = os.path.join(out_dir, key)
+                print(out)
+                if since is None:
+                    write_store(out, *tables)
+                elif len(soundings):
+                    append_store(out, *tables)
+            else:
+                export_profiles(*tables, out_dir, name, id, verbose=verbose, written=written)
+        if manifest is not None:
+            _record(manifest, key, checksum, _MANIFEST_COMPLETE)
+            os.fsync(manifest.fileno())
+    return list(soundings)
 
-        # get list of all soundings 
-        soundings = headers[start_time:end_time+pd.to_timedelta('23 h')].index.strftime('%Y-%m-%d %H').to_list()
-        soundings = headers[start_time:end_time+pd.to_timedelta('23 h')].index
 
-        # now loop over headers and get 
-        for sounding in soundings:
-            time_str = sounding.strftime('%Y%m%d_%H')
-            print(name + time_str)
-            f = [id +  '_' + time_str + 'Z.csv']
-            out = os.sep.join(data_path + [name] + f)
+def _pending(soundings, done):
+    """ Soundings whose time string is not in done """
+    if not done:
+        return soundings
+    return soundings[~soundings.strftime('%Y%m%d_%H').isin(done)]
 
-            # add tolerance for key 
 
-            with open(out,'w') as f:
-                f.write(f"{','.join([name,id])}\n")
-                headers[sounding-tolerance : sounding+tolerance].iloc[0,1:].to_csv(f, mode='a', header=False,index=True,line_terminator='\n')       
-                df.loc[(df.index > sounding-tolerance) & (df.index < sounding+tolerance) & (df.ltyp1 !=3)].to_csv(f, mode='a', header=True, index=False,line_terminator='\n')
+def _profiles_output(id, start_time, end_time, output):
+    """ Output of save_profiles for a station and time window: store file name, or key of the CSV files """
+    timestr = start_time.strftime('%Y%m%d') + 'to' + end_time.strftime('%Y%m%d')
+    if output == 'store':
+        return id + '_' + timestr + '.h5'
+    return id + '_' + timestr + '_csv'
 
-            with open(log_name,'a') as f:
-                 f.write(f"{'_'.join([name,time_str])}\n")
 
-def save_derived(stations, data_path, derived_path, start_time, end_time, force_download = False):
-    import pandas as pd
+def _sounding_offsets(df, headers, soundings, tolerance):
+    """ Locate soundings in the level and header tables of por_to_dataframe
+    Args:
+        df (DataFrame): levels with the sounding time as index
+        headers (DataFrame): headers with the sounding time as index
+        soundings (DatetimeIndex): sounding times
+        tolerance (Timedelta): time tolerance of the match
+    Returns:
+        DataFrame : levels sorted by time without ltyp1 == 3 (non-standard pressure levels)
+        ndarray : first level row of every sounding, levels with time > sounding - tolerance
+        ndarray : end level row of every sounding, levels with time < sounding + tolerance
+        ndarray : header row of every sounding, first header with time >= sounding - tolerance
+    """
+    levels = df.loc[df.ltyp1.values != 3]
+    if not levels.index.is_monotonic_increasing:
+        levels = levels.sort_index(kind='stable')
+    if not headers.index.is_monotonic_increasing:
+        raise ValueError("headers are not sorted by time")
+    first = levels.index.searchsorted(soundings - tolerance, side='right')
+    last = levels.index.searchsorted(soundings + tolerance, side='left')
+    rows = headers.index.searchsorted(soundings - tolerance, side='left')
+    return levels, first, last, rows
+
+
+def save_derived(stations, data_path, derived_path, start_time, end_time, force_download = False, cache_dir=None, max_workers=4, processes=1, server=None, incremental=False):
+    """ Download IGRA derived-por archives and write the derived parameters of 00Z and 12Z soundings
+    into data_path/<station name>/Derived_<id>_<start>to<end>_<hour>Z.csv
+    Args:
+        stations (dict): station name -> IGRA ID, or a station DataFrame of catalog_igra.find_stations
+        data_path (str): output directory
+        derived_path (str): directory of the derived archives
+        start_time (Timestamp): first day
+        end_time (Timestamp): last day
+        force_download (bool): download archives again if they changed on the server
+        cache_dir (str): directory of the parsed-data cache (see cache_igra)
+        max_workers (int): number of concurrent downloads
+        processes (int): number of worker processes, 1 runs in this process, None uses all cores
+        server (str): download url (default NOAA derived-por)
+        incremental (bool): only parse soundings newer than the last sounding of the previous run
+                            (recorded per station and output) and append them to the existing CSV files
+    """
     import glob
     import os
-    import datetime
-    from process_igra import download_derived as download
-    from process_igra import ascii_to_dataframe
+    from download_igra import download_stations
     
+    if not isinstance(stations, dict):
+        from catalog_igra import station_names
+        stations = station_names(stations)
     print(data_path)
-    os.chdir(data_path)
 
-    current_time = pd.to_datetime("now").strftime('%Y%m%d_%H%M%S')
-    tolerance = pd.to_timedelta('5 min')
-    
-    derived_path = [derived_path]
-    
-    # loop over stations and download/read ascii to pandas df
+    # download missing archives concurrently, with force_download only archives changed on the server
+    downloaded = download_stations(stations.values(), derived_path, kind='drvd', server=server,
+                                   update=force_download, max_workers=max_workers)
+
+    tasks = []
     for name, id in stations.items():
-        # check if file exists or has to be downloaded 
-        f  = [id + '*.zip']
-        d = os.sep.join(derived_path + f)
+        d = os.path.join(derived_path, id + '*.zip')
         print(glob.glob(d))
-        if (not(glob.glob(d)) or force_download):
-            download(id,derived_path[0])
-        
-        headers, _ = ascii_to_dataframe(glob.glob(d)[0], get_levels=False)
-        
-        # subset time
-        headers = headers.loc[start_time:end_time+pd.to_timedelta('23 h')]
-        #  save to csv and pickle separate for 00Z and 12Z soundings 
-        timestr = start_time.strftime('%Y%m%d') + 'to' + end_time.strftime('%Y%m%d')
-        
-        # get hours to separate into 00Zand 12Z
-        times= headers.index.hour
-        headers.insert(0,column= 'hour', value=times)
-        headers.index = headers.index.floor('D')
-
-        # 00Z      
-        f = ['Derived_' + id +  '_' + timestr + '_00Z.csv']
-        out = os.sep.join([data_path] + [name] + f)
+        status = downloaded[os.path.join(derived_path, id + '-drvd.txt.zip')]
+        if isinstance(status, Exception):
+            raise status
+        since = None
+        if incremental:
+            outs = _derived_outputs(data_path, name, id, start_time, end_time)
+            if all(os.path.isfile(out) for out in outs):
+                since = _read_state(data_path, name).get(os.path.basename(outs[0]))
+        tasks.append((name, id, glob.glob(d)[0], data_path, start_time, end_time, cache_dir, since))
+
+    for task, times in zip(tasks, _run_tasks(_save_station_derived, tasks, processes)):
+        name, id = task[:2]
+        if incremental and len(times):
+            out = _derived_outputs(data_path, name, id, start_time, end_time)[0]
+            _update_state(data_path, name, os.path.basename(out), times.max())
+
+
+def _save_station_derived(name, id, filename, data_path, start_time, end_time, cache_dir=None, since=None):
+    """ Write the 00Z and 12Z derived parameters of one station, only soundings after since
+    (appended to the existing files)
+    Returns:
+        DatetimeIndex : times of the processed soundings
+    """
+    import pandas as pd
+    import os
+    from process_igra import ascii_to_dataframe, iter_chunks
+    from timing_igra import stage
+
+    # first sounding to parse
+    first = start_time if since is None else max(start_time, since + pd.to_timedelta(1, 'ns'))
+
+    # subset time while parsing, stream the file so only the headers are kept in memory
+    # with a cache the whole file is parsed once and the window is cut from the cached arrays
+    if cache_dir is not None:
+        chunks = [ascii_to_dataframe(filename, get_levels=False, start=first,
+                                     end=end_time+pd.to_timedelta('23 h'), cache_dir=cache_dir)[0]]
+    else:
+        chunks = [h for h, _ in iter_chunks(filename, chunksize=10000, get_levels=False,
+                                            start=first, end=end_time+pd.to_timedelta('23 h'))]
+    if chunks:
+        headers = pd.concat(chunks)
+    else:
+        headers, _ = ascii_to_dataframe(filename, get_levels=False, start=first, end=first)
+    #  save to csv and pickle separate for 00Z and 12Z soundings 
+    processed = headers.index
+    
+    # get hours to separate into 00Zand 12Z
+    times= headers.index.hour
+    headers.insert(0,column= 'hour', value=times)
+    headers.index = headers.index.floor('D')
+
+    os.makedirs(os.path.join(data_path, name), exist_ok=True)
+    for hour, out in zip([0, 12], _derived_outputs(data_path, name, id, start_time, end_time)):
         print(out)
-        headers.loc[times==0].to_csv(out,na_rep='NaN',index_label='date') 
-        
-        # 12      
-        f = ['Derived_' + id +  '_' + timestr + '_12Z.csv']
-        out = os.sep.join([data_path] + [name] + f)
-        headers.loc[times==12].to_csv(out,na_rep='NaN',index_label='date')     
+        with stage('write', rows=int((times==hour).sum()), files=1):
+            if since is None:
+                headers.loc[times==hour].to_csv(out,na_rep='NaN',index_label='date')
+            else:
+                headers.loc[times==hour].to_csv(out,na_rep='NaN',mode='a',header=False)
+    return processed
+
+
+def _derived_outputs(data_path, name, id, start_time, end_time):
+    """ 00Z and 12Z CSV files of save_derived """
+    import os
+
+    timestr = start_time.strftime('%Y%m%d') + 'to' + end_time.strftime('%Y%m%d')
+    return [os.path.join(data_path, name, 'Derived_' + id +  '_' + timestr + '_%02dZ.csv' % hour)
+            for hour in [0, 12]]
+
+
+# state of incremental runs: data_path/<station name>/.igra_state.json,
+# output name -> time of the last processed sounding
+_STATE_FILE = '.igra_state.json'
+
+
+def _read_state(data_path, name):
+    """ Last processed sounding per output of a station """
+    import json
+    import os
+    import pandas as pd
+
+    try:
+        with open(os.path.join(data_path, name, _STATE_FILE)) as f:
+            return {key: pd.Timestamp(value) for key, value in json.load(f).items()}
+    except (OSError, ValueError):
+        return {}
+
+
+def _update_state(data_path, name, key, time):
+    """ Record the last processed sounding of an output (atomic rewrite) """
+    import json
+    import os
+
+    state = _read_state(data_path, name)
+    state[key] = max(time, state[key]) if key in state else time
+    path = os.path.join(data_path, name, _STATE_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump({key: value.isoformat() for key, value in state.items()}, f)
+    os.replace(path + '.tmp', path)
 
-def ascii_to_dataframe(filename, get_levels=False, **kwargs):
+
+# manifest of save_profiles: data_path/<station name>/.igra_manifest, one line
+# '<output>\t<sha1 of the archive>\t<YYYYmmdd_HH>' per written sounding and
+# '<output>\t<sha1>\t*' per completed output, appended while the work is done,
+# so a crashed run leaves the record of what it finished
+_MANIFEST_FILE = '.igra_manifest'
+_MANIFEST_COMPLETE = '*'
+
+
+def _read_manifest(data_path, name, key, checksum):
+    """ Completed soundings (time strings, _MANIFEST_COMPLETE if the whole output) of an output from this archive """
+    import os
+
+    done = set()
+    try:
+        with open(os.path.join(data_path, name, _MANIFEST_FILE)) as f:
+            for line in f:
+                fields = line.rstrip('\n').split('\t')
+                # the last line of a crashed run may be cut off
+                if line.endswith('\n') and len(fields) == 3 and fields[0] == key and fields[1] == checksum:
+                    done.add(fields[2])
+    except OSError:
+        pass
+    return done
+
+
+def _prune_manifest(data_path, name, checksum, keys=()):
+    """ Drop the records of other archives and of the outputs keys from the manifest of a station (atomic rewrite) """
+    import os
+
+    path = os.path.join(data_path, name, _MANIFEST_FILE)
+    try:
+        with open(path) as f:
+            lines = f.readlines()
+    except OSError:
+        return
+    keys = set(keys)
+    keep = [line for line in lines if line.endswith('\n') and line.split('\t')[1:2] == [checksum]
+            and line.split('\t')[0] not in keys]
+    if len(keep) < len(lines):
+        with open(path + '.tmp', 'w') as f:
+            f.writelines(keep)
+        os.replace(path + '.tmp', path)
+
+
+def _open_manifest(data_path, name):
+    import os
+
+    return open(os.path.join(data_path, name, _MANIFEST_FILE), 'a')
+
+
+def _record(manifest, key, checksum, item):
+    """ Append a completed sounding or output to an open manifest, one write per line """
+    manifest.write('%s\t%s\t%s\n' % (key, checksum, item))
+    manifest.flush()
+
+
+def _catch_errors(func, *args):
+    """ func(*args), or the exception it raised """
+    try:
+        return func(*args)
+    except Exception as e:
+        return e
+
+
+def _year_windows(start_time, end_time, years=None):
+    """ Split [start_time, end_time] (days) into consecutive windows of years """
+    import pandas as pd
+
+    if not years:
+        return [(start_time, end_time)]
+    windows = []
+    start = start_time
+    while start <= end_time:
+        following = start + pd.DateOffset(years=years)
+        windows.append((start, min(following - pd.to_timedelta('1 D'), end_time)))
+        start = following
+    return windows
+
+
+def _run_tasks(func, tasks, processes=1):
+    """ Results of func(*task) for all tasks in task order, in a process pool if processes != 1 """
+    if processes == 1 or len(tasks) < 2:
+        return [func(*task) for task in tasks]
+
+    from concurrent.futures import ProcessPoolExecutor
+    import timing_igra
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        if not timing_igra._active():
+            futures = [pool.submit(func, *task) for task in tasks]
+            return [future.result() for future in futures]
+
+        # record the stages in the workers and merge them into the recorder of this process
+        futures = [pool.submit(timing_igra._call, func, task) for task in tasks]
+        results = []
+        for future in futures:
+            result, records = future.result()
+            timing_igra._merge(records)
+            results.append(result)
+        return results
+
+
+def _read_por(filename, cache_dir=None, start=None, end=None, exclude_ltyp1=None):
+    """ por_to_dataframe(all_columns=True) of a data-por archive, through the parsed-data cache if cache_dir is set
+    (the whole file is cached, the soundings in [start, end] are selected from it)
+    """
+    if cache_dir is None:
+        return por_to_dataframe(filename, all_columns=True, start=start, end=end, exclude_ltyp1=exclude_ltyp1)
+
+    import cache_igra
+    kind = 'por' if exclude_ltyp1 is None else 'por-ltyp1-%d' % exclude_ltyp1
+    arrays = cache_igra.load(filename, kind, cache_dir)
+    if arrays is not None:
+        df, headers = cache_igra.arrays_to_frames(arrays, 'df'), cache_igra.arrays_to_frames(arrays, 'headers')
+    else:
+        df, headers = por_to_dataframe(filename, all_columns=True, exclude_ltyp1=exclude_ltyp1)
+        cache_igra.store(filename, kind, cache_igra.frames_to_arrays(df=df, headers=headers), cache_dir)
+    if start is None and end is None:
+        return df, headers
+    return df.loc[_in_window(df.index.values, start, end)], headers.loc[_in_window(headers.index.values, start, end)]
+
+
+def _iter_por(filename, cache_dir=None, start=None, end=None, exclude_ltyp1=None, blocksize=None):
+    """ (levels, headers) of _read_por block by block, from the cache (cache_dir set) all at once """
+    import functools
+
+    if cache_dir is not None:
+        yield _read_por(filename, cache_dir, start, end, exclude_ltyp1)
+        return
+    parser = functools.partial(_parse_por, exclude_ltyp1=exclude_ltyp1)
+    for hdr, lvl in _iter_parsed(filename, True, start, end, blocksize, parser=parser):
+        yield _por_to_frames(hdr, lvl, True, missing_float=exclude_ltyp1 is not None)
+
+
+def ascii_to_dataframe(filename, get_levels=False, engine='numpy', start=None, end=None, cache_dir=None, dtype=None, **kwargs):
     """Read IGRA version 2 Data from NOAA
     Args:
         filename (str): Filename
         get_levels(bool): return data for level information --> False only returns header with derived parameters 
+        engine (str): 'numpy' (default) parses whole columns of the fixed-width records at once,
+                      'python' uses the original line-by-line parser
+        start (datetime-like): only soundings at or after start are returned (default: file start)
+        end (datetime-like): only soundings at or before end are returned (default: file end),
+                             level blocks of soundings outside [start, end] are skipped
+        cache_dir (str): directory of the parsed-data cache (see cache_igra), the whole file is
+                         parsed once and loaded from the cache while the archive does not change
+        dtype (str): storage of the numeric columns (numpy engine), None float64 parameters and level columns
+                     whether the soundings read hold missing values or not (numlev int64; the python engine
+                     keeps the dtypes of DataFrame.replace, int64 where a file has no missing value),
+                     'float32' float32 with NaN, 'int' nullable Int16/Int32 scaled integers as in the file
+                     (missing values masked, pw_mm and invtempdif_dC float32), numlev int16 and reltime
+                     categorical for both compact dtypes
     Returns:
         DataFrame : Table of radiosonde soundings with date as index and variables as columns
         DataFrame : Station Information
@@ -412,17 +796,831 @@ def ascii_to_dataframe(filename, get_levels=False, **kwargs):
     --------------------------------------------------------------------------------
     """
 
-    import datetime
-    import gzip
-    import zipfile
     import os
-    import io
+
+    if not os.path.isfile(filename):
+        raise IOError("File not Found! %s" % filename)
+
+    if engine == 'python':
+        headers, out = _ascii_to_dataframe_python(filename, get_levels=get_levels)
+        if start is not None or end is not None:
+            headers = headers[_in_window(headers.index.values, start, end)]
+            if get_levels:
+                out = out[_in_window(out.index.values, start, end)]
+        return headers, out
+    if engine != 'numpy':
+        raise ValueError("Unknown engine: %s (use 'numpy' or 'python')" % engine)
+
+    if cache_dir is not None:
+        hdr, lvl = _select_parsed(*_cached_parse(filename, get_levels, cache_dir), start=start, end=end)
+        return _derived_to_frames(hdr, lvl, dtype=dtype)
+
+    data = _read_archive(filename)
+    hdr, lvl = _parse_derived(data, get_levels=get_levels, start=start, end=end)
+    del data
+    return _derived_to_frames(hdr, lvl, dtype=dtype)
+
+
+def iter_soundings(filename, get_levels=True, start=None, end=None, blocksize=None):
+    """Stream IGRA derived soundings one at a time
+    Args:
+        filename (str): Filename (.zip, .gz or text)
+        get_levels (bool): return the level data as well
+        start, end (datetime-like): only soundings in [start, end] (see ascii_to_dataframe)
+        blocksize (int): bytes of text decompressed and parsed at once
+    Yields:
+        Series : header of the sounding (name is the sounding date), a row of the ascii_to_dataframe headers
+        dict : level variables as float arrays with NaN for missing values (empty if get_levels is False)
+    Info:
+        The file is decompressed block by block, so memory does not grow with the
+        size of the file. Files are in chronological order, reading stops once a
+        sounding after end is reached.
+    """
     import numpy as np
+
+    for hdr, lvl in _iter_parsed(filename, get_levels, start, end, blocksize):
+        headers, out = _derived_to_frames(hdr, lvl)
+        levels = {}
+        if get_levels:
+            offsets = np.searchsorted(lvl['sounding'], np.arange(len(headers) + 1))
+            columns = {name: out[name].to_numpy(dtype=float) for name in _DRVD_LEVEL_COLUMNS}
+        for i in range(len(headers)):
+            if get_levels:
+                levels = {name: values[offsets[i]:offsets[i + 1]] for name, values in columns.items()}
+            yield headers.iloc[i], levels
+
+
+def iter_chunks(filename, chunksize=1000, get_levels=True, start=None, end=None, blocksize=None, dtype=None):
+    """Stream IGRA derived soundings in chunks of DataFrames
+    Args:
+        filename (str): Filename (.zip, .gz or text)
+        chunksize (int): number of soundings per chunk
+        get_levels (bool): return the level data as well
+        start, end (datetime-like): only soundings in [start, end] (see ascii_to_dataframe)
+        blocksize (int): bytes of text decompressed and parsed at once
+        dtype (str): storage of the numeric columns (see ascii_to_dataframe)
+    Yields:
+        DataFrame : headers of up to chunksize soundings, as returned by ascii_to_dataframe
+        DataFrame : levels of these soundings (empty list if get_levels is False)
+    """
+    pending = []
+    count = 0
+    for parsed in _iter_parsed(filename, get_levels, start, end, blocksize):
+        pending.append(parsed)
+        count += parsed[0]['idate'].size
+        while count >= chunksize:
+            hdr, lvl = _concat_parsed(pending)
+            yield _derived_to_frames(*_slice_parsed(hdr, lvl, 0, chunksize), dtype=dtype)
+            pending = [_slice_parsed(hdr, lvl, chunksize, count)]
+            count -= chunksize
+
+    if count:
+        yield _derived_to_frames(*_concat_parsed(pending), dtype=dtype)
+
+
+def por_to_dataframe(filename, all_columns=False, start=None, end=None, exclude_ltyp1=None):
+    """ Read an IGRA version 2 sounding data file (data-por / data-y2d), the frames of igra.read.ascii_to_dataframe
+    Args:
+        filename (str): Filename (.zip, .gz or text)
+        all_columns (bool): return all columns (level types, elapsed time, flags, data sources) or just data
+        start (datetime-like): only soundings at or after start (default: file start)
+        end (datetime-like): only soundings at or before end (default: file end), level blocks of soundings
+                             outside [start, end] are skipped
+        exclude_ltyp1 (int): drop the levels of this major level type while parsing
+                             (3 = non-pressure levels, as save_profiles does), the data columns are then
+                             float64 whether or not the dropped levels held missing values
+    Returns:
+        DataFrame : levels with the sounding date as index, temp (C), rhumi (%), dpd (C) and winds (m/s) in
+                    units of the file, other columns as integers (float where missing)
+        DataFrame : headers with the sounding date as index: numlev, (p_src, np_src,) lat, lon
+    """
+    hdr, lvl = _parse_por(_read_archive(filename), start, end, exclude_ltyp1)
+    return _por_to_frames(hdr, lvl, all_columns, missing_float=exclude_ltyp1 is not None)
+
+
+def _iter_parsed(filename, get_levels, start, end, blocksize, parser=None):
+    """ Column arrays (see _parse_derived) of the soundings of every block of the file,
+    parser(data, start=, end=) parses the blocks instead of _parse_derived (e.g. _parse_por)
+    """
+    import os
     import pandas as pd
 
     if not os.path.isfile(filename):
         raise IOError("File not Found! %s" % filename)
 
+    from timing_igra import stage
+
+    blocks = _iter_blocks(filename, blocksize or _BLOCK_BYTES)
+    while True:
+        with stage('decompress') as timed:
+            data = next(blocks, None)
+            if data is None:
+                # end of the file, no block
+                timed.discard()
+            else:
+                timed.add(bytes=len(data))
+        if data is None:
+            break
+        if parser is None:
+            hdr, lvl = _parse_derived(data, get_levels=get_levels, start=start, end=end)
+        else:
+            hdr, lvl = parser(data, start=start, end=end)
+        if hdr['idate'].size:
+            yield hdr, lvl
+        if end is not None and _last_header_date(data) > pd.Timestamp(end).to_datetime64():
+            break
+
+
+def _iter_blocks(filename, blocksize):
+    """ Decompress the (first member of the) IGRA file in blocks that end at a sounding boundary """
+    import gzip
+    import zipfile
+
+    if '.zip' in filename:
+        with zipfile.ZipFile(filename, 'r') as archive:
+            with archive.open(archive.namelist()[0]) as stream:
+                yield from _split_blocks(stream, blocksize)
+    elif '.gz' in filename:
+        with gzip.open(filename, 'rb') as stream:
+            yield from _split_blocks(stream, blocksize)
+    else:
+        with open(filename, 'rb') as stream:
+            yield from _split_blocks(stream, blocksize)
+
+
+def _split_blocks(stream, blocksize):
+    """ Read a binary stream in blocks of about blocksize bytes cut before a header record """
+    rest = b''
+    while True:
+        chunk = stream.read(blocksize)
+        if not chunk:
+            break
+        data = rest + chunk
+        cut = data.rfind(b'\n#') + 1
+        if cut > 0:
+            yield data[:cut]
+            rest = data[cut:]
+        else:
+            rest = data  # a sounding longer than blocksize
+    if rest:
+        yield rest
+
+
+def _slice_parsed(hdr, lvl, i0, i1):
+    """ Soundings i0:i1 of parsed column arrays """
+    import numpy as np
+
+    hdr = {name: values[i0:i1] for name, values in hdr.items()}
+    if lvl is not None:
+        l0, l1 = np.searchsorted(lvl['sounding'], [i0, i1])
+        lvl = {name: values[l0:l1] for name, values in lvl.items()}
+        lvl['sounding'] = lvl['sounding'] - i0
+    return hdr, lvl
+
+
+def _concat_parsed(parts):
+    """ Concatenate parsed column arrays of consecutive blocks """
+    import numpy as np
+
+    if len(parts) == 1:
+        return parts[0]
+    hdr = {name: np.concatenate([h[name] for h, _ in parts]) for name in parts[0][0]}
+    if parts[0][1] is None:
+        return hdr, None
+    offsets = np.cumsum([0] + [h['idate'].size for h, _ in parts[:-1]])
+    lvl = {name: np.concatenate([l[name] for _, l in parts]) for name in parts[0][1] if name != 'sounding'}
+    lvl['sounding'] = np.concatenate([l['sounding'] + o for (_, l), o in zip(parts, offsets)])
+    return hdr, lvl
+
+
+# ---------------------------------------------------------------------------
+# Fixed-width parsing engine
+#
+# Field positions are python slices into a line and are kept identical to the
+# original line-by-line parser (see _ascii_to_dataframe_python), so both
+# engines return the same frames.
+# ---------------------------------------------------------------------------
+
+_DRVD_DATE_FIELDS = [('year', 13, 17), ('month', 18, 20), ('day', 21, 23), ('hour', 24, 26)]
+
+_DRVD_HEADER_FIELDS = [('numlev', 32, 36), ('pw', 37, 43), ('invpress', 43, 49), ('invhgt', 49, 55),
+                       ('invtempdif', 55, 61), ('mixpress', 61, 67), ('mixhgt', 67, 73),
+                       ('frzpress', 73, 79), ('frzhgt', 79, 85), ('lclpress', 85, 91),
+                       ('lclhgt', 91, 97), ('lfcpress', 97, 103), ('lfchgt', 103, 109),
+                       ('lnbp', 109, 115), ('lnbhgt', 115, 121), ('li', 121, 127), ('si', 127, 133),
+                       ('ki', 133, 139), ('tti', 139, 145), ('cape', 145, 151), ('cin', 151, 157)]
+
+_DRVD_LEVEL_FIELDS = [('press', 0, 7), ('repgph', 8, 15), ('calcgph', 16, 23), ('temp', 24, 31),
+                      ('tempgrad', 32, 39), ('ptemp', 40, 47), ('ptempgrad', 48, 55), ('vtemp', 56, 63),
+                      ('vptemp', 64, 71), ('vappress', 72, 79), ('satvp', 80, 87), ('reprh', 88, 95),
+                      ('calcrh', 96, 103), ('rhgrad', 104, 111), ('uwnd', 112, 119),
+                      ('uwndgrad', 120, 127), ('vwnd', 128, 135), ('vwndgrad', 136, 143),
+                      ('n', 145, 151)]
+
+_DRVD_HEADER_COLUMNS = ['numlev', 'reltime', 'numlev', 'pw', 'invpress', 'invhgt', 'invtempdif',
+                        'mixpress', 'mixhgt', 'frzpress', 'frzhgt', 'lclpress', 'lclhgt', 'lfcpress',
+                        'lfchgt', 'lnbp', 'lnbhgt', 'li', 'si', 'ki', 'tti', 'cape', 'cin']
+
+_DRVD_LEVEL_COLUMNS = [name for name, _, _ in _DRVD_LEVEL_FIELDS]
+
+# keys of the parsed header arrays (see _parse_derived)
+_DRVD_HEADER_KEYS = [name for name, _, _ in _DRVD_DATE_FIELDS + _DRVD_HEADER_FIELDS] + ['reltime', 'idate']
+
+# known missing values by IGRAv2 (the -999.9/-888.8 of the text files never match integer fields)
+_DRVD_HEADER_MISSING = [-9999, -8888, -99999, -999999]
+
+# scaled header parameters converted to physical units (see _derived_units)
+_DRVD_HEADER_SCALE = {'pw': 100, 'invtempdif': 10}
+_DRVD_HEADER_UNITS = {'pw': 'pw_mm', 'invtempdif': 'invtempdif_dC'}
+_DRVD_LEVEL_MISSING = [-9999, -8888]
+
+# fixed-width fields of the sounding data files (data-por), as read by igra.read.ascii_to_dataframe
+_POR_HEADER_FIELDS = [('numlev', 32, 36), ('lat', 55, 62), ('lon', 63, 71)]
+_POR_HEADER_SOURCES = [('p_src', 37, 45), ('np_src', 46, 54)]
+_POR_LEVEL_FIELDS = [('ltyp2', 1, 2), ('etime', 3, 8), ('pres', 9, 15), ('gph', 16, 21), ('temp', 22, 27),
+                     ('rhumi', 28, 33), ('dpd', 34, 39), ('windd', 40, 45), ('winds', 46, 51)]
+_POR_LEVEL_FLAGS = [('pflag', 15), ('zflag', 21), ('tflag', 27)]
+_POR_LEVEL_COLUMNS = ['ltyp1', 'ltyp2', 'etime', 'pres', 'pflag', 'gph', 'zflag', 'temp', 'tflag', 'rhumi', 'dpd',
+                      'windd', 'winds']
+_POR_DATA_COLUMNS = ['pres', 'gph', 'temp', 'rhumi', 'dpd', 'windd', 'winds']
+_POR_LEVEL_SCALE = {'temp': 10, 'rhumi': 10, 'dpd': 10, 'winds': 10}
+_POR_MISSING = [-9999, -8888]
+
+# number of lines converted at once, bounds the temporary arrays
+_BLOCK_LINES = 1 << 13
+
+# bytes of text decompressed and parsed at once when streaming
+_BLOCK_BYTES = 1 << 22
+
+
+def _read_archive(filename):
+    """ Read the (first member of the) IGRA file as raw bytes """
+    from timing_igra import stage
+
+    with stage('decompress') as timed:
+        data = _read_member(filename)
+        timed.add(bytes=len(data))
+    return data
+
+
+def _read_member(filename):
+    """ _read_archive without instrumentation """
+    import gzip
+    import zipfile
+
+    if '.zip' in filename:
+        with zipfile.ZipFile(filename, 'r') as archive:
+            inside = archive.namelist()
+            with archive.open(inside[0]) as member:
+                return member.read()
+    elif '.gz' in filename:
+        with gzip.open(filename, 'rb') as infile:
+            return infile.read()
+    else:
+        with open(filename, 'rb') as infile:
+            return infile.read()
+
+
+def _line_bounds(buf):
+    """ Start and end offsets of all non-empty lines in a uint8 buffer """
+    import numpy as np
+
+    nl = np.flatnonzero(buf == 10)
+    starts = np.concatenate(([0], nl + 1))
+    ends = np.concatenate((nl, [buf.size]))
+    if buf.size:
+        # strip carriage returns of DOS line endings
+        ends -= (ends > starts) & (buf[np.maximum(ends - 1, 0)] == 13)
+    keep = ends > starts
+    return starts[keep], ends[keep]
+
+
+def _header_bounds(data, buf):
+    """ Start and end offsets of the header records ('#' in the first column)
+
+    NUMLEV of every header is used to jump over its level block to the next
+    header, so the level records are never split into lines. If a jump does
+    not land on a header (NUMLEV wrong or level lines of different length)
+    the next header is searched instead.
+    """
+    import numpy as np
+
+    starts, ends = [], []
+    stride = None
+    pos = 0 if data[:1] == b'#' else data.find(b'\n#')
+    pos = pos if pos <= 0 else pos + 1
+    while pos >= 0:
+        end = data.find(b'\n', pos)
+        end = len(data) if end < 0 else end
+        starts.append(pos)
+        ends.append(end)
+
+        nxt = end + 1
+        numlev = int(data[pos + 32:pos + 36])
+        if numlev > 0:
+            if stride is None:
+                # record length (incl. line break) of the first level record
+                stride = data.find(b'\n', nxt) + 1 - nxt
+            nxt += numlev * stride
+        if data[nxt:nxt + 1] != b'#':
+            nxt = data.find(b'\n#', end)
+            nxt = nxt if nxt < 0 else nxt + 1
+        pos = nxt
+
+    starts = np.array(starts, dtype=np.int64)
+    ends = np.array(ends, dtype=np.int64)
+    if buf.size:
+        # strip carriage returns of DOS line endings
+        ends -= buf[np.maximum(ends - 1, 0)] == 13
+    return starts, ends
+
+
+def _level_bounds(buf, hstarts, hends, numlev, select=None):
+    """ Start and end offsets of the level records and the index of their header
+
+    The level block of a sounding lies between its header and the next header.
+    If all blocks hold NUMLEV records of one fixed length, the records are laid
+    out from NUMLEV without searching for line breaks.
+
+    Args:
+        buf (ndarray): file content as uint8
+        hstarts, hends (ndarray): offsets of all header records
+        numlev (ndarray): NUMLEV of the selected headers
+        select (ndarray): indices of the headers to return the levels for (default all)
+    Returns:
+        ndarray : start offsets
+        ndarray : end offsets
+        ndarray : index of the header (within select) of every level record
+    """
+    import numpy as np
+
+    if select is None:
+        select = np.arange(hstarts.size)
+    block_starts = hends[select] + 1 + (buf[np.minimum(hends[select], buf.size - 1)] == 13)
+    block_starts = np.minimum(block_starts, buf.size)
+    block_ends = np.append(hstarts[1:], buf.size)[select]
+
+    first = np.flatnonzero(numlev > 0)
+    if first.size and (numlev >= 0).all():
+        # record length and line break of the first level record
+        start = block_starts[first[0]]
+        newline = np.flatnonzero(buf[start:start + 1024] == 10)
+        if newline.size:
+            stride = int(newline[0]) + 1
+            length = stride - 1 - int(buf[start + stride - 2] == 13)
+
+            size = block_ends - block_starts
+            regular = (size == numlev * stride)
+            # last record of the file without line break
+            regular |= (block_ends == buf.size) & (size == numlev * stride - (stride - length))
+            if regular.all():
+                owner = np.repeat(np.arange(numlev.size), numlev)
+                first_line = np.cumsum(numlev) - numlev
+                starts = block_starts[owner] + (np.arange(owner.size) - first_line[owner]) * stride
+                return starts, starts + length, owner
+
+    # irregular files: split all lines and assign them to the preceding header
+    starts, ends = _line_bounds(buf)
+    level = buf[starts] != ord('#')
+    starts, ends = starts[level], ends[level]
+    header = np.searchsorted(hstarts, starts) - 1
+    owner = np.searchsorted(select, header)
+    keep = owner < select.size
+    keep[keep] = select[owner[keep]] == header[keep]
+    return starts[keep], ends[keep], owner[keep]
+
+
+def _line_matrix(buf, starts, ends, width):
+    """ Lines as rows of a (n, width) uint8 array, short lines are padded with blanks """
+    import numpy as np
+
+    n = starts.size
+    lengths = ends - starts
+    if n and lengths.min() == lengths.max() >= width:
+        # fixed length records: consecutive lines are equally spaced in the buffer,
+        # so every run of lines is a reshape of a slice (no index arrays needed)
+        stride = int(lengths[0]) + 1 + int(ends[0] < buf.size and buf[ends[0]] == 13)
+        cuts = np.flatnonzero(np.diff(starts) != stride) + 1
+        pieces = []
+        for lo, hi in zip(np.r_[0, cuts], np.r_[cuts, n]):
+            piece = buf[starts[lo]:starts[hi - 1] + stride]
+            if piece.size % stride:
+                # last line of the file without line break
+                piece = np.concatenate((piece, np.full(stride - piece.size % stride, 10, np.uint8)))
+            pieces.append(piece.reshape(-1, stride)[:, :width])
+        return np.concatenate(pieces)
+
+    cols = starts[:, None] + np.arange(width)
+    matrix = buf[np.minimum(cols, max(buf.size - 1, 0))] if buf.size else np.zeros(cols.shape, np.uint8)
+    matrix[cols >= ends[:, None]] = 32
+    return matrix
+
+
+def _field_words(matrix, fields):
+    """ Characters of the fields (name, a, b) of a line matrix as right aligned, blank padded 8 byte words
+
+    Returns:
+        ndarray : (n, 8 * len(fields)) uint8 array
+    """
+    import numpy as np
+
+    n = matrix.shape[0]
+    window = []  # matrix column of every byte, -1 for padding
+    for name, a, b in fields:
+        if b - a > 8:
+            raise ValueError("Field %s wider than 8 characters" % name)
+        window += [-1] * (8 - (b - a)) + list(range(a, b))
+    window = np.array(window)
+
+    lo = fields[0][2] - 8
+    if all(f[2] - 8 == g[2] for g, f in zip(fields, fields[1:])):
+        # windows [b-8, b) of consecutive fields touch (like the level records),
+        # so the words are a slice of the matrix with the other columns blanked
+        chars = np.empty((n, window.size), np.uint8)
+        chars[:, max(-lo, 0):] = matrix[:, max(lo, 0):fields[-1][2]]
+        for col in np.flatnonzero(window < 0):
+            chars[:, col] = 32
+        return chars
+
+    blank = np.full((n, 1), 32, np.uint8)
+    return np.ascontiguousarray(np.concatenate((matrix, blank), axis=1)[:, window])
+
+
+def _matrix_ints(matrix, fields):
+    """ Vectorized int(line[a:b]) for all fields (name, a, b) of a line matrix
+
+    Every field is packed into a 64 bit word and all fields are converted at
+    once by combining neighbouring digits into 2, 4 and 8 digit numbers
+    (SWAR, the first character of a field is the lowest byte of its word).
+    Blanks are ignored like int() does. Empty fields are returned as 0.
+    """
+    import numpy as np
+
+    chars = _field_words(matrix, fields)
+    minus = chars == 45
+    chars -= np.uint8(48)
+    isdigit = chars < 10
+    chars *= isdigit  # digit values, 0 for blanks and signs
+
+    words = chars.view('<u8')
+    words *= np.uint64(10 * 2**8 + 1)
+    words >>= np.uint64(8)
+    words &= np.uint64(0x00FF00FF00FF00FF)
+    words *= np.uint64(100 * 2**16 + 1)
+    words >>= np.uint64(16)
+    words &= np.uint64(0x0000FFFF0000FFFF)
+    words *= np.uint64(10000 * 2**32 + 1)
+    words >>= np.uint64(32)
+    values = words.view(np.int64)
+    values *= 1 - 2 * (minus.view('<u8') != 0).view(np.int8)
+
+    # a digit followed by a non-digit shifts the place values (e.g. '12 '), redo these with int()
+    isdigit = isdigit.view('<u8')
+    gap = isdigit & ~(isdigit >> np.uint64(8)) & np.uint64(0x0001010101010101)
+    if gap.any():
+        for row, i in zip(*np.nonzero(gap)):
+            _, a, b = fields[i]
+            values[row, i] = int(matrix[row, a:b].tobytes().strip() or 0)
+    return values
+
+
+def _fixed_width_ints(buf, starts, ends, fields):
+    """ Vectorized int(line[a:b]) for all lines given by starts/ends and all fields (name, a, b)
+
+    Returns:
+        dict : int64 array per field name
+    """
+    import numpy as np
+
+    width = max(b for _, _, b in fields)
+    out = np.empty((len(fields), starts.size), dtype=np.int64)  # one contiguous array per field
+    for lo in range(0, starts.size, _BLOCK_LINES):
+        hi = lo + _BLOCK_LINES
+        out[:, lo:hi] = _matrix_ints(_line_matrix(buf, starts[lo:hi], ends[lo:hi], width), fields).T
+    return dict(zip([name for name, _, _ in fields], out))
+
+
+def _fixed_width_str(buf, starts, ends, a, b):
+    """ Vectorized line[a:b] for all lines given by starts/ends """
+    import numpy as np
+
+    chars = np.ascontiguousarray(_line_matrix(buf, starts, ends, b)[:, a:b])
+    return chars.view('S%d' % (b - a)).ravel().astype(str).astype(object)
+
+
+def _header_dates(year, month, day, hour, reltime):
+    """ Sounding dates as datetime64[ns], missing hours (99) are taken from the release time """
+    import numpy as np
+
+    hour = hour.copy()
+    minute = np.zeros_like(hour)
+    second = np.zeros_like(hour)
+    for i in np.flatnonzero(hour == 99):
+        time = reltime[i] + '00'
+        # wired stuff !?
+        if '99' in time:
+            time = time.replace('99', '00')
+        hour[i], minute[i], second[i] = int(time[0:2]), int(time[2:4]), int(time[4:6])
+
+    days = ((year - 1970) * 12 + month - 1).astype('datetime64[M]').astype('datetime64[D]')
+    days = days + (day - 1).astype('timedelta64[D]')
+    seconds = (hour * 3600 + minute * 60 + second).astype('timedelta64[s]')
+    return (days.astype('datetime64[s]') + seconds).astype('datetime64[ns]')
+
+
+def _parse_derived(data, get_levels=False, start=None, end=None):
+    """ Parse an IGRA derived file held in memory into dicts of column arrays
+
+    Args:
+        data (bytes): file content
+        get_levels (bool): also parse the level records
+        start, end (datetime-like): only return soundings in [start, end]
+    Returns:
+        dict : header columns and 'idate'
+        dict : level columns, 'date' and 'sounding' (index of the header of every level),
+               None if get_levels is False
+    """
+    import numpy as np
+    from timing_igra import stage
+
+    with stage('parse_header', bytes=len(data)) as timed:
+        buf = np.frombuffer(data, dtype=np.uint8)
+        hstarts, hends = _header_bounds(data, buf)
+        hdr = _parse_header_dates(buf, hstarts, hends)
+
+        # time window: only the selected headers and their level blocks are converted
+        select = np.flatnonzero(_in_window(hdr['idate'], start, end))
+        if select.size < hstarts.size:
+            hdr = {name: values[select] for name, values in hdr.items()}
+        hdr.update(_fixed_width_ints(buf, hstarts[select], hends[select], _DRVD_HEADER_FIELDS))
+        timed.add(rows=int(select.size))
+
+    # header-only: the level blocks are skipped entirely
+    if not get_levels:
+        return hdr, None
+
+    with stage('parse_levels') as timed:
+        lstarts, lends, owner = _level_bounds(buf, hstarts, hends, hdr['numlev'], select)
+        lvl = _fixed_width_ints(buf, lstarts, lends, _DRVD_LEVEL_FIELDS)
+        timed.add(rows=int(owner.size))
+    lvl['date'] = hdr['idate'][owner]
+    lvl['sounding'] = owner
+    return hdr, lvl
+
+
+def _parse_por(data, start=None, end=None, exclude_ltyp1=None):
+    """ Parse an IGRA sounding data file held in memory into dicts of column arrays
+
+    Args:
+        data (bytes): file content
+        start, end (datetime-like): only return soundings in [start, end]
+        exclude_ltyp1 (int): drop the level records of this major level type
+    Returns:
+        dict : header columns and 'idate'
+        dict : level columns, flags (1 character str), 'date' and 'sounding' (index of the header of every level)
+    """
+    import numpy as np
+    from timing_igra import stage
+
+    with stage('parse_header', bytes=len(data)) as timed:
+        buf = np.frombuffer(data, dtype=np.uint8)
+        hstarts, hends = _header_bounds(data, buf)
+        hdr = _parse_header_dates(buf, hstarts, hends)
+        select = np.flatnonzero(_in_window(hdr['idate'], start, end))
+        if select.size < hstarts.size:
+            hdr = {name: values[select] for name, values in hdr.items()}
+        hdr.update(_fixed_width_ints(buf, hstarts[select], hends[select], _POR_HEADER_FIELDS))
+        for name, a, b in _POR_HEADER_SOURCES:
+            hdr[name] = np.char.strip(_fixed_width_str(buf, hstarts[select], hends[select], a, b).astype(str))
+        timed.add(rows=int(select.size))
+
+    with stage('parse_levels') as timed:
+        lstarts, lends, owner = _level_bounds(buf, hstarts, hends, hdr['numlev'], select)
+        # the level type is one digit in the first column, drop levels before converting the other fields
+        ltyp1 = buf[lstarts].astype(np.int64) - ord('0')
+        if exclude_ltyp1 is not None:
+            keep = ltyp1 != exclude_ltyp1
+            lstarts, lends, owner, ltyp1 = lstarts[keep], lends[keep], owner[keep], ltyp1[keep]
+        lvl = {'ltyp1': ltyp1}
+        lvl.update(_fixed_width_ints(buf, lstarts, lends, _POR_LEVEL_FIELDS))
+        for name, a in _POR_LEVEL_FLAGS:
+            lvl[name] = _fixed_width_str(buf, lstarts, lends, a, a + 1)
+        timed.add(rows=int(owner.size))
+    lvl['date'] = hdr['idate'][owner]
+    lvl['sounding'] = owner
+    return hdr, lvl
+
+
+def _parse_header_dates(buf, hstarts, hends):
+    """ Date fields, release time and sounding date ('idate') of the header records """
+    hdr = _fixed_width_ints(buf, hstarts, hends, _DRVD_DATE_FIELDS)
+    hdr['reltime'] = _fixed_width_str(buf, hstarts, hends, 27, 31)
+    hdr['idate'] = _header_dates(hdr['year'], hdr['month'], hdr['day'], hdr['hour'], hdr['reltime'])
+    return hdr
+
+
+def _last_header_date(data):
+    """ Date of the last sounding in a block of the file """
+    import numpy as np
+
+    start = data.rfind(b'\n#') + 1
+    end = data.find(b'\n', start)
+    line = data[start:] if end < 0 else data[start:end]
+    buf = np.frombuffer(line.rstrip(b'\r'), dtype=np.uint8)
+    return _parse_header_dates(buf, np.array([0]), np.array([buf.size]))['idate'][0]
+
+
+def _cached_parse(filename, get_levels, cache_dir):
+    """ Column arrays of the whole file from the parsed-data cache, parsed and stored on a miss """
+    import cache_igra
+
+    # header-only requests can also use an entry with levels
+    kinds = ['drvd'] if get_levels else ['drvd-headers', 'drvd']
+    for kind in kinds:
+        arrays = cache_igra.load(filename, kind, cache_dir,
+                                 keys=None if get_levels else ['hdr.' + name for name in _DRVD_HEADER_KEYS])
+        if arrays is not None:
+            hdr = {key[4:]: values for key, values in arrays.items() if key.startswith('hdr.')}
+            lvl = {key[4:]: values for key, values in arrays.items() if key.startswith('lvl.')}
+            return hdr, (lvl if get_levels else None)
+
+    hdr, lvl = _parse_derived(_read_archive(filename), get_levels=get_levels)
+    arrays = {'hdr.' + name: values for name, values in hdr.items()}
+    if get_levels:
+        arrays.update({'lvl.' + name: values for name, values in lvl.items()})
+    cache_igra.store(filename, kinds[0], arrays, cache_dir)
+    return hdr, lvl
+
+
+def _select_parsed(hdr, lvl, start=None, end=None):
+    """ Soundings of parsed column arrays within [start, end] """
+    import numpy as np
+
+    mask = _in_window(hdr['idate'], start, end)
+    if mask.all():
+        return hdr, lvl
+    select = np.flatnonzero(mask)
+    hdr = {name: values[select] for name, values in hdr.items()}
+    if lvl is not None:
+        position = np.full(mask.size, -1)
+        position[select] = np.arange(select.size)
+        owner = position[lvl['sounding']]
+        keep = owner >= 0
+        lvl = {name: values[keep] for name, values in lvl.items()}
+        lvl['sounding'] = owner[keep]
+    return hdr, lvl
+
+
+def _in_window(dates, start=None, end=None):
+    """ Mask of dates within [start, end], open ends if None """
+    import numpy as np
+    import pandas as pd
+
+    mask = np.ones(dates.size, dtype=bool)
+    if start is not None:
+        mask &= dates >= pd.Timestamp(start).to_datetime64()
+    if end is not None:
+        mask &= dates <= pd.Timestamp(end).to_datetime64()
+    return mask
+
+
+def _mask_missing(values, missing, dtype=None):
+    """ Integer column with the IGRA missing values masked
+    Args:
+        values (ndarray): integer column
+        missing (list): missing values
+        dtype (str): None float64 with NaN if a value is missing (as DataFrame.replace does), int64 otherwise,
+                     'float' float64 with NaN, 'float32' float32 with NaN, 'int' nullable Int16 or Int32
+                     (smallest that holds the values)
+    Returns:
+        ndarray or IntegerArray : masked column
+    """
+    import numpy as np
+
+    mask = values == missing[0]
+    for value in missing[1:]:
+        mask |= values == value
+    if dtype == 'int':
+        import pandas as pd
+
+        valid = values[~mask] if mask.any() else values
+        small = np.int16 if not valid.size or \
+            (np.iinfo(np.int16).min <= valid.min() and valid.max() <= np.iinfo(np.int16).max) else np.int32
+        return pd.arrays.IntegerArray(values.astype(small), mask)
+    if dtype in ('float', 'float32'):
+        values = values.astype(np.float32 if dtype == 'float32' else np.float64)
+        np.putmask(values, mask, np.nan)
+    elif dtype is not None:
+        raise ValueError("Unknown dtype: %s (use None, 'float', 'float32' or 'int')" % dtype)
+    elif mask.any():
+        values = values.astype(float)
+        np.putmask(values, mask, np.nan)
+    return values
+
+
+def _derived_to_frames(hdr, lvl, dtype=None):
+    """ Build the headers/levels DataFrames of ascii_to_dataframe from column arrays """
+    from timing_igra import stage
+
+    with stage('missing', rows=int(hdr['idate'].size + (0 if lvl is None else lvl['sounding'].size))):
+        return _masked_frames(hdr, lvl, dtype)
+
+
+def _masked_frames(hdr, lvl, dtype):
+    """ _derived_to_frames without instrumentation """
+    import numpy as np
+    import pandas as pd
+
+    # missing values are masked and units converted on the arrays, once per column,
+    # saves the DataFrame.replace and unit conversion copies. Parameters that may hold
+    # missing values are float whether the soundings read hold any, so windows and chunks
+    # of a file get the same dtypes
+    floats = dtype or 'float'
+    columns = []
+    for name in _DRVD_HEADER_COLUMNS:
+        if name == 'reltime':
+            # few distinct release times, categorical in the compact dtypes
+            columns.append(pd.Categorical(hdr[name]) if dtype else hdr[name])
+        elif name in _DRVD_HEADER_SCALE:
+            values = _mask_missing(hdr[name], _DRVD_HEADER_MISSING, dtype='float32' if dtype else 'float')
+            # scale in the precision of the column (float32 stays float32)
+            values = values / values.dtype.type(_DRVD_HEADER_SCALE[name])
+            columns.append(values)
+        elif name == 'numlev':
+            # level count (up to 4 digits), never missing, int16 in the compact dtypes
+            columns.append(hdr[name].astype(np.int16) if dtype else hdr[name])
+        else:
+            columns.append(_mask_missing(hdr[name], _DRVD_HEADER_MISSING, dtype=floats))
+    headers = pd.DataFrame(dict(enumerate(columns)), index=pd.DatetimeIndex(hdr['idate'], name='idate'))
+    headers.columns = [_DRVD_HEADER_UNITS.get(name, name) for name in _DRVD_HEADER_COLUMNS]
+
+    if lvl is None:
+        out = []
+    else:
+        out = pd.DataFrame({name: _mask_missing(lvl[name], _DRVD_LEVEL_MISSING, dtype=floats)
+                            for name in _DRVD_LEVEL_COLUMNS},
+                           index=pd.DatetimeIndex(lvl['date'], name='date'))
+    return headers, out
+
+
+def _por_to_frames(hdr, lvl, all_columns=False, missing_float=False):
+    """ Levels and headers DataFrames of igra.read.ascii_to_dataframe from the column arrays of _parse_por,
+    data columns always float64 if missing_float (otherwise int64 where no value is missing)
+    """
+    import pandas as pd
+    from timing_igra import stage
+
+    with stage('missing', rows=lvl['date'].size):
+        # missing values are masked on the integers (-999.9/-888.8 of igra.read are the scaled sentinels)
+        columns = {}
+        for name in (_POR_LEVEL_COLUMNS if all_columns else _POR_DATA_COLUMNS):
+            if name in lvl and lvl[name].dtype == object:
+                columns[name] = lvl[name]
+            elif name in _POR_LEVEL_SCALE:
+                columns[name] = _mask_missing(lvl[name], _POR_MISSING) / _POR_LEVEL_SCALE[name]
+            else:
+                columns[name] = _mask_missing(lvl[name], _POR_MISSING)
+                if missing_float and name not in ('ltyp1', 'ltyp2'):
+                    columns[name] = columns[name].astype(float, copy=False)
+        levels = pd.DataFrame(columns, index=pd.DatetimeIndex(lvl['date'], name='date'))
+
+        names = ['numlev', 'p_src', 'np_src', 'lat', 'lon'] if all_columns else ['numlev', 'lat', 'lon']
+        headers = pd.DataFrame({name: hdr[name] / 10000. if name in ('lat', 'lon') else
+                                (hdr[name].astype(object) if name in ('p_src', 'np_src') else hdr[name])
+                                for name in names}, index=pd.DatetimeIndex(hdr['idate'], name='date'))
+    return levels, headers
+
+
+def _derived_units(headers):
+    """ Convert units of the derived header parameters """
+    headers['pw'] = headers['pw']/_DRVD_HEADER_SCALE['pw']
+    headers['invtempdif'] = headers['invtempdif']/_DRVD_HEADER_SCALE['invtempdif']
+    headers=headers.rename(columns=_DRVD_HEADER_UNITS)
+    #headers.drop(['pw','invtempdif'],inplace =True,axis=1)
+    return headers
+
+
+def _replace_missing(df, missing):
+    """ df.replace(missing, np.nan) one value at a time, pandas 3 fails on a list if a column has several of them """
+    import numpy as np
+
+    for value in missing:
+        df = df.replace(value, np.nan)
+    return df
+
+
+def _ascii_to_dataframe_python(filename, get_levels=False):
+    """ Original line-by-line parser of ascii_to_dataframe (engine='python')
+
+    Kept as reference implementation for tests and benchmarks.
+    """
+    import datetime
+    import gzip
+    import zipfile
+    import io
+    import numpy as np
+    import pandas as pd
+
     if '.zip' in filename:
         archive = zipfile.ZipFile(filename, 'r')
         inside = archive.namelist()
@@ -523,7 +1721,7 @@ def ascii_to_dataframe(filename, get_levels=False, **kwargs):
 
     if get_levels:
         out = pd.DataFrame(data=raw, index=dates, columns=c)
-        out = out.replace([-999.9, -9999, -8888, -888.8], np.nan)  # known missing values by IGRAv2
+        out = _replace_missing(out, [-999.9, -9999, -8888, -888.8])  # known missing values by IGRAv2
         out.index.name = 'date'
     else:
         out = []
@@ -532,13 +1730,8 @@ def ascii_to_dataframe(filename, get_levels=False, **kwargs):
                                                 'mixpress', 'mixhgt', 'frzpress', 'frzhgt', 'lclpress', 'lclhgt', 'lfcpress', 
                                                 'lfchgt', 'lnbp', 'lnbhgt', 'li', 'si', 'ki', 'tti', 'cape', 'cin']).set_index('idate') 
 
-    headers = headers.replace([-999.9, -9999, -8888, -888.8,-99999,-999999], np.nan)
+    headers = _replace_missing(headers, [-999.9, -9999, -8888, -888.8,-99999,-999999])
     headers['reltime']=headers['reltime'].replace([9999], np.nan)
     
     # convert units 
-    headers['pw'] = headers['pw']/100
-    headers['invtempdif'] = headers['invtempdif']/10
-    headers=headers.rename(columns={'pw':'pw_mm','invtempdif':'invtempdif_dC'} )
-    #headers.drop(['pw','invtempdif'],inplace =True,axis=1)
-    
-    return headers, out  
\ No newline at end of file
+    return _derived_units(headers), out
@@ -0,0 +1,207 @@
+__all__ = ['build_ragged', 'open_ragged', 'find_soundings', 'get_sounding', 'ragged_to_frames']
+
+# Memory-mapped ragged-array store of IGRA derived soundings
+#
+# A store is a directory of flat binary column files built from the parser
+# output (see process_igra._parse_derived):
+#   meta.json       number of soundings/levels, dtype of every column, source
+#   hdr.<name>.bin  one value per sounding, sorted by time (idate)
+#   lvl.<name>.bin  levels of all soundings one after the other
+# hdr.offset and hdr.count locate the levels of every sounding, so a lookup
+# is a binary search on hdr.idate and a slice of memory-mapped arrays.
+# Values are the scaled integers of the file with the missing values kept.
+
+_VERSION = 1
+
+
+def build_ragged(filename, directory, blocksize=None):
+    """ Build a ragged store from an IGRA derived archive, streamed block by block
+    Args:
+        filename (str): derived archive (.zip, .gz or text)
+        directory (str): store directory (replaced if it exists)
+        blocksize (int): bytes of text decompressed and parsed at once
+    Returns:
+        dict : opened store (see open_ragged)
+    """
+    import json
+    import os
+    import shutil
+    import numpy as np
+    from process_igra import _iter_parsed
+
+    tmp = '%s.%d.tmp' % (directory.rstrip(os.sep), os.getpid())
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    files, dtypes = {}, {}
+    nhdr = nlvl = 0
+    try:
+        for hdr, lvl in _iter_parsed(filename, True, None, None, blocksize):
+            count = np.bincount(lvl['sounding'], minlength=hdr['idate'].size)
+            columns = {'hdr.' + name: values for name, values in hdr.items()}
+            columns['hdr.offset'] = nlvl + np.cumsum(count) - count
+            columns['hdr.count'] = count
+            columns.update({'lvl.' + name: values for name, values in lvl.items()
+                            if name not in ('date', 'sounding')})
+            for key, values in columns.items():
+                values = _storage(key, values)
+                if key not in files:
+                    files[key] = open(os.path.join(tmp, key + '.bin'), 'wb')
+                    dtypes[key] = values.dtype.str
+                files[key].write(values.tobytes())
+            nhdr += hdr['idate'].size
+            nlvl += lvl['press'].size
+    finally:
+        for f in files.values():
+            f.close()
+
+    meta = {'version': _VERSION, 'source': os.path.abspath(filename), 'soundings': nhdr, 'levels': nlvl,
+            'columns': dtypes}
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    # the header index has to be sorted by time, the levels stay where they are
+    store = open_ragged(tmp)
+    if nhdr and np.any(np.diff(store['hdr']['idate'].view(np.int64)) < 0):
+        order = np.argsort(store['hdr']['idate'], kind='stable')
+        for name, values in store['hdr'].items():
+            path = os.path.join(tmp, 'hdr.%s.bin' % name)
+            values[order].tofile(path + '.sorted')
+            os.replace(path + '.sorted', path)
+    del store
+
+    if os.path.isdir(directory):
+        shutil.rmtree(directory)
+    os.replace(tmp, directory)
+    return open_ragged(directory)
+
+
+def open_ragged(directory):
+    """ Open a ragged store, the columns are read-only memory maps
+    Args:
+        directory (str): store directory
+    Returns:
+        dict : 'meta' -> metadata, 'hdr' -> name -> header column, 'lvl' -> name -> level column
+    """
+    import json
+    import os
+    import numpy as np
+
+    with open(os.path.join(directory, 'meta.json')) as f:
+        meta = json.load(f)
+    if meta.get('version') != _VERSION:
+        raise ValueError("Unsupported ragged store version: %s" % meta.get('version'))
+
+    store = {'meta': meta, 'hdr': {}, 'lvl': {}}
+    for key, dtype in meta['columns'].items():
+        group, name = key.split('.', 1)
+        size = meta['soundings'] if group == 'hdr' else meta['levels']
+        if size:
+            store[group][name] = np.memmap(os.path.join(directory, key + '.bin'), dtype=dtype, mode='r',
+                                           shape=(size,))
+        else:
+            store[group][name] = np.zeros(0, dtype=dtype)
+    return store
+
+
+def find_soundings(store, start=None, end=None):
+    """ Index range of the soundings in [start, end] (binary search)
+    Args:
+        store (dict): opened store
+        start (datetime-like): first time (default: first sounding)
+        end (datetime-like): last time (default: last sounding)
+    Returns:
+        slice : positions in the header columns
+    """
+    import numpy as np
+    import pandas as pd
+
+    idate = store['hdr']['idate']
+    i0 = 0 if start is None else np.searchsorted(idate, pd.Timestamp(start).to_datetime64(), side='left')
+    i1 = idate.size if end is None else np.searchsorted(idate, pd.Timestamp(end).to_datetime64(), side='right')
+    return slice(int(i0), int(max(i0, i1)))
+
+
+def get_sounding(store, time, tolerance='5 min'):
+    """ Sounding closest to time, without copying
+    Args:
+        store (dict): opened store
+        time (datetime-like): sounding time
+        tolerance (str or Timedelta): largest allowed time difference
+    Returns:
+        dict : header values of the sounding
+        dict : name -> level values (views of the memory maps)
+    Raises:
+        KeyError : no sounding within tolerance
+    """
+    import numpy as np
+    import pandas as pd
+
+    time = pd.Timestamp(time).to_datetime64()
+    tolerance = pd.to_timedelta(tolerance).to_timedelta64()
+    idate = store['hdr']['idate']
+    i = int(np.searchsorted(idate, time))
+    candidates = [j for j in (i - 1, i) if 0 <= j < idate.size]
+    if not candidates:
+        raise KeyError(time)
+    j = min(candidates, key=lambda j: abs(idate[j] - time))
+    if abs(idate[j] - time) > tolerance:
+        raise KeyError(time)
+
+    header = {name: values[j] for name, values in store['hdr'].items()}
+    offset, count = int(header['offset']), int(header['count'])
+    return header, {name: values[offset:offset + count] for name, values in store['lvl'].items()}
+
+
+def ragged_to_frames(store, start=None, end=None, get_levels=True, dtype=None):
+    """ Soundings in [start, end] as the DataFrames of process_igra.ascii_to_dataframe
+    Args:
+        store (dict): opened store
+        start, end (datetime-like): time range (default: all)
+        get_levels (bool): return the level data as well
+        dtype (str): storage of the numeric columns (see process_igra.ascii_to_dataframe)
+    Returns:
+        DataFrame : headers
+        DataFrame : levels (empty list if get_levels is False)
+    """
+    import numpy as np
+    from process_igra import _derived_to_frames
+
+    select = find_soundings(store, start, end)
+    hdr = {name: _restore(values[select]) for name, values in store['hdr'].items()
+           if name not in ('offset', 'count')}
+    lvl = None
+    if get_levels:
+        offset = np.asarray(store['hdr']['offset'][select])
+        count = np.asarray(store['hdr']['count'][select])
+        if count.size and np.all(offset[1:] == offset[:-1] + count[:-1]):
+            # levels of consecutive soundings are contiguous
+            take = slice(int(offset[0]), int(offset[-1] + count[-1]))
+        else:
+            take = np.repeat(offset - np.cumsum(count) + count, count) + np.arange(count.sum())
+        lvl = {name: _restore(values[take]) for name, values in store['lvl'].items()}
+        lvl['sounding'] = np.repeat(np.arange(count.size), count)
+        lvl['date'] = np.repeat(hdr['idate'], count)
+    return _derived_to_frames(hdr, lvl, dtype=dtype)
+
+
+def _storage(key, values):
+    """ On-disk dtype of a parsed column """
+    if values.dtype == object:
+        return values.astype('S4')
+    if key == 'hdr.idate':
+        return values.astype('<M8[ns]')
+    if key == 'hdr.offset':
+        return values.astype('<i8')
+    return values.astype('<i4')
+
+
+def _restore(values):
+    """ Parsed column (as _parse_derived returns it) of a stored column """
+    import numpy as np
+
+    if values.dtype.kind == 'S':
+        return values.astype(str).astype(object)
+    if values.dtype.kind == 'i':
+        return values.astype(np.int64)
+    return np.asarray(values)
@@ -0,0 +1,90 @@
+__all__ = ['regrid_levels']
+
+# Vertical regridding of IGRA soundings onto a common grid
+#
+# The levels of a block of soundings are padded into (sounding, level)
+# arrays (see thermo_igra), sorted along the vertical coordinate with the
+# missing values of every variable moved behind its valid levels, and
+# interpolated onto all grid levels at once: the bracketing levels of every
+# (sounding, grid level) are counted from one comparison of the coordinate
+# with the grid, no loop over soundings.
+
+# default variables, columns of the level table of ascii_to_dataframe(get_levels=True)
+_REGRID_VARIABLES = ['press', 'calcgph', 'temp', 'ptemp', 'vappress', 'calcrh', 'uwnd', 'vwnd']
+
+
+def regrid_levels(levels, grid, coordinate='press', variables=None, block=2048, dtype='float32'):
+    """ Interpolate every sounding onto a common pressure or height grid
+    Args:
+        levels (DataFrame): levels of process_igra.ascii_to_dataframe(get_levels=True)
+        grid (array-like): grid levels, pressure (Pa) or height above the surface (m)
+        coordinate (str): 'press' interpolates linearly in ln(p), 'height' linearly in the height above the
+                          surface (calcgph, repgph where missing)
+        variables (list): level columns (default press, calcgph, temp, ptemp, vappress, calcrh, uwnd, vwnd)
+        block (int): soundings interpolated at once, bounds the temporary arrays
+        dtype (str): dtype of the values
+    Returns:
+        dict : 'time' -> sounding times, 'grid' -> grid levels, 'variables' -> variable names,
+               'values' -> (time, grid, variable) array in the units of the level table, NaN outside of
+               the levels of a sounding with the variable
+    """
+    import numpy as np
+    import pandas as pd
+    from thermo_igra import _column, _pad, _soundings
+
+    if coordinate not in ('press', 'height'):
+        raise ValueError("Unknown coordinate: %s" % coordinate)
+    grid = np.asarray(grid, dtype=np.float64)
+    variables = list(variables or _REGRID_VARIABLES)
+    start, count = _soundings(levels)
+    names = dict.fromkeys(['press', 'calcgph', 'repgph'] + variables)
+    columns = {name: _column(levels, name) for name in names}
+
+    values = np.full((start.size, grid.size, len(variables)), np.nan, dtype=dtype)
+    # grid coordinate increasing upwards
+    target = -np.log(grid) if coordinate == 'press' else grid
+    for i in range(0, start.size, block):
+        padded = _pad(columns, start[i:i + block], count[i:i + block], int(count[i:i + block].max()))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            x = _coordinate(padded, coordinate)
+            for k, name in enumerate(variables):
+                # pressure varies exponentially with height
+                v = np.log(padded[name]) if name == 'press' else padded[name]
+                out = _interpolate(x, v, target)
+                values[i:i + block, :, k] = np.exp(out) if name == 'press' else out
+    return {'time': pd.DatetimeIndex(levels.index.values[start], name='idate'), 'grid': grid,
+            'variables': variables, 'values': values}
+
+
+def _coordinate(padded, coordinate):
+    """ Vertical coordinate increasing upwards: -ln(p) or height above the first level with a height """
+    import numpy as np
+
+    if coordinate == 'press':
+        return -np.log(np.where(padded['press'] > 0, padded['press'], np.nan))
+    height = np.where(np.isfinite(padded['calcgph']), padded['calcgph'], padded['repgph'])
+    first = np.isfinite(height).argmax(axis=1)
+    return height - np.take_along_axis(height, first[:, None], axis=1)
+
+
+def _interpolate(x, v, target):
+    """ v (sounding, level) interpolated linearly in x to the target levels, NaN outside """
+    import numpy as np
+
+    valid = np.isfinite(x) & np.isfinite(v)
+    order = np.argsort(np.where(valid, x, np.inf), axis=1, kind='stable')
+    x = np.where(np.take_along_axis(valid, order, axis=1), np.take_along_axis(x, order, axis=1), np.nan)
+    v = np.take_along_axis(v, order, axis=1)
+    nvalid = valid.sum(axis=1)
+
+    # number of levels at or below every grid level, (sounding, grid)
+    k = np.sum(x[:, :, None] <= target[None, None, :], axis=1)
+    lo = np.clip(k - 1, 0, max(x.shape[1] - 1, 0))
+    hi = np.minimum(lo + 1, max(x.shape[1] - 1, 0))
+    x0, x1 = np.take_along_axis(x, lo, axis=1), np.take_along_axis(x, hi, axis=1)
+    v0, v1 = np.take_along_axis(v, lo, axis=1), np.take_along_axis(v, hi, axis=1)
+    out = v0 + (target[None, :] - x0) / (x1 - x0) * (v1 - v0)
+    # on the top level or on a level repeated in the sounding
+    out = np.where(target[None, :] == x0, v0, out)
+    out[(k == 0) | (k > nvalid[:, None]) | ((k == nvalid[:, None]) & (target[None, :] != x0))] = np.nan
+    return out
@@ -0,0 +1,276 @@
+__all__ = ['station_idents', 'station_tables', 'write_store', 'append_store', 'read_store', 'export_profiles', 'export_stream']
+
+# Consolidated per-station store of sounding profiles
+#
+# One HDF5 file (pandas HDFStore, table format) per station or station-year:
+#   headers : one row per sounding (header columns of process_igra.por_to_dataframe), time index
+#   levels  : levels of all soundings one after the other (ragged), time index
+#   offsets : first level row and number of levels of every sounding
+# The per-sounding CSV files of save_profiles are an export of these tables,
+# written in turn (export_profiles) or by background threads while the next
+# tables are parsed (export_stream). The tables of a chunk of soundings are
+# formatted with one to_csv call each and the text is split by sounding, the
+# per-file to_csv calls cost more than the formatting itself.
+
+
+def station_idents(stations):
+    """ Station names and IGRA IDs of the stations argument of the multi-station functions
+    Args:
+        stations (dict, list or DataFrame): station name -> IGRA ID, IGRA IDs, or stations of catalog_igra.find_stations
+    Returns:
+        list : station names (None for a list of IDs)
+        list : IGRA IDs
+    """
+    if isinstance(stations, dict):
+        return list(stations.keys()), list(stations.values())
+    if hasattr(stations, 'index') and hasattr(stations, 'columns'):
+        from catalog_igra import station_names
+        stations = station_names(stations)
+        return list(stations.keys()), list(stations.values())
+    return None, list(stations)
+
+
+def station_tables(df, headers, soundings, tolerance=None):
+    """ Headers, ragged level table and offsets of soundings
+    Args:
+        df (DataFrame): levels of process_igra.por_to_dataframe
+        headers (DataFrame): headers of process_igra.por_to_dataframe
+        soundings (DatetimeIndex): sounding times
+        tolerance (Timedelta): time tolerance of the match (default 5 min)
+    Returns:
+        DataFrame : headers of the soundings
+        DataFrame : levels of the soundings without ltyp1 == 3, in sounding order
+        DataFrame : first (row in levels) and count of the levels of every sounding
+    """
+    import numpy as np
+    import pandas as pd
+    from process_igra import _sounding_offsets
+    from timing_igra import stage
+
+    if tolerance is None:
+        tolerance = pd.to_timedelta('5 min')
+    with stage('extract', rows=len(soundings)):
+        levels, first, last, rows = _sounding_offsets(df, headers, soundings, tolerance)
+        count = np.maximum(last - first, 0)
+        take = np.repeat(first - np.concatenate([[0], np.cumsum(count)[:-1]]), count) + np.arange(count.sum())
+        offsets = pd.DataFrame({'first': np.cumsum(count) - count, 'count': count}, index=soundings)
+        return headers.iloc[rows], levels.iloc[take], offsets
+
+
+def write_store(filename, headers, levels, offsets, complevel=5):
+    """ Write the tables of station_tables to one HDF5 file (replaced atomically)
+    Args:
+        filename (str): output file (.h5)
+        headers (DataFrame): sounding headers
+        levels (DataFrame): ragged level table
+        offsets (DataFrame): first and count of every sounding
+        complevel (int): blosc compression level
+    """
+    import os
+    import pandas as pd
+    from timing_igra import stage
+
+    with stage('write', rows=len(levels), files=1) as timed:
+        tmp = '%s.%d.tmp' % (filename, os.getpid())
+        with pd.HDFStore(tmp, mode='w', complevel=complevel, complib='blosc') as store:
+            store.put('headers', headers, format='table')
+            store.put('levels', levels, format='table')
+            store.put('offsets', offsets, format='table')
+        os.replace(tmp, filename)
+        timed.add(bytes=os.path.getsize(filename))
+
+
+def append_store(filename, headers, levels, offsets):
+    """ Append the tables of station_tables (newer soundings) to an existing store
+    Args:
+        filename (str): store file (.h5)
+        headers (DataFrame): sounding headers
+        levels (DataFrame): ragged level table
+        offsets (DataFrame): first (row in levels) and count of every sounding
+    """
+    import pandas as pd
+    from timing_igra import stage
+
+    with stage('write', rows=len(levels)), pd.HDFStore(filename, mode='a') as store:
+        first = store.get_storer('levels').nrows
+        store.append('headers', headers)
+        store.append('levels', levels)
+        store.append('offsets', offsets.assign(first=offsets['first'] + first))
+
+
+def read_store(filename, start=None, end=None):
+    """ Read a station store
+    Args:
+        filename (str): store file (.h5)
+        start (datetime-like): first sounding (default: all)
+        end (datetime-like): last sounding (default: all)
+    Returns:
+        DataFrame : sounding headers
+        DataFrame : ragged level table of these soundings
+        DataFrame : first (row in the returned levels) and count of every sounding
+    """
+    import numpy as np
+    import pandas as pd
+
+    with pd.HDFStore(filename, mode='r') as store:
+        offsets = store['offsets']
+        select = np.ones(len(offsets), dtype=bool)
+        if start is not None:
+            select &= offsets.index >= pd.Timestamp(start)
+        if end is not None:
+            select &= offsets.index <= pd.Timestamp(end)
+        rows = np.flatnonzero(select)
+        if rows.size == len(offsets):
+            return store['headers'], store['levels'], offsets
+
+        headers = store.select('headers', start=rows[0], stop=rows[-1] + 1) if rows.size else \
+            store.select('headers', start=0, stop=0)
+        offsets = offsets.iloc[rows]
+        start_row = offsets['first'].iloc[0] if rows.size else 0
+        stop_row = (offsets['first'] + offsets['count']).iloc[-1] if rows.size else 0
+        levels = store.select('levels', start=start_row, stop=stop_row)
+    offsets = offsets.assign(first=offsets['first'] - start_row)
+    return headers, levels, offsets
+
+
+def export_profiles(headers, levels, offsets, out_dir, name, id, verbose=1, written=None):
+    """ Write one CSV per sounding (<id>_<YYYYMMDD_HH>Z.csv), the layout of save_profiles
+    Args:
+        headers (DataFrame or str): sounding headers, or a store file to read all tables from
+        levels (DataFrame): ragged level table
+        offsets (DataFrame): first and count of every sounding
+        out_dir (str): output directory
+        name (str): station name
+        id (str): IGRA ID
+        verbose (int): verboseness
+        written (callable): called with the time string after every written file (e.g. to record progress)
+    Returns:
+        list : time strings of the written soundings
+    """
+    from timing_igra import stage
+
+    if isinstance(headers, str):
+        headers, levels, offsets = read_store(headers)
+
+    time_strs = []
+    with stage('write', rows=len(levels), files=len(offsets)):
+        for time_str, text in _profile_texts(name, id, headers, levels, offsets):
+            if verbose > 0:
+                print(name + time_str)
+            _write_profile(out_dir, id, time_str, text)
+            if written is not None:
+                written(time_str)
+            time_strs.append(time_str)
+    return time_strs
+
+
+def export_stream(tables, out_dir, name, id, writers=2, chunk=64, queue_size=4, verbose=1, written=None):
+    """ Write one CSV per sounding like export_profiles, by background threads while tables are produced
+    Args:
+        tables (iterable): tables of station_tables (headers, levels, offsets), e.g. one per parsed block
+        out_dir (str): output directory
+        name (str): station name
+        id (str): IGRA ID
+        writers (int): writer threads, each formats and writes a chunk of soundings at a time
+        chunk (int): soundings per chunk
+        queue_size (int): chunks waiting for a writer, the producer blocks when the queue is full
+        verbose (int): verboseness
+        written (callable): called with the time string after every written file (one thread at a time)
+    Returns:
+        list : time strings of the written soundings, in order of writing; a sounding with the time string
+               of an earlier one (the same file) is skipped
+    """
+    import queue
+    import threading
+    import numpy as np
+    from timing_igra import stage
+
+    pending = queue.Queue(max(queue_size, 1))
+    lock = threading.Lock()
+    time_strs, errors, queued = [], [], set()
+
+    def write():
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            if errors:
+                # drain the queue so that the producer never blocks on a failed run
+                continue
+            headers, levels, offsets = item
+            try:
+                with stage('write', rows=int(offsets['count'].sum()), files=len(offsets)):
+                    for time_str, text in _profile_texts(name, id, headers, levels, offsets):
+                        _write_profile(out_dir, id, time_str, text)
+                        with lock:
+                            if written is not None:
+                                written(time_str)
+                            time_strs.append(time_str)
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=write, daemon=True) for _ in range(max(writers, 1))]
+    for thread in threads:
+        thread.start()
+    try:
+        for headers, levels, offsets in tables:
+            # one file per time string, the first sounding wins
+            time_str = offsets.index.strftime('%Y%m%d_%H')
+            keep = np.flatnonzero(~time_str.duplicated() & ~time_str.isin(queued))
+            queued.update(time_str[keep])
+            # the writers format the soundings, only handing them over is timed here
+            with stage('queue', files=keep.size):
+                for k in range(0, keep.size, max(chunk, 1)):
+                    if errors:
+                        break
+                    rows = keep[k:k + chunk]
+                    if verbose > 0:
+                        print('\n'.join(name + t for t in time_str[rows]))
+                    pending.put((headers.iloc[rows], levels, offsets.iloc[rows]))
+            if errors:
+                # a failed writer stops the producer before it parses the next tables
+                break
+    finally:
+        if hasattr(tables, 'close'):
+            tables.close()
+        for _ in threads:
+            pending.put(None)
+        for thread in threads:
+            thread.join()
+    if errors:
+        raise errors[0]
+    return time_strs
+
+
+def _profile_texts(name, id, headers, levels, offsets, chunk=1024):
+    """ (time string, CSV text: station line, header fields, level table) of every sounding, the tables of
+    chunk soundings are formatted at once and split by sounding
+    """
+    import csv
+    import io
+
+    station = f"{','.join([name, id])}\n"
+    fields = list(headers.columns[1:])
+    columns = levels.iloc[:0].to_csv(index=False, lineterminator='\n')
+    for k in range(0, len(offsets), chunk):
+        first = offsets['first'].to_numpy()[k:k + chunk]
+        count = offsets['count'].to_numpy()[k:k + chunk]
+        lo, hi = int(first.min()), int((first + count).max())
+        lines = levels.iloc[lo:hi].to_csv(header=False, index=False, lineterminator='\n').split('\n')
+        rows = csv.reader(headers.iloc[k:k + chunk, 1:].to_csv(header=False, index=False,
+                                                              lineterminator='\n').split('\n'))
+        for sounding, i, n, row in zip(offsets.index[k:k + chunk], first - lo, count, rows):
+            out = io.StringIO()
+            out.write(station)
+            csv.writer(out, lineterminator='\n').writerows(zip(fields, row))
+            out.write(columns)
+            out.writelines(line + '\n' for line in lines[i:i + n])
+            yield sounding.strftime('%Y%m%d_%H'), out.getvalue()
+
+
+def _write_profile(out_dir, id, time_str, text):
+    """ Write the CSV file of one sounding """
+    import os
+
+    with open(os.path.join(out_dir, id + '_' + time_str + 'Z.csv'), 'w') as f:
+        f.write(text)
@@ -0,0 +1,5 @@
+# The modules of Code/ are imported by name (as the notebooks and scripts do)
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,81 @@
+import os
+import time
+
+import numpy as np
+
+import cache_igra
+
+
+def _archive(path, content):
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_entry_is_valid_until_the_content_changes(tmp_path):
+    filename = _archive(tmp_path / 'USM00000001-drvd.txt', b'one')
+    cache = str(tmp_path / 'cache')
+    cache_igra.store(filename, 'drvd', {'x': np.arange(5)}, cache_dir=cache)
+    np.testing.assert_array_equal(cache_igra.load(filename, 'drvd', cache)['x'], np.arange(5))
+    assert cache_igra.load(filename, 'other', cache) is None
+
+    # touched: same content, still valid
+    os.utime(filename, ns=(0, 0))
+    assert cache_igra.load(filename, 'drvd', cache) is not None
+
+    # downloaded again with another content
+    _archive(tmp_path / 'USM00000001-drvd.txt', b'two!')
+    assert cache_igra.load(filename, 'drvd', cache) is None
+    assert not os.listdir(cache)
+
+
+def test_invalidate(tmp_path):
+    first = _archive(tmp_path / 'USM00000001-drvd.txt', b'one')
+    second = _archive(tmp_path / 'USM00000002-drvd.txt', b'two')
+    cache = str(tmp_path / 'cache')
+    for filename in (first, second):
+        for kind in ('drvd', 'drvd-levels'):
+            cache_igra.store(filename, kind, {'x': np.arange(3)}, cache_dir=cache)
+    assert cache_igra.invalidate(first, cache) == 2
+    assert cache_igra.load(first, 'drvd', cache) is None
+    assert cache_igra.load(second, 'drvd', cache) is not None
+    assert cache_igra.invalidate(cache_dir=cache) == 2
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = str(tmp_path / 'cache')
+    names = []
+    for i in range(3):
+        names.append(_archive(tmp_path / ('USM0000000%d-drvd.txt' % i), b'%d' % i))
+        cache_igra.store(names[-1], 'drvd', {'x': np.zeros(1000)}, cache_dir=cache)
+        time.sleep(0.01)
+    # the oldest entry is used again, the second one is now the least recently used
+    assert cache_igra.load(names[0], 'drvd', cache) is not None
+    size = max(info['bytes'] for _, info in cache_igra._entries(cache))
+    cache_igra.evict(cache, max_bytes=2 * size)
+    assert cache_igra.load(names[1], 'drvd', cache) is None
+    assert cache_igra.load(names[0], 'drvd', cache) is not None
+    assert cache_igra.load(names[2], 'drvd', cache) is not None
+
+    # store keeps the cache below its limit
+    cache_igra.store(names[1], 'drvd', {'x': np.zeros(1000)}, cache_dir=cache, max_bytes=size)
+    assert len(cache_igra._entries(cache)) == 1
+    assert cache_igra.load(names[1], 'drvd', cache) is not None
+
+
+def test_fingerprint_is_hashed_when_the_archive_changes(tmp_path, monkeypatch):
+    filename = _archive(tmp_path / 'USM00000001-drvd.txt', b'one')
+    cache = str(tmp_path / 'cache')
+    hashed = []
+    content_hash = cache_igra._content_hash
+    monkeypatch.setattr(cache_igra, '_content_hash', lambda name: hashed.append(name) or content_hash(name))
+
+    first = cache_igra.fingerprint(filename, cache)
+    assert first == content_hash(filename)
+    assert cache_igra.fingerprint(filename, cache) == first
+    assert len(hashed) == 1
+
+    _archive(tmp_path / 'USM00000001-drvd.txt', b'two!')
+    assert cache_igra.fingerprint(filename, cache) == content_hash(filename) != first
+    assert len(hashed) == 2
+    # not an entry of the cache
+    assert cache_igra._entries(cache) == []
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from catalog_igra import EARTH_RADIUS, find_stations, station_catalog, station_names
+
+
+@pytest.fixture(scope='module')
+def catalog(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('catalog')
+    rng = np.random.default_rng(1)
+    lines = []
+    for i in range(300):
+        lat, lon = rng.uniform(-89, 89), rng.uniform(-180, 180)
+        lines.append('%-11s %8.4f %9.4f %6.1f %-2s %-30s %4d %4d %6d' % (
+            'USM%08d' % i, lat, lon, rng.uniform(0, 3000), 'ND', 'STATION %d' % i,
+            rng.integers(1940, 2000), rng.integers(1960, 2021), rng.integers(1, 50000)))
+    lines.append('%-11s %8.4f %9.4f %6.1f %-2s %-30s %4d %4d %6d' % (
+        'USM00072520', 40.5317, -80.2172, -999.9, 'PA', 'PITTSBURGH/MOON TOWNSHIP', 1948, 2020, 40000))
+    with open(directory / 'igra2-station-list.txt', 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    return station_catalog(str(directory), verbose=0)
+
+
+def _distance(stations, lat, lon):
+    """ haversine distance (km) of the stations to (lat, lon) """
+    lat1, lon1 = np.radians(stations['lat'].values), np.radians(stations['lon'].values)
+    lat0, lon0 = np.radians(lat), np.radians(lon)
+    h = np.sin((lat1 - lat0) / 2) ** 2 + np.cos(lat0) * np.cos(lat1) * np.sin((lon1 - lon0) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(h))
+
+
+def test_list_is_parsed(catalog):
+    stations = catalog['stations']
+    assert len(stations) == 301
+    pittsburgh = stations.loc['USM00072520']
+    assert pittsburgh['name'] == 'PITTSBURGH/MOON TOWNSHIP' and np.isnan(pittsburgh['alt'])
+    assert (pittsburgh['start'], pittsburgh['end']) == (1948, 2020)
+
+
+def test_radius(catalog):
+    stations = catalog['stations']
+    found = find_stations(catalog, center=(45, 170), radius=3000)
+    distance = _distance(stations, 45, 170)
+    assert set(found.index) == set(stations.index[distance <= 3000])
+    np.testing.assert_allclose(found['distance'], np.sort(distance[distance <= 3000]), rtol=1e-9)
+    assert found['distance'].is_monotonic_increasing
+    with pytest.raises(ValueError):
+        find_stations(catalog, radius=100)
+
+
+def test_bbox_and_years(catalog):
+    stations = catalog['stations']
+    found = find_stations(catalog, bbox=(-100, 30, -70, 50))
+    assert 'USM00072520' in found.index
+    assert ((found['lon'] >= -100) & (found['lon'] <= -70) & (found['lat'] >= 30) & (found['lat'] <= 50)).all()
+
+    # crossing the dateline
+    found = find_stations(catalog, bbox=(170, -10, -170, 10))
+    expected = stations[((stations['lon'] >= 170) | (stations['lon'] <= -170)) & (stations['lat'].abs() <= 10)]
+    assert set(found.index) == set(expected.index)
+
+    found = find_stations(catalog, start='1950-06-01', end=2015)
+    assert ((found['start'] <= 1950) & (found['end'] >= 2015)).all()
+    assert len(found) == ((stations['start'] <= 1950) & (stations['end'] >= 2015)).sum()
+
+
+def test_station_names_are_directory_names(catalog):
+    names = station_names(find_stations(catalog, center=(40.5317, -80.2172), radius=1))
+    assert names == {'Pittsburgh-Moon Township': 'USM00072520'}
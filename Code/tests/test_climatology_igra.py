@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmark_igra import write_synthetic_derived
+from climatology_igra import climatology, climatology_table, merge_climatology, new_climatology
+from process_igra import ascii_to_dataframe
+
+STATIONS = ['USM00072764', 'USM00072520']
+OPTIONS = {'header_variables': ['pw_mm', 'cape'], 'level_variables': ['temp'], 'levels': [85000, 50000]}
+
+
+@pytest.fixture(scope='module')
+def directory(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('climatology')
+    for seed, ident in enumerate(STATIONS):
+        write_synthetic_derived(str(directory / (ident + '-drvd.txt.zip')), years=2, levels=20, ident=ident, seed=seed)
+    return str(directory)
+
+
+def _assert_states_equal(state, other):
+    assert state['variables'] == other['variables']
+    assert sorted(state['stations']) == sorted(other['stations'])
+    for station, stats in state['stations'].items():
+        for key in ('count', 'hist', 'min', 'max'):
+            np.testing.assert_array_equal(stats[key], other['stations'][station][key])
+        for key in ('mean', 'm2'):
+            np.testing.assert_allclose(stats[key], other['stations'][station][key], rtol=1e-9, atol=1e-6)
+
+
+def test_merge_of_periods_and_stations_equals_the_whole(directory):
+    whole = climatology(STATIONS, directory, chunksize=100, **OPTIONS)
+    periods = [climatology(STATIONS, directory, end='1950-08-14 23:59', **OPTIONS),
+               climatology(STATIONS, directory, start='1950-08-15', **OPTIONS)]
+    stations = [climatology([ident], directory, **OPTIONS) for ident in STATIONS]
+    _assert_states_equal(merge_climatology(*periods), whole)
+    _assert_states_equal(merge_climatology(*stations), whole)
+    _assert_states_equal(climatology(STATIONS, directory, processes=2, **OPTIONS), whole)
+
+
+def test_table_equals_groupby(directory):
+    state = climatology(STATIONS[:1], directory, **OPTIONS)
+    table = climatology_table(state).sort_index().loc[(STATIONS[0], 'pw_mm')]
+    headers, _ = ascii_to_dataframe(directory + '/%s-drvd.txt.zip' % STATIONS[0])
+    pw = headers['pw_mm'].dropna()
+    # the soundings are at 00Z and 12Z, every one is in the group of its own hour
+    expected = pw.groupby([pw.index.month, pw.index.hour]).agg(['count', 'mean', 'std', 'min', 'max'])
+    result = table.reset_index('level', drop=True)[['count', 'mean', 'std', 'min', 'max']]
+    pd.testing.assert_frame_equal(result, expected, check_names=False, check_dtype=False,
+                                  check_index_type=False)
+
+
+def test_merge_of_different_states_raises():
+    with pytest.raises(ValueError):
+        merge_climatology()
+    with pytest.raises(ValueError):
+        merge_climatology(new_climatology(**OPTIONS), new_climatology(hours=(0, 6, 12, 18), **OPTIONS))
+    with pytest.raises(ValueError):
+        merge_climatology(new_climatology(**OPTIONS), new_climatology(bins=50, **OPTIONS))
+    with pytest.raises(ValueError):
+        merge_climatology(new_climatology(**OPTIONS), new_climatology())
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from benchmark_igra import write_synthetic_derived
+from coupling_igra import _COUPLING_COLUMNS, coupling_metrics
+
+
+@pytest.fixture(scope='module')
+def directory(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('coupling')
+    write_synthetic_derived(str(directory / 'USM00072764-drvd.txt.zip'), years=1, levels=20)
+    return str(directory)
+
+
+def test_coupling_morning_soundings(directory):
+    table = coupling_metrics({'Bismarck': 'USM00072764'}, directory, end='1950-03-01', fill=True)
+    assert list(table.columns) == ['name'] + _COUPLING_COLUMNS
+    assert (table.index.get_level_values('idate').hour == 12).all()
+    assert (table['name'] == 'Bismarck').all()
+    assert np.isfinite(table['ctp']).mean() > 0.9
+
+
+@pytest.mark.parametrize('stations, start', [({}, None), ([], None), (['USM00072764'], '1990-01-01')])
+def test_coupling_empty(directory, stations, start):
+    table = coupling_metrics(stations, directory, start=start)
+    assert table.empty
+    assert list(table.columns) == ['name'] + _COUPLING_COLUMNS
+    assert table.index.names == ['station', 'idate']
@@ -0,0 +1,150 @@
+import http.server
+import io
+import os
+import threading
+import zipfile
+
+import pytest
+
+import download_igra
+
+
+def _zip_bytes(size=200000):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+        archive.writestr('USM00000001-drvd.txt', os.urandom(size))
+    return buffer.getvalue()
+
+
+class _Archive(http.server.BaseHTTPRequestHandler):
+    """ Stand-in of the NOAA server: one archive with ETag/Last-Modified, Range requests,
+    a number of failures (503) and of cut off responses before it answers normally
+    """
+    content = b''
+    etag = '"v1"'
+    last_modified = 'Mon, 01 Jan 2024 00:00:00 GMT'
+    failures = 0
+    cut_off = 0
+    requests = []
+
+    def do_GET(self):
+        cls = type(self)
+        cls.requests.append(dict(self.headers))
+        if cls.failures:
+            cls.failures -= 1
+            self.send_error(503)
+            return
+        if self.headers.get('If-None-Match') == cls.etag or \
+                self.headers.get('If-Modified-Since') == cls.last_modified:
+            self.send_response(304)
+            self.end_headers()
+            return
+        start = 0
+        if self.headers.get('Range') and self.headers.get('If-Range', cls.etag) in (cls.etag, cls.last_modified):
+            start = int(self.headers['Range'].split('=')[1].rstrip('-'))
+        body = cls.content[start:]
+        self.send_response(206 if start else 200)
+        if start:
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, len(cls.content) - 1, len(cls.content)))
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', cls.etag)
+        self.send_header('Last-Modified', cls.last_modified)
+        self.end_headers()
+        if cls.cut_off:
+            # connection lost in the middle of the transfer
+            cls.cut_off -= 1
+            self.wfile.write(body[:len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    handler = type('Archive', (_Archive,), {'content': _zip_bytes(), 'requests': []})
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield handler, 'http://127.0.0.1:%d/USM00000001-drvd.txt.zip' % httpd.server_address[1]
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _fetch(url, filename, **kwargs):
+    kwargs = dict({'retries': 0, 'backoff': 0, 'timeout': 5, 'verbose': 0}, **kwargs)
+    return download_igra.fetch(url, filename, **kwargs)
+
+
+def test_download(server, tmp_path):
+    handler, url = server
+    filename = str(tmp_path / 'USM00000001-drvd.txt.zip')
+    assert _fetch(url, filename) == 'downloaded'
+    with open(filename, 'rb') as f:
+        assert f.read() == handler.content
+    assert sorted(os.listdir(tmp_path)) == ['USM00000001-drvd.txt.zip', 'USM00000001-drvd.txt.zip.http']
+
+
+@pytest.mark.parametrize('validator', ['etag', 'last_modified'])
+def test_not_modified(server, tmp_path, validator):
+    handler, url = server
+    filename = str(tmp_path / 'USM00000001-drvd.txt.zip')
+    _fetch(url, filename)
+    if validator == 'last_modified':
+        handler.etag = '"v2"'
+    assert _fetch(url, filename) == 'not-modified'
+    assert handler.requests[-1].get('If-None-Match') == '"v1"'
+    assert handler.requests[-1].get('If-Modified-Since') == handler.last_modified
+    # force downloads without the conditional headers
+    assert _fetch(url, filename, force=True) == 'downloaded'
+    assert 'If-None-Match' not in handler.requests[-1]
+
+
+def test_interrupted_download_is_resumed(server, tmp_path):
+    handler, url = server
+    filename = str(tmp_path / 'USM00000001-drvd.txt.zip')
+    handler.cut_off = 1
+    with pytest.raises(Exception):
+        _fetch(url, filename)
+    # no truncated archive under the final name
+    assert not os.path.exists(filename)
+    part = os.path.getsize(filename + '.part')
+    assert 0 < part < len(handler.content)
+
+    assert _fetch(url, filename) == 'downloaded'
+    assert handler.requests[-1]['Range'] == 'bytes=%d-' % part
+    assert handler.requests[-1]['If-Range'] == handler.etag
+    with open(filename, 'rb') as f:
+        assert f.read() == handler.content
+    assert not os.path.exists(filename + '.part')
+
+
+def test_retry_with_backoff(server, tmp_path, monkeypatch):
+    import time
+
+    handler, url = server
+    delays = []
+    monkeypatch.setattr(time, 'sleep', delays.append)
+    handler.failures = 2
+    filename = str(tmp_path / 'USM00000001-drvd.txt.zip')
+    assert _fetch(url, filename, retries=3, backoff=0.5) == 'downloaded'
+    assert len(handler.requests) == 3
+    assert delays == [0.5, 1.0]
+
+    handler.failures = 5
+    with pytest.raises(Exception):
+        _fetch(url, str(tmp_path / 'other.zip'), retries=1, backoff=0.5)
+    assert not os.path.exists(str(tmp_path / 'other.zip'))
+
+
+def test_download_stations(server, tmp_path):
+    handler, url = server
+    results = download_igra.download_stations(['USM00000001'], str(tmp_path), server=url.rsplit('/', 1)[0],
+                                              verbose=0, retries=0)
+    assert list(results.values()) == ['downloaded']
+    results = download_igra.download_stations(['USM00000001'], str(tmp_path), server=url.rsplit('/', 1)[0],
+                                              update=False)
+    assert list(results.values()) == ['exists']
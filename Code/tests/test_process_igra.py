@@ -0,0 +1,84 @@
+import pandas as pd
+import pytest
+
+from benchmark_igra import write_synthetic_derived
+from process_igra import ascii_to_dataframe, iter_chunks
+
+
+@pytest.fixture(scope='module')
+def derived(tmp_path_factory):
+    filename = str(tmp_path_factory.mktemp('drvd') / 'USM00072764-drvd.txt.zip')
+    write_synthetic_derived(filename, years=1, levels=20)
+    return filename
+
+
+@pytest.mark.parametrize('start, end', [(None, None), ('1950-03-01', '1950-03-31'),
+                                        ('1950-06-01 12:00', '1950-06-01 12:00')])
+def test_window_matches_python_engine(derived, start, end):
+    headers, levels = ascii_to_dataframe(derived, get_levels=True, start=start, end=end)
+    ref_headers, ref_levels = ascii_to_dataframe(derived, get_levels=True, start=start, end=end, engine='python')
+    # pandas >= 3 infers microseconds from the datetimes of the line-by-line parser
+    ref_headers.index = ref_headers.index.astype('datetime64[ns]')
+    ref_levels.index = ref_levels.index.astype('datetime64[ns]')
+    # the reference parser keeps int64 where the file has no missing value, the numpy engine float64
+    assert (headers.drop(columns=['numlev', 'reltime']).dtypes == 'float64').all()
+    assert (levels.dtypes == 'float64').all()
+    # headers have numlev twice, cast by position
+    ref_headers = ref_headers.set_axis(range(ref_headers.shape[1]), axis=1) \
+        .astype(dict(enumerate(headers.dtypes))).set_axis(headers.columns, axis=1)
+    ref_levels = ref_levels.astype(levels.dtypes.to_dict())
+    pd.testing.assert_frame_equal(headers, ref_headers)
+    pd.testing.assert_frame_equal(levels, ref_levels)
+
+
+def test_chunk_dtypes_do_not_depend_on_missing_values(derived):
+    headers, levels = ascii_to_dataframe(derived, get_levels=True)
+    for chunk_headers, chunk_levels in iter_chunks(derived, chunksize=1):
+        pd.testing.assert_series_equal(chunk_headers.dtypes, headers.dtypes)
+        pd.testing.assert_series_equal(chunk_levels.dtypes, levels.dtypes)
+
+
+@pytest.fixture
+def por_station(tmp_path):
+    from benchmark_igra import write_synthetic_por
+
+    write_synthetic_por(str(tmp_path / 'USM00072764-data.txt.zip'), years=1, levels=10)
+    pd.DataFrame({'id': ['USM00072764'], 'lat': [46.78], 'lon': [-100.76], 'alt': [503], 'state': ['ND'],
+                  'name': ['BISMARCK'], 'start': [1950], 'end': [1950], 'total': [730]}
+                 ).to_csv(tmp_path / 'station_list_test.txt', index=False)
+    return str(tmp_path)
+
+
+def test_resume_after_crash_of_a_normal_run(por_station, monkeypatch):
+    import glob
+    import os
+    import store_igra
+    from process_igra import save_profiles
+
+    stations, start, end = {'Bis': 'USM00072764'}, pd.Timestamp('1950-01-01'), pd.Timestamp('1950-01-10')
+    write_profile = store_igra._write_profile
+    written = []
+
+    def crash_after(n):
+        def write(out_dir, name, id, time_str, *args):
+            if n is not None and len(written) == n:
+                raise OSError('disk full')
+            written.append(time_str)
+            write_profile(out_dir, name, id, time_str, *args)
+        return write
+
+    monkeypatch.setattr(store_igra, '_write_profile', crash_after(7))
+    with pytest.raises(OSError):
+        save_profiles(stations, por_station, start, end, verbose=0)
+
+    monkeypatch.setattr(store_igra, '_write_profile', crash_after(None))
+    save_profiles(stations, por_station, start, end, verbose=0, resume=True)
+    assert len(written) == 20 and len(set(written)) == 20
+    assert len(glob.glob(os.path.join(por_station, 'Bis', '*Z.csv'))) == 20
+
+    # nothing left to do: no outputs and no new logs
+    for log in glob.glob(os.path.join(por_station, 'ExtractedProfiles*.csv')):
+        os.remove(log)
+    save_profiles(stations, por_station, start, end, verbose=0, resume=True)
+    assert len(written) == 20
+    assert not glob.glob(os.path.join(por_station, 'ExtractedProfiles*.csv'))
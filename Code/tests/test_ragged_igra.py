@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmark_igra import write_synthetic_derived
+from process_igra import ascii_to_dataframe
+from ragged_igra import build_ragged, find_soundings, get_sounding, open_ragged, ragged_to_frames
+
+
+@pytest.fixture(scope='module')
+def store(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('ragged')
+    filename = str(directory / 'USM00072764-drvd.txt.zip')
+    write_synthetic_derived(filename, years=1, levels=15)
+    # small blocks, the store is written from several parsed blocks
+    build_ragged(filename, str(directory / 'store'), blocksize=1 << 16)
+    return filename, open_ragged(str(directory / 'store'))
+
+
+def test_store_equals_parsed_frames(store):
+    filename, opened = store
+    headers, levels = ascii_to_dataframe(filename, get_levels=True, start='1950-03-01', end='1950-04-30')
+    ragged_headers, ragged_levels = ragged_to_frames(opened, start='1950-03-01', end='1950-04-30')
+    pd.testing.assert_frame_equal(ragged_headers, headers)
+    pd.testing.assert_frame_equal(ragged_levels, levels)
+
+
+def test_find_soundings(store):
+    filename, opened = store
+    idate = opened['hdr']['idate']
+    window = find_soundings(opened, '1950-02-01', '1950-02-28 23:59')
+    assert idate[window.start] >= np.datetime64('1950-02-01')
+    assert idate[window.start - 1] < np.datetime64('1950-02-01')
+    assert idate[window.stop - 1] <= np.datetime64('1950-02-28T23:59')
+    assert idate[window.stop] > np.datetime64('1950-02-28T23:59')
+    assert find_soundings(opened) == slice(0, idate.size)
+    empty = find_soundings(opened, '1990-01-01', '1991-01-01')
+    assert empty.start == empty.stop
+
+
+def test_get_sounding(store):
+    filename, opened = store
+    time = pd.Timestamp(opened['hdr']['idate'][100])
+    header, levels = get_sounding(opened, time + pd.Timedelta('3 min'))
+    assert header['idate'] == time.to_datetime64()
+    _, frame = ascii_to_dataframe(filename, get_levels=True, start=time, end=time)
+    press = np.asarray(levels['press'], dtype=float)
+    np.testing.assert_array_equal(press, frame['press'].to_numpy())
+    with pytest.raises(KeyError):
+        get_sounding(opened, time + pd.Timedelta('3 h'))
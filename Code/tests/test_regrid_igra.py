@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from benchmark_igra import write_synthetic_derived
+from process_igra import ascii_to_dataframe
+from regrid_igra import regrid_levels
+
+
+@pytest.fixture(scope='module')
+def levels(tmp_path_factory):
+    filename = str(tmp_path_factory.mktemp('regrid') / 'USM00072764-drvd.txt.zip')
+    write_synthetic_derived(filename, years=1, levels=20)
+    _, levels = ascii_to_dataframe(filename, get_levels=True, end='1950-02-01')
+    return levels
+
+
+def _reference(levels, grid, coordinate, name):
+    """ np.interp sounding by sounding, NaN outside of the levels with the variable """
+    out = []
+    for _, sounding in levels.groupby(level=0, sort=False):
+        press = sounding['press'].to_numpy(dtype=float)
+        if coordinate == 'press':
+            x, target = -np.log(press), -np.log(grid)
+        else:
+            height = sounding['calcgph'].fillna(sounding['repgph']).to_numpy(dtype=float)
+            x, target = height - height[np.isfinite(height)][0], grid
+        v = sounding[name].to_numpy(dtype=float)
+        v = np.log(v) if name == 'press' else v
+        valid = np.isfinite(x) & np.isfinite(v)
+        x, v = x[valid], v[valid]
+        order = np.argsort(x)
+        row = np.full(grid.size, np.nan)
+        if x.size:
+            inside = (target >= x.min()) & (target <= x.max())
+            row[inside] = np.interp(target[inside], x[order], v[order])
+        out.append(np.exp(row) if name == 'press' else row)
+    return np.array(out)
+
+
+@pytest.mark.parametrize('coordinate, grid', [('press', [100000., 92500., 85000., 70000., 50000., 30000., 10000.]),
+                                              ('height', [0., 250., 1000., 3000., 8000., 16000.])])
+def test_regrid_equals_interp(levels, coordinate, grid):
+    grid = np.array(grid)
+    variables = ['press', 'temp', 'vappress', 'uwnd']
+    # small blocks, the result does not depend on the blocking
+    out = regrid_levels(levels, grid, coordinate=coordinate, variables=variables, block=7, dtype='float64')
+    assert out['values'].shape == (out['time'].size, grid.size, len(variables))
+    assert out['time'].equals(levels.index.unique())
+    for k, name in enumerate(variables):
+        np.testing.assert_allclose(out['values'][:, :, k], _reference(levels, grid, coordinate, name), rtol=1e-9)
+
+
+def test_regrid_outside_levels(levels):
+    out = regrid_levels(levels, [200000., 1.], variables=['temp'])
+    assert out['values'].dtype == np.float32
+    assert np.isnan(out['values']).all()
+
+
+def test_regrid_unknown_coordinate(levels):
+    with pytest.raises(ValueError):
+        regrid_levels(levels, [50000.], coordinate='theta')
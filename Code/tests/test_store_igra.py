@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+from benchmark_igra import write_synthetic_por
+from process_igra import por_to_dataframe
+from store_igra import export_profiles, export_stream, station_tables
+
+
+@pytest.fixture(scope='module')
+def tables(tmp_path_factory):
+    filename = str(tmp_path_factory.mktemp('store') / 'USM00072764-data.txt.zip')
+    write_synthetic_por(filename, years=1, levels=30)
+    df, headers = por_to_dataframe(filename, all_columns=True, end='1950-01-31', exclude_ltyp1=3)
+    return df, headers
+
+
+def _reference(out_dir, name, id, headers, levels, offsets):
+    """ One to_csv per table and file, the layout of save_profiles """
+    for k, (sounding, i, n) in enumerate(zip(offsets.index, offsets['first'], offsets['count'])):
+        with open(os.path.join(out_dir, id + '_' + sounding.strftime('%Y%m%d_%H') + 'Z.csv'), 'w') as f:
+            f.write(name + ',' + id + '\n')
+            headers.iloc[k, 1:].to_csv(f, header=False, index=True, lineterminator='\n')
+            levels.iloc[i:i + n].to_csv(f, header=True, index=False, lineterminator='\n')
+
+
+def _files(directory):
+    return {name: open(os.path.join(directory, name)).read() for name in sorted(os.listdir(directory))}
+
+
+def test_exports_equal_the_reference_layout(tables, tmp_path):
+    df, headers = tables
+    parts = station_tables(df, headers, headers.index)
+    for directory in ('reference', 'profiles', 'stream'):
+        (tmp_path / directory).mkdir()
+    _reference(str(tmp_path / 'reference'), 'Bismarck', 'USM00072764', *parts)
+    time_strs = export_profiles(*parts, str(tmp_path / 'profiles'), 'Bismarck', 'USM00072764', verbose=0)
+    assert len(time_strs) == len(headers)
+
+    # two blocks, small chunks
+    blocks = [station_tables(df, headers, headers.index[:25]), station_tables(df, headers, headers.index[25:])]
+    written = []
+    time_strs = export_stream(iter(blocks), str(tmp_path / 'stream'), 'Bismarck', 'USM00072764', writers=3,
+                              chunk=4, verbose=0, written=written.append)
+    assert sorted(time_strs) == sorted(written) == sorted(headers.index.strftime('%Y%m%d_%H'))
+    reference = _files(str(tmp_path / 'reference'))
+    assert _files(str(tmp_path / 'profiles')) == reference
+    assert _files(str(tmp_path / 'stream')) == reference
+
+
+def test_stream_writes_a_time_once(tables, tmp_path):
+    df, headers = tables
+    # the same soundings in one block and again in the next block
+    soundings = headers.index[:10].append(headers.index[:3]).sort_values()
+    blocks = [station_tables(df, headers, soundings), station_tables(df, headers, headers.index[:5])]
+    time_strs = export_stream(iter(blocks), str(tmp_path), 'Bismarck', 'USM00072764', chunk=2, verbose=0)
+    assert sorted(time_strs) == sorted(headers.index[:10].strftime('%Y%m%d_%H'))
+
+
+def test_stream_stops_on_a_failed_writer(tables, tmp_path):
+    df, headers = tables
+    produced = []
+
+    def blocks():
+        for k in range(0, 60, 10):
+            produced.append(k)
+            yield station_tables(df, headers, headers.index[k:k + 10])
+
+    with pytest.raises(OSError):
+        export_stream(blocks(), str(tmp_path / 'missing'), 'Bismarck', 'USM00072764', verbose=0)
+    assert len(produced) < 6
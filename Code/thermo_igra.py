@@ -0,0 +1,364 @@
+__all__ = ['pad_levels', 'derived_parameters', 'fill_derived']
+
+# Vectorized thermodynamics of IGRA soundings
+#
+# Derived parameters (precipitable water, LCL, LFC, LNB, mixed layer height,
+# CAPE/CIN, lifted index) computed from the levels of
+# process_igra.ascii_to_dataframe(get_levels=True) instead of read from the
+# derived headers. The levels of a block of soundings are padded into
+# (sounding, level) arrays and every step is one NumPy operation over the
+# block: the moist adiabat is solved by Newton iterations on the conserved
+# equivalent potential temperature (Bolton 1980), level crossings are found
+# with argmax over masks and interpolated linearly in ln(p).
+
+# gas constant of dry air (J/kg/K), specific heat (J/kg/K), gravity (m/s2), Rd/Rv
+RD, CP, G, EPS = 287.04, 1005.7, 9.80665, 0.622
+KAPPA = RD / CP
+
+# level columns used, scale of the file values to Pa, m, K, hPa
+_THERMO_SCALE = {'press': 1, 'calcgph': 1, 'repgph': 1, 'temp': 10, 'vappress': 1000}
+
+# computed parameters, named as the header columns of ascii_to_dataframe
+_PARAMETERS = ['pw_mm', 'mixpress', 'mixhgt', 'lclpress', 'lclhgt', 'lfcpress', 'lfchgt', 'lnbp', 'lnbhgt',
+               'li', 'cape', 'cin']
+
+# top of the precipitable water layer (Pa), pw of the derived headers is surface to 500 hPa
+_PW_TOP = 50000.
+
+_NEWTON_STEPS = 8
+
+# ln(p) of a level and a pressure interpolated to it may differ by rounding
+_LNP_TOLERANCE = 1e-9
+
+
+def pad_levels(levels, columns=None, max_levels=None):
+    """ Pad the ragged levels of soundings into (sounding, level) arrays
+    Args:
+        levels (DataFrame): levels of process_igra.ascii_to_dataframe(get_levels=True)
+        columns (list): level columns (default all)
+        max_levels (int): levels kept per sounding (default most levels of a sounding)
+    Returns:
+        dict : 'time' -> sounding times, 'count' -> levels per sounding, column -> float64 (sounding, level)
+               array padded with NaN
+    """
+    import numpy as np
+    import pandas as pd
+
+    start, count = _soundings(levels)
+    if max_levels is None:
+        max_levels = int(count.max()) if count.size else 0
+    padded = _pad({name: _column(levels, name) for name in (columns or levels.columns)}, start, count, max_levels)
+    padded['time'] = pd.DatetimeIndex(levels.index.values[start], name='idate')
+    padded['count'] = np.minimum(count, max_levels) if count.size else count
+    return padded
+
+
+def derived_parameters(levels, parcel='surface', depth=5000., virtual=True, mix_excess=0., li_press=50000.,
+                       block=4096):
+    """ Derived parameters of every sounding computed from its levels
+    Args:
+        levels (DataFrame): levels of process_igra.ascii_to_dataframe(get_levels=True)
+        parcel (str): 'surface' lifts the lowest level, 'mixed' the mean potential temperature and mixing
+                      ratio of the levels within depth of the surface
+        depth (float): depth (Pa) of the mixed parcel layer
+        virtual (bool): buoyancy and mixed layer from virtual temperatures
+        mix_excess (float): mixed layer top where the (virtual) potential temperature exceeds the surface value
+                            by this (K)
+        li_press (float): pressure (Pa) of the lifted index
+        block (int): soundings computed at once, bounds the temporary arrays
+    Returns:
+        DataFrame : pw_mm (surface to 500 hPa), pressures (Pa) and heights above the surface (m) of the mixed layer top, LCL, LFC
+                    and LNB, li (K), cape and cin (J/kg) by sounding time; NaN where a parameter is not
+                    defined, cape and cin are 0 without a LFC
+    """
+    import numpy as np
+    import pandas as pd
+
+    start, count = _soundings(levels)
+    columns = {name: _column(levels, name) / scale for name, scale in _THERMO_SCALE.items()}
+    parts = []
+    for i in range(0, start.size, block):
+        nlevel = int(count[i:i + block].max())
+        padded = _pad(columns, start[i:i + block], count[i:i + block], nlevel)
+        parts.append(_block_parameters(padded, parcel, depth, virtual, mix_excess, li_press))
+    values = {name: np.concatenate([part[name] for part in parts]) if parts else np.zeros(0)
+              for name in _PARAMETERS}
+    return pd.DataFrame(values, index=pd.DatetimeIndex(levels.index.values[start], name='idate'))
+
+
+def fill_derived(headers, levels, **kwargs):
+    """ Fill the missing derived parameters of the headers with parameters computed from the levels
+    Args:
+        headers (DataFrame): headers of process_igra.ascii_to_dataframe
+        levels (DataFrame): levels of process_igra.ascii_to_dataframe(get_levels=True)
+        **kwargs: parcel assumptions of derived_parameters
+    Returns:
+        DataFrame : copy of headers, NaN of the computed columns filled
+    """
+    import numpy as np
+
+    computed = derived_parameters(levels, **kwargs)
+    # duplicated sounding times: the first sounding wins
+    computed = computed[~computed.index.duplicated()].reindex(headers.index)
+    filled = headers.copy()
+    for name in computed.columns:
+        if name not in filled or filled[name].dtype.kind != 'f':
+            continue
+        values = filled[name].values
+        filled[name] = np.where(np.isnan(values), computed[name].values, values).astype(values.dtype)
+    return filled
+
+
+def _soundings(levels):
+    """ First row and number of levels of every sounding (runs of equal times) of the levels """
+    import numpy as np
+
+    date = levels.index.values
+    if not date.size:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    start = np.flatnonzero(np.concatenate([[True], date[1:] != date[:-1]]))
+    return start, np.diff(np.append(start, date.size))
+
+
+def _column(levels, name):
+    import numpy as np
+
+    return levels[name].to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def _pad(columns, start, count, nlevel):
+    """ (sounding, level) arrays of the soundings at start (first row) with count levels """
+    import numpy as np
+
+    level = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+    rows = np.repeat(start, count) + level
+    keep = level < nlevel
+    sounding = np.repeat(np.arange(start.size), count)[keep]
+    padded = {}
+    for name, values in columns.items():
+        out = np.full((start.size, nlevel), np.nan)
+        out[sounding, level[keep]] = values[rows[keep]]
+        padded[name] = out
+    return padded
+
+
+def _block_parameters(padded, parcel, depth, virtual, mix_excess, li_press):
+    """ Parameters of a block of padded soundings (units of _THERMO_SCALE) """
+    import numpy as np
+
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        height = np.where(np.isfinite(padded['calcgph']), padded['calcgph'], padded['repgph'])
+        p, z, t, e = _compact(np.isfinite(padded['temp']) & np.isfinite(height), padded['press'], height,
+                              padded['temp'], padded['vappress'])
+        lnp = np.log(p)
+        z = z - z[:, :1]
+        out = {'pw_mm': _precipitable_water(p, e)}
+
+        r = _mixing_ratio(e, p)
+        tv = _virtual(t, r) if virtual else t
+        out['mixpress'], out['mixhgt'] = _mixed_layer(p, lnp, z, tv, mix_excess)
+
+        # parcel start: pressure, temperature and mixing ratio
+        p0, t0, r0 = p[:, 0], t[:, 0], r[:, 0]
+        if parcel == 'mixed':
+            layer = p >= (p0 - depth)[:, None]
+            t0 = _layer_mean(layer, t * (p0[:, None] / p) ** KAPPA)
+            r0 = _layer_mean(layer & np.isfinite(r), r)
+        elif parcel != 'surface':
+            raise ValueError("Unknown parcel: %s" % parcel)
+
+        # lifting condensation level (Bolton 1980, eq. 15)
+        td = np.minimum(_dewpoint(r0 * p0 / 100 / (EPS + r0)), t0)
+        tlcl = 1 / (1 / (td - 56) + np.log(t0 / td) / 800) + 56
+        plcl = p0 * (tlcl / t0) ** (1 / KAPPA)
+        out['lclpress'], out['lclhgt'] = plcl, _at_pressure(plcl, p, lnp, z)
+
+        # parcel temperature and mixing ratio: dry adiabat below, moist adiabat above the LCL
+        dry = p >= plcl[:, None]
+        tparcel = np.where(dry, t0[:, None] * (p / p0[:, None]) ** KAPPA,
+                           _moist_adiabat(_thetae(t0, p0, r0, tlcl), p, tlcl[:, None] * (p / plcl[:, None]) ** KAPPA))
+        rparcel = np.where(dry, r0[:, None], _mixing_ratio(_saturation(tparcel), p))
+        buoyancy = (_virtual(tparcel, rparcel) if virtual else tparcel) - tv
+
+        out['lfcpress'], out['lnbp'], out['cape'], out['cin'] = _convection(p, lnp, buoyancy, plcl)
+        out['lfchgt'], out['lnbhgt'] = _at_pressure(out['lfcpress'], p, lnp, z), _at_pressure(out['lnbp'], p, lnp, z)
+
+        target = np.full(p.shape[0], li_press)
+        out['li'] = _at_pressure(target, p, lnp, t) - _at_pressure(target, p, lnp, tparcel)
+
+        undefined = ~np.isfinite(t0 + r0)
+        for name in _PARAMETERS[3:]:
+            out[name][undefined] = np.nan
+    return out
+
+
+def _compact(valid, p, *columns):
+    """ Valid levels first, sorted from the surface up (decreasing pressure), NaN after them """
+    import numpy as np
+
+    valid = valid & np.isfinite(p) & (p > 0)
+    order = np.argsort(np.where(valid, -p, np.inf), axis=1, kind='stable')
+    valid = np.take_along_axis(valid, order, axis=1)
+    return [np.where(valid, np.take_along_axis(values, order, axis=1), np.nan) for values in (p,) + columns]
+
+
+def _take(values, index):
+    import numpy as np
+
+    return np.take_along_axis(values, index[:, None], axis=1)[:, 0]
+
+
+def _at_pressure(target, p, lnp, values):
+    """ values interpolated linearly in ln(p) to the target pressure of every sounding, NaN outside """
+    import numpy as np
+
+    # levels at or below the target (up to rounding), the sounding is sorted by decreasing pressure
+    lnt = np.log(target)
+    k = np.sum(lnp >= lnt[:, None] - _LNP_TOLERANCE, axis=1)
+    lo, hi = np.clip(k - 1, 0, p.shape[1] - 1), np.clip(k, 0, p.shape[1] - 1)
+    lnp_lo, lnp_hi = _take(lnp, lo), _take(lnp, hi)
+    lower = _take(values, lo)
+    out = lower + (lnp_lo - lnt) / (lnp_lo - lnp_hi) * (_take(values, hi) - lower)
+    out = np.where(np.abs(lnp_lo - lnt) <= _LNP_TOLERANCE, lower, out)
+    out[(k == 0) | ~np.isfinite(target)] = np.nan
+    return out
+
+
+def _layer_mean(layer, values):
+    """ Mean of the values of the levels in the layer, NaN if there are none """
+    import numpy as np
+
+    return np.sum(np.where(layer, values, 0), axis=1) / np.sum(layer, axis=1)
+
+
+def _first(mask):
+    """ Index of the first True of every row and whether there is one """
+    return mask.argmax(axis=1), mask.any(axis=1)
+
+
+def _crossing(lnp0, d0, lnp1, d1):
+    """ Pressure where d changes sign between two levels """
+    import numpy as np
+
+    return np.exp(lnp0 + d0 / (d0 - d1) * (lnp1 - lnp0))
+
+
+def _precipitable_water(p, e, top=_PW_TOP):
+    """ Precipitable water (mm) from the surface to top (Pa), trapezoid rule in pressure over the levels with
+    humidity and the humidity interpolated to top, NaN if the humidity does not reach top
+    """
+    import numpy as np
+
+    p, e = _compact(np.isfinite(e), p, e)
+    target = np.full(p.shape[0], top)
+    e_top = _at_pressure(target, p, np.log(p), e)
+    below = p > top
+    p, e = np.where(below, p, np.nan), np.where(below, e, np.nan)
+    q = EPS * e / (p / 100 - (1 - EPS) * e)
+    layer = 0.5 * (q[:, 1:] + q[:, :-1]) * (p[:, :-1] - p[:, 1:])
+
+    # from the highest level below top to top
+    last = np.maximum(below.sum(axis=1) - 1, 0)
+    q_top = EPS * e_top / (top / 100 - (1 - EPS) * e_top)
+    upper = 0.5 * (_take(q, last) + q_top) * (_take(p, last) - top)
+    return (np.nansum(layer, axis=1) + upper) / G
+
+
+def _mixed_layer(p, lnp, z, tv, excess):
+    """ Pressure and height of the first level crossing where the potential temperature exceeds the surface """
+    import numpy as np
+
+    theta = tv * (100000. / p) ** KAPPA
+    d = theta[:, 0:1] + excess - theta
+    k, found = _first(d < 0)
+    k = np.maximum(k, 1)
+    press = _crossing(_take(lnp, k - 1), _take(d, k - 1), _take(lnp, k), _take(d, k))
+    press[~found] = np.nan
+    return press, _at_pressure(press, p, lnp, z)
+
+
+def _convection(p, lnp, d, plcl):
+    """ LFC, LNB (Pa), CAPE and CIN (J/kg) of the buoyancy d (K, parcel minus environment) """
+    import numpy as np
+
+    n = np.arange(p.shape[0])
+    dlcl = _at_pressure(plcl, p, lnp, d)
+
+    # level of free convection: lowest positive buoyancy above the LCL, the LCL if buoyant there
+    k, found = _first((p < plcl[:, None]) & (d > 0))
+    k = np.maximum(k, 1)
+    below_lcl = p[n, k - 1] >= plcl
+    lnp0 = np.where(below_lcl, np.log(plcl), lnp[n, k - 1])
+    d0 = np.where(below_lcl, dlcl, d[n, k - 1])
+    lfc = np.where(dlcl > 0, plcl, np.where(found, _crossing(lnp0, d0, lnp[n, k], d[n, k]), np.nan))
+
+    # level of neutral buoyancy: top of the highest positive layer above the LFC, NaN if buoyant at the top
+    buoyant = (d > 0) & (p <= lfc[:, None])
+    j = p.shape[1] - 1 - buoyant[:, ::-1].argmax(axis=1)
+    above = np.minimum(j + 1, p.shape[1] - 1)
+    lnb = np.where(buoyant.any(axis=1) & (j + 1 < p.shape[1]) & (d[n, above] <= 0),
+                   _crossing(lnp[n, j], d[n, j], lnp[n, above], d[n, above]), np.nan)
+
+    # positive and negative areas of every layer, linear in ln(p)
+    a, b, x = d[:, :-1], d[:, 1:], lnp[:, :-1] - lnp[:, 1:]
+    pos = np.where((a >= 0) & (b >= 0), 0.5 * (a + b), np.where(a * b < 0, 0.5 * np.maximum(a, b) ** 2 / np.abs(a - b), 0))
+    neg = np.where((a <= 0) & (b <= 0), -0.5 * (a + b), np.where(a * b < 0, 0.5 * np.minimum(a, b) ** 2 / np.abs(a - b), 0))
+    pos, neg = np.nan_to_num(pos * x), np.nan_to_num(neg * x)
+    bottom, top = p[:, :-1], p[:, 1:]
+    cape_layer = (top < lfc[:, None]) & ((bottom > lnb[:, None]) | np.isnan(lnb)[:, None])
+    cape = RD * np.sum(pos * cape_layer, axis=1)
+    cin = -RD * np.sum(neg * (bottom > lfc[:, None]), axis=1)
+    return lfc, lnb, cape, cin
+
+
+def _saturation(t):
+    """ Saturation vapor pressure (hPa) over water (Bolton 1980) """
+    import numpy as np
+
+    return 6.112 * np.exp(17.67 * (t - 273.15) / (t - 29.65))
+
+
+def _dewpoint(e):
+    """ Dew point (K) of the vapor pressure (hPa) """
+    import numpy as np
+
+    x = np.log(e / 6.112)
+    return 243.5 * x / (17.67 - x) + 273.15
+
+
+def _mixing_ratio(e, p):
+    """ Mixing ratio (kg/kg) of the vapor pressure (hPa) at pressure p (Pa) """
+    import numpy as np
+
+    return EPS * e / np.maximum(p / 100 - e, 1e-3 * p / 100)
+
+
+def _virtual(t, r):
+    """ Virtual temperature, the temperature where the mixing ratio is missing """
+    import numpy as np
+
+    return np.where(np.isfinite(r), t * (1 + r / EPS) / (1 + r), t)
+
+
+def _thetae(t, p, r, tlcl):
+    """ Equivalent potential temperature (Bolton 1980, eq. 43) """
+    import numpy as np
+
+    rg = 1000 * r
+    return t * (100000. / p) ** (KAPPA * (1 - 0.28e-3 * rg)) * np.exp((3.376 / tlcl - 0.00254) * rg * (1 + 0.81e-3 * rg))
+
+
+def _moist_adiabat(thetae, p, guess):
+    """ Temperature of the saturated parcel with the equivalent potential temperature of every sounding """
+    import numpy as np
+
+    def log_thetae(t):
+        return np.log(_thetae(t, p, _mixing_ratio(_saturation(t), p), t))
+
+    target = np.log(thetae)[:, None]
+    t = guess
+    for _ in range(_NEWTON_STEPS):
+        f = log_thetae(t)
+        slope = (log_thetae(t + 0.01) - f) / 0.01
+        t = t - np.clip((f - target) / slope, -20, 20)
+    return t
@@ -0,0 +1,201 @@
+__all__ = ['instrument', 'stage', 'summary']
+
+# Stage-level instrumentation of the IGRA pipeline
+#
+# The pipeline wraps its stages (download, decompress, parse_header,
+# parse_levels, missing, extract, queue, write, climatology) in stage(name), the
+# writer threads of store_igra.export_stream record their own write stages and
+# queue is the producer handing soundings to them. Without an active
+# instrument() block stage() returns a shared no-op context manager, so the
+# cost when turned off is one global lookup per stage call.
+#
+#     with instrument(json_file='timing.json', profile=True) as recorder:
+#         save_derived(...)
+#     print(summary(recorder))
+
+_RECORDER = None
+
+
+class _NoStage:
+    """ Context manager of stage() when instrumentation is off """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add(self, **counts):
+        pass
+
+    def discard(self):
+        pass
+
+
+_NO_STAGE = _NoStage()
+
+
+class _Stage:
+    """ Context manager of one timed stage, counts (bytes, rows, ...) can be added while it runs,
+    a discarded stage is not recorded. With trace_memory the peak of the traced memory is reset when a
+    stage starts, the peak reached before is kept by the stages it is nested in
+    """
+
+    def __init__(self, recorder, name, counts):
+        self.recorder, self.name, self.counts = recorder, name, counts
+        self.discarded = False
+
+    def __enter__(self):
+        import time
+
+        if self.recorder['trace_memory']:
+            import tracemalloc
+            stack = self.recorder.setdefault('stack', [])
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            self.peak = tracemalloc.get_traced_memory()[0]
+            stack.append(self)
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        import time
+
+        seconds = time.perf_counter() - self.t0
+        if self.recorder['trace_memory']:
+            import tracemalloc
+            stack = self.recorder['stack']
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            stack.remove(self)
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, self.peak)
+        if self.discarded:
+            return False
+        record = {'stage': self.name, 'seconds': seconds}
+        if self.recorder['trace_memory']:
+            record['peak_mb'] = self.peak / 1e6
+        record.update(self.counts)
+        self.recorder['records'].append(record)
+        if self.recorder['logger'] is not None:
+            import json
+            self.recorder['logger'].debug(json.dumps(record))
+        return False
+
+    def add(self, **counts):
+        for key, value in counts.items():
+            self.counts[key] = self.counts.get(key, 0) + value
+
+    def discard(self):
+        self.discarded = True
+
+
+def stage(name, **counts):
+    """ Time a stage of the pipeline if instrumentation is on
+    Args:
+        name (str): stage name
+        **counts: numbers recorded with the stage (bytes, rows, ...), more can be added with .add()
+    Returns:
+        context manager, .discard() drops the record (e.g. nothing was done)
+    """
+    if _RECORDER is None:
+        return _NO_STAGE
+    return _Stage(_RECORDER, name, counts)
+
+
+def instrument(json_file=None, logger=None, profile=False, trace_memory=False):
+    """ Record the stages of the pipeline run inside the with block
+    Args:
+        json_file (str): write all stage records and the summary to this file
+        logger (str or logging.Logger): log every stage record (DEBUG) and the summary (INFO) as JSON
+        profile (bool or str): run the block under cProfile, a str is the file to dump the stats to
+        trace_memory (bool): record the peak traced memory (tracemalloc) of every stage, slow
+    Returns:
+        context manager yielding the recorder dict ('records': list of stage records, 'profile': pstats.Stats)
+    """
+    import contextlib
+
+    @contextlib.contextmanager
+    def recording():
+        global _RECORDER
+        import json
+        import logging
+
+        log = logging.getLogger(logger) if isinstance(logger, str) else logger
+        recorder = {'records': [], 'logger': log, 'trace_memory': trace_memory, 'profile': None}
+        previous, _RECORDER = _RECORDER, recorder
+        profiler = None
+        if profile:
+            import cProfile
+            profiler = cProfile.Profile()
+        if trace_memory:
+            import tracemalloc
+            tracemalloc.start()
+        try:
+            if profiler is not None:
+                profiler.enable()
+            yield recorder
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                import pstats
+                recorder['profile'] = pstats.Stats(profiler)
+                if isinstance(profile, str):
+                    recorder['profile'].dump_stats(profile)
+            if trace_memory:
+                import tracemalloc
+                tracemalloc.stop()
+            _RECORDER = previous
+
+            totals = summary(recorder)
+            if log is not None:
+                log.info(json.dumps(totals))
+            if json_file is not None:
+                with open(json_file, 'w') as f:
+                    json.dump({'summary': totals, 'records': recorder['records']}, f, indent=1)
+
+    return recording()
+
+
+def summary(recorder):
+    """ Totals per stage: calls, seconds and the sum of every count, in order of first appearance
+    Args:
+        recorder (dict): recorder of instrument()
+    Returns:
+        dict : stage -> totals
+    """
+    totals = {}
+    for record in recorder['records']:
+        total = totals.setdefault(record['stage'], {'calls': 0})
+        total['calls'] += 1
+        for key, value in record.items():
+            if key == 'stage' or not isinstance(value, (int, float)):
+                continue
+            if key == 'peak_mb':
+                total[key] = max(total.get(key, 0), value)
+            else:
+                total[key] = total.get(key, 0) + value
+    return totals
+
+
+def _active():
+    """ True if instrumentation is on """
+    return _RECORDER is not None
+
+
+def _call(func, args):
+    """ func(*args) in a worker process with its stages recorded: (result, stage records) """
+    global _RECORDER
+
+    previous = _RECORDER
+    _RECORDER = {'records': [], 'logger': None, 'trace_memory': False, 'profile': None}
+    try:
+        return func(*args), _RECORDER['records']
+    finally:
+        _RECORDER = previous
+
+
+def _merge(records):
+    """ Add the stage records of a worker process to the active recorder """
+    if _RECORDER is not None:
+        _RECORDER['records'].extend(records)